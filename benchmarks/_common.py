@@ -0,0 +1,67 @@
+"""
+Helpers shared by the benchmark scripts.
+
+Benchmarks are run as modules from the root of the repository, e.g.:
+    python -m benchmarks.render_backends
+"""
+import math
+import pathlib
+import time
+from typing import Callable, List, Tuple
+
+import numpy as np
+
+from image_labelling_tool import labelling_tool
+
+
+EXAMPLE_IMAGES_DIR = pathlib.Path(__file__).parent.parent / 'images'
+
+
+def time_fn(fn: Callable[[], object], repeats: int = 3) -> float:
+    """
+    Time a function, taking the best of `repeats` runs.
+
+    :param fn: function to time
+    :param repeats: number of runs
+    :return: the best time in seconds
+    """
+    best = math.inf
+    for _ in range(repeats):
+        t1 = time.perf_counter()
+        fn()
+        t2 = time.perf_counter()
+        best = min(best, t2 - t1)
+    return best
+
+
+def synthetic_polygon_labels(n_labels: int, image_size: Tuple[int, int], n_vertices: int = 64,
+                             radius: float = 40.0, n_classes: int = 3,
+                             seed: int = 12345) -> labelling_tool.ImageLabels:
+    """
+    Generate polygonal labels with a star-like outline scattered over an image.
+
+    :param n_labels: number of labels
+    :param image_size: image size as a `(height, width)` tuple
+    :param n_vertices: number of vertices per polygon
+    :param radius: approximate polygon radius in pixels
+    :param n_classes: number of classes, named `'cls_0'`, `'cls_1'`, etc.
+    :param seed: random seed
+    :return: an `ImageLabels` instance
+    """
+    rng = np.random.default_rng(seed)
+    height, width = image_size
+    thetas = np.linspace(0.0, 2.0 * math.pi, n_vertices + 1)[:-1]
+    labels = []
+    for i in range(n_labels):
+        centre = rng.uniform([0.0, 0.0], [width, height])
+        radii = radius * rng.uniform(0.5, 1.0, size=(n_vertices,))
+        region = centre[None, :] + radii[:, None] * np.stack([np.cos(thetas), np.sin(thetas)], axis=1)
+        labels.append(labelling_tool.PolygonLabel([region], classification='cls_{}'.format(i % n_classes)))
+    return labelling_tool.ImageLabels(labels)
+
+
+def example_label_files() -> List[pathlib.Path]:
+    """
+    :return: paths of the example label files in the `images` directory
+    """
+    return sorted(EXAMPLE_IMAGES_DIR.glob('*__labels.json'))
@@ -0,0 +1,55 @@
+"""
+Compare the speed of `ImageLabels.from_label_image`, which locates all labels in a single pass, with the
+previous implementation that scanned the whole image once per label.
+
+Run from the root of the repository:
+    python -m benchmarks.from_label_image
+"""
+import numpy as np
+from skimage.measure import find_contours
+from image_labelling_tool import labelling_tool
+from benchmarks._common import time_fn, synthetic_polygon_labels
+
+
+def from_label_image_per_label_scan(labels: np.ndarray) -> labelling_tool.ImageLabels:
+    # The previous implementation: compare the whole image against each label index in turn
+    contours = []
+    n_labels = labels.max()
+    for i in range(1, n_labels + 1):
+        lmask = labels == i
+        if lmask.sum() > 0:
+            mask_positions = np.argwhere(lmask)
+            (ystart, xstart), (ystop, xstop) = mask_positions.min(0), mask_positions.max(0) + 1
+            if ystop >= ystart + 1 and xstop >= xstart + 1:
+                mask_trim = lmask[ystart:ystop, xstart:xstop]
+                mask_trim = np.pad(mask_trim, [(1, 1), (1, 1)], mode='constant').astype(np.float32)
+                regions = []
+                for contour in find_contours(mask_trim, 0.5):
+                    simp = labelling_tool._simplify_contour(
+                        contour + np.array((ystart, xstart)) - np.array([[1.0, 1.0]]))
+                    if simp is not None:
+                        regions.append(simp)
+                contours.append(regions)
+    return labelling_tool.ImageLabels.from_contours(contours)
+
+
+def main():
+    for n_labels, image_size in [(200, (1080, 1920)), (1000, (2160, 3840))]:
+        image_labels = synthetic_polygon_labels(n_labels, image_size, radius=20.0)
+        label_image, _ = image_labels.render_label_instances(['cls_0', 'cls_1', 'cls_2'], image_size)
+        label_image = label_image.astype(np.int32)
+
+        new_labels = labelling_tool.ImageLabels.from_label_image(label_image)
+        old_labels = from_label_image_per_label_scan(label_image)
+        assert len(new_labels) == len(old_labels)
+        for new_lab, old_lab in zip(new_labels, old_labels):
+            assert all((a == b).all() for a, b in zip(new_lab.regions, old_lab.regions))
+
+        t_old = time_fn(lambda: from_label_image_per_label_scan(label_image), repeats=1)
+        t_new = time_fn(lambda: labelling_tool.ImageLabels.from_label_image(label_image), repeats=1)
+        print('{} labels, {}x{}: per-label scan {:.3f}s, single pass {:.3f}s, speed-up {:.1f}x'.format(
+            n_labels, image_size[1], image_size[0], t_old, t_new, t_old / t_new))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+"""
+Time `ImageLabels.from_mask_images_cv` on instance masks such as those produced by Mask R-CNN, serially and
+using a thread pool, with masks given as full size arrays, packed bits and COCO RLE.
+
+Run from the root of the repository:
+    python -m benchmarks.from_mask_images
+"""
+import numpy as np
+from image_labelling_tool import labelling_tool, mask_rle
+from benchmarks._common import time_fn, synthetic_polygon_labels
+
+
+def main():
+    if labelling_tool.cv2 is None:
+        print('OpenCV is not available')
+        return
+
+    image_shape = (1080, 1920)
+    image_labels = synthetic_polygon_labels(300, image_shape, radius=60.0)
+    rles, _ = image_labels.render_label_instances_rle(['cls_0', 'cls_1', 'cls_2'], image_shape)
+    masks = [mask for mask in rles]
+    packed = [np.packbits(mask, axis=1) for mask in masks]
+    print('{} masks of {}x{}: dense {:.1f}MB, packed {:.1f}MB'.format(
+        len(masks), image_shape[1], image_shape[0], sum(m.nbytes for m in masks) * 1.0e-6,
+        sum(p.nbytes for p in packed) * 1.0e-6))
+
+    for n_threads in [0, None]:
+        t_dense = time_fn(lambda: labelling_tool.ImageLabels.from_mask_images_cv(masks, n_threads=n_threads))
+        t_packed = time_fn(lambda: labelling_tool.ImageLabels.from_mask_images_cv(
+            packed, n_threads=n_threads, packed_mask_width=image_shape[1]))
+        t_rle = time_fn(lambda: labelling_tool.ImageLabels.from_mask_images_cv(rles.rles, n_threads=n_threads))
+        print('n_threads={}: dense {:.3f}s, packed {:.3f}s, RLE {:.3f}s'.format(
+            n_threads, t_dense, t_packed, t_rle))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+"""
+Compare the speed of serialising and parsing label JSON using the standard library `json` module and
+`image_labelling_tool.json_codec`, which uses orjson when it is installed.
+
+Run from the root of the repository:
+    python -m benchmarks.json_codec
+"""
+import json
+from image_labelling_tool import labelling_tool, json_codec
+from benchmarks._common import time_fn, synthetic_polygon_labels, example_label_files
+
+
+def _bench(name, image_labels):
+    labels_js = image_labels.to_json()
+    text = json.dumps(labels_js)
+    t_dump_std = time_fn(lambda: json.dumps(image_labels.to_json()))
+    t_dump_codec = time_fn(lambda: json_codec.dumps_bytes(image_labels))
+    t_load_std = time_fn(lambda: labelling_tool.ImageLabels.from_json(json.loads(text)))
+    t_load_codec = time_fn(lambda: labelling_tool.ImageLabels.from_json(json_codec.loads(text)))
+    print('{}: {:.1f}MB; serialise: json {:.3f}s, codec {:.3f}s ({:.1f}x); '
+          'parse: json {:.3f}s, codec {:.3f}s ({:.1f}x)'.format(
+        name, len(text) * 1.0e-6, t_dump_std, t_dump_codec, t_dump_std / t_dump_codec,
+        t_load_std, t_load_codec, t_load_std / t_load_codec))
+
+
+def main():
+    print('Using {}'.format('orjson' if json_codec.orjson is not None else 'the standard library json module'))
+    for path in example_label_files():
+        _bench(path.name, labelling_tool.ImageLabels.from_file(path))
+
+    for n_labels, n_vertices in [(2000, 64), (2000, 256)]:
+        _bench('synthetic ({} labels, {} vertices/label)'.format(n_labels, n_vertices),
+               synthetic_polygon_labels(n_labels, (4000, 4000), n_vertices=n_vertices))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""
+Compare the time and peak memory of reading a large label file with `json.load` and with
+`image_labelling_tool.labels_stream.iter_labels_json`, which reads the labels one at a time.
+
+Run from the root of the repository:
+    python -m benchmarks.labels_stream
+"""
+import json
+import pathlib
+import tempfile
+import tracemalloc
+from image_labelling_tool import labelling_tool, labels_stream
+from benchmarks._common import time_fn, synthetic_polygon_labels
+
+
+def _peak_memory(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _json_load(path):
+    with path.open('r') as f:
+        return json.load(f)
+
+
+def _stream(path):
+    for _ in labels_stream.iter_labels_json(path):
+        pass
+
+
+def main():
+    for n_labels, n_vertices in [(20000, 64), (20000, 256)]:
+        wrapped = labelling_tool.WrappedImageLabels(
+            image_filename='img.png', labels=synthetic_polygon_labels(n_labels, (4000, 4000), n_vertices=n_vertices))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = pathlib.Path(tmp_dir) / 'labels.json'
+            t_write = time_fn(lambda: wrapped.write_to_file(path), repeats=1)
+            t_load = time_fn(lambda: _json_load(path))
+            t_stream = time_fn(lambda: _stream(path))
+            print('synthetic ({} labels, {} vertices/label): {:.1f}MB; write {:.3f}s; '
+                  'json.load {:.3f}s, peak {:.1f}MB; stream {:.3f}s, peak {:.1f}MB'.format(
+                n_labels, n_vertices, path.stat().st_size * 1.0e-6, t_write,
+                t_load, _peak_memory(lambda: _json_load(path)) * 1.0e-6,
+                t_stream, _peak_memory(lambda: _stream(path)) * 1.0e-6))
+
+
+if __name__ == '__main__':
+    main()
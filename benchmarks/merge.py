@@ -0,0 +1,40 @@
+"""
+Compare the time and memory taken by `ImageLabels.merge` when sharing the geometry of the merged labels
+(the default) and when copying it (`copy=True`).
+
+Run from the root of the repository:
+    python -m benchmarks.merge
+"""
+import gc
+import tracemalloc
+from image_labelling_tool import labelling_tool
+from benchmarks._common import time_fn, synthetic_polygon_labels
+
+
+def _memory(fn):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = fn()
+        return result, tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    for n_inputs, n_labels, n_vertices in [(5, 2000, 64), (5, 2000, 256)]:
+        inputs = [synthetic_polygon_labels(n_labels, (4000, 4000), n_vertices=n_vertices, seed=i)
+                  for i in range(n_inputs)]
+        results = []
+        for copy in [True, False]:
+            t = time_fn(lambda: labelling_tool.ImageLabels.merge(*inputs, copy=copy))
+            _, mem = _memory(lambda: labelling_tool.ImageLabels.merge(*inputs, copy=copy))
+            results.append((t, mem))
+        (t_copy, mem_copy), (t_share, mem_share) = results
+        print('merge {} x {} labels, {} vertices/label: copy {:.3f}s, {:.1f}MB; share {:.3f}s, {:.1f}MB '
+              '({:.1f}x faster)'.format(n_inputs, n_labels, n_vertices, t_copy, mem_copy * 1.0e-6,
+                                        t_share, mem_share * 1.0e-6, t_copy / t_share))
+
+
+if __name__ == '__main__':
+    main()
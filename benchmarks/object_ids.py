@@ -0,0 +1,54 @@
+"""
+Measure the memory used by a large collection of labels and their object table, and the time taken to
+look up labels by object ID and to merge collections.
+
+Run from the root of the repository:
+    python -m benchmarks.object_ids
+"""
+import gc
+import json
+import tracemalloc
+import uuid
+import numpy as np
+from image_labelling_tool import labelling_tool
+from benchmarks._common import time_fn
+
+
+def _labels_json(n_labels, id_prefix):
+    rng = np.random.default_rng(12345)
+    positions = rng.uniform(0.0, 4000.0, size=(n_labels, 2))
+    return [labelling_tool.PointLabel(positions[i], object_id='{}__{}'.format(id_prefix, i + 1),
+                                      classification='cls_{}'.format(i % 3)).to_json()
+            for i in range(n_labels)]
+
+
+def _memory(fn):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = fn()
+        return result, tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    n_labels = 100000
+    labels_js = _labels_json(n_labels, str(uuid.uuid4()))
+    # Parse the JSON within the measurement so that the memory used by the object ID strings is included;
+    # the JSON is freed afterwards, as when loading labels from a file
+    text = json.dumps(labels_js)
+    image_labels, mem = _memory(lambda: labelling_tool.ImageLabels.from_json(json.loads(text)))
+    object_ids = [lab.object_id for lab in image_labels]
+    other = labelling_tool.ImageLabels.from_json(_labels_json(n_labels, str(uuid.uuid4())))
+
+    t_from_json = time_fn(lambda: labelling_tool.ImageLabels.from_json(labels_js))
+    t_lookup = time_fn(lambda: [image_labels[obj_id] for obj_id in object_ids])
+    t_merge = time_fn(lambda: labelling_tool.ImageLabels.merge(image_labels, other), repeats=1)
+    print('{} point labels: {:.1f}MB ({:.0f} bytes/label); from_json {:.3f}s; look up all IDs {:.3f}s; '
+          'merge with {} more {:.3f}s'.format(n_labels, mem * 1.0e-6, mem / n_labels, t_from_json, t_lookup,
+                                              n_labels, t_merge))
+
+
+if __name__ == '__main__':
+    main()
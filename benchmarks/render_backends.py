@@ -0,0 +1,38 @@
+"""
+Compare the speed of the PIL and OpenCV rasteriser backends when rendering label class images
+from polygon-heavy label sets.
+
+Run from the root of the repository:
+    python -m benchmarks.render_backends
+"""
+from image_labelling_tool import labelling_tool
+from benchmarks._common import time_fn, synthetic_polygon_labels, example_label_files
+
+
+def _bench(name, image_labels, image_shape, label_classes):
+    t_pil = time_fn(lambda: image_labels.render_label_classes(
+        label_classes, image_shape, backend=labelling_tool.RENDER_BACKEND_PIL))
+    t_cv = time_fn(lambda: image_labels.render_label_classes(
+        label_classes, image_shape, backend=labelling_tool.RENDER_BACKEND_OPENCV))
+    print('{}: {} labels, {}x{}: PIL {:.3f}s, OpenCV {:.3f}s, speed-up {:.1f}x'.format(
+        name, len(image_labels), image_shape[1], image_shape[0], t_pil, t_cv, t_pil / t_cv))
+
+
+def main():
+    if labelling_tool.cv2 is None:
+        print('OpenCV is not available; nothing to compare')
+        return
+
+    for path in example_label_files():
+        image_labels = labelling_tool.ImageLabels.from_file(path)
+        classes = sorted({lab.classification for lab in image_labels.labels}, key=str)
+        _bench(path.name, image_labels, (2000, 2000), classes)
+
+    for n_labels, n_vertices in [(500, 64), (2000, 64), (2000, 256)]:
+        image_labels = synthetic_polygon_labels(n_labels, (4000, 4000), n_vertices=n_vertices)
+        _bench('synthetic ({} vertices/label)'.format(n_vertices), image_labels, (4000, 4000),
+               ['cls_0', 'cls_1', 'cls_2'])
+
+
+if __name__ == '__main__':
+    main()
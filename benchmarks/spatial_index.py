@@ -0,0 +1,51 @@
+"""
+Compare finding overlapping pairs of labels by scanning all labels against using the spatial index
+provided by `ImageLabels.labels_intersecting`.
+
+Run from the root of the repository:
+    python -m benchmarks.spatial_index
+"""
+import math
+
+from benchmarks._common import time_fn, synthetic_polygon_labels
+
+
+def _overlaps_linear(image_labels):
+    boxes = [lab.bounding_box() for lab in image_labels.labels]
+    n_pairs = 0
+    for i, (lower_a, upper_a) in enumerate(boxes):
+        for lower_b, upper_b in boxes[i + 1:]:
+            if (lower_a <= upper_b).all() and (upper_a >= lower_b).all():
+                n_pairs += 1
+    return n_pairs
+
+
+def _overlaps_indexed(image_labels):
+    image_labels.invalidate_spatial_index()
+    n_pairs = 0
+    for i, lab in enumerate(image_labels.labels):
+        lower, upper = lab.bounding_box()
+        n_pairs += len(image_labels.labels_intersecting(lower, upper)) - 1
+    return n_pairs // 2
+
+
+def main():
+    for n_labels in [500, 1000, 2000]:
+        image_labels = synthetic_polygon_labels(n_labels, (8000, 8000), n_vertices=16)
+        assert _overlaps_linear(image_labels) == _overlaps_indexed(image_labels)
+        t_linear = time_fn(lambda: _overlaps_linear(image_labels), repeats=1)
+        t_indexed = time_fn(lambda: _overlaps_indexed(image_labels), repeats=1)
+        print('{} labels: linear scan {:.3f}s, spatial index {:.3f}s (including build), speed-up {:.1f}x'.format(
+            n_labels, t_linear, t_indexed, t_linear / t_indexed))
+
+    # The time per query should not grow with the number of labels when the label density is constant
+    for n_labels in [2000, 8000, 32000]:
+        size = int(8000 * math.sqrt(n_labels / 2000))
+        image_labels = synthetic_polygon_labels(n_labels, (size, size), n_vertices=16)
+        t_indexed = time_fn(lambda: _overlaps_indexed(image_labels), repeats=1)
+        print('{} labels: overlap pass with spatial index {:.3f}s, {:.1f}us per query'.format(
+            n_labels, t_indexed, t_indexed / n_labels * 1.0e6))
+
+
+if __name__ == '__main__':
+    main()
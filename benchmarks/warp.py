@@ -0,0 +1,23 @@
+"""
+Compare the speed of warping labels one at a time with warping them in a single batch, as done
+by augmentation pipelines.
+
+Run from the root of the repository:
+    python -m benchmarks.warp
+"""
+from skimage.transform import AffineTransform
+from benchmarks._common import time_fn, synthetic_polygon_labels
+
+
+def main():
+    xf = AffineTransform(scale=(1.1, 0.9), rotation=0.2, translation=(10.0, -5.0))
+    for n_labels, n_vertices in [(200, 16), (2000, 16), (2000, 64)]:
+        image_labels = synthetic_polygon_labels(n_labels, (4000, 4000), n_vertices=n_vertices)
+        t_per_label = time_fn(lambda: image_labels.warp(xf, batch=False))
+        t_batch = time_fn(lambda: image_labels.warp(xf))
+        print('{} labels, {} vertices/label: per label {:.4f}s, batch {:.4f}s, speed-up {:.1f}x'.format(
+            n_labels, n_vertices, t_per_label, t_batch, t_per_label / t_batch))
+
+
+if __name__ == '__main__':
+    main()
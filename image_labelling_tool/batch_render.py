@@ -0,0 +1,237 @@
+"""Batch rendering of ground truth label images for many labelled images.
+
+`render_batch` renders label class images (semantic segmentation ground truth) or label instance images
+(instance segmentation ground truth) for a list of `LabelledImage` instances or a directory of images,
+distributing the work over a pool of worker processes and writing the results to disk as PNG or NPZ files
+as they are rendered.
+
+Only the paths of the image and label files are sent to the worker processes; the label JSON is loaded and
+parsed in the workers, so the parent process does not need to parse or pickle any labels. Labelled images
+that are not backed by files (e.g. in-memory labels) have their label JSON sent to the workers instead.
+
+It can also be run from the command line:
+
+> python -m image_labelling_tool.batch_render --images_dir=./images --output_dir=./ground_truth
+"""
+from typing import Any, Optional, Sequence, Union, Callable, Tuple
+import concurrent.futures
+import functools
+import pathlib
+import time
+import numpy as np
+from PIL import Image
+import click
+from image_labelling_tool import labelling_tool, labelling_schema, labelled_image
+
+
+PathType = Union[pathlib.Path, str]
+
+MODE_CLASSES = 'classes'
+MODE_INSTANCES = 'instances'
+
+FORMAT_PNG = 'png'
+FORMAT_NPZ = 'npz'
+
+
+class BatchRenderStats:
+    """Throughput statistics for a batch render.
+    """
+    def __init__(self):
+        self.n_images = 0
+        self.n_labels = 0
+        self.n_pixels = 0
+        self.t_start = time.time()
+        self.elapsed = 0.0
+
+    def _update(self, n_labels: int, n_pixels: int):
+        self.n_images += 1
+        self.n_labels += n_labels
+        self.n_pixels += n_pixels
+        self.elapsed = time.time() - self.t_start
+
+    @property
+    def images_per_second(self) -> float:
+        return self.n_images / self.elapsed if self.elapsed > 0.0 else 0.0
+
+    @property
+    def megapixels_per_second(self) -> float:
+        return self.n_pixels * 1.0e-6 / self.elapsed if self.elapsed > 0.0 else 0.0
+
+    def __str__(self):
+        return 'Rendered {} images ({} labels) in {:.2f}s: {:.2f} images/s, {:.2f} Mpx/s'.format(
+            self.n_images, self.n_labels, self.elapsed, self.images_per_second, self.megapixels_per_second)
+
+
+def _label_image_for_png(label_image: np.ndarray) -> np.ndarray:
+    max_value = label_image.max() if label_image.size > 0 else 0
+    if max_value < 256:
+        return label_image.astype(np.uint8)
+    elif max_value < 65536:
+        return label_image.astype(np.uint16)
+    else:
+        raise ValueError('Cannot save label image with a maximum value of {} as a PNG; use NPZ instead'.format(
+            max_value))
+
+
+def _render_job(job: Tuple[str, Optional[str], Optional[str], Any, Optional[Tuple[int, int]]],
+                output_dir: pathlib.Path, label_classes: Any, mode: str, fmt: str, fill: bool,
+                backend: Optional[str]) -> Tuple[str, int, int]:
+    name, image_path, labels_path, labels_js, image_size = job
+
+    # Load the labels here, in the worker process
+    if labels_js is not None:
+        wrapped_labels = labelling_tool.WrappedImageLabels.from_json(labels_js)
+    elif labels_path is not None and pathlib.Path(labels_path).exists():
+        wrapped_labels = labelling_tool.WrappedImageLabels.from_file(labels_path)
+    else:
+        wrapped_labels = labelling_tool.WrappedImageLabels(labels=labelling_tool.ImageLabels([]))
+    if image_size is None:
+        # Opening the image only reads the header
+        with Image.open(image_path) as img:
+            image_size = img.size[::-1]
+    labels = wrapped_labels.labels
+
+    if mode == MODE_CLASSES:
+        label_image = labels.render_label_classes(label_classes, image_size, fill=fill, backend=backend)
+        arrays = dict(label_image=label_image)
+    elif mode == MODE_INSTANCES:
+        label_image, label_index_to_cls, object_ids = labels.render_label_instances(
+            label_classes, image_size, fill=fill, return_object_ids=True, backend=backend)
+        arrays = dict(label_image=label_image, label_index_to_cls=label_index_to_cls,
+                      object_ids=np.array([obj_id if obj_id is not None else '' for obj_id in object_ids]))
+    else:
+        raise ValueError('Unknown mode {}; should be {} or {}'.format(mode, MODE_CLASSES, MODE_INSTANCES))
+
+    if fmt == FORMAT_PNG:
+        Image.fromarray(_label_image_for_png(arrays['label_image'])).save(
+            str(output_dir / '{}__{}.png'.format(name, mode)))
+    elif fmt == FORMAT_NPZ:
+        np.savez_compressed(str(output_dir / '{}__{}.npz'.format(name, mode)), **arrays)
+    else:
+        raise ValueError('Unknown format {}; should be {} or {}'.format(fmt, FORMAT_PNG, FORMAT_NPZ))
+
+    return name, len(labels), image_size[0] * image_size[1]
+
+
+def _job_for_labelled_image(index: int, limg: labelled_image.LabelledImage):
+    image_path = limg.image_source.local_path
+    name = image_path.stem if image_path is not None else 'image_{:06d}'.format(index)
+    if isinstance(limg.labels_store, labelled_image.FileLabelsStore):
+        # The worker will load the labels from the file
+        labels_path = str(limg.labels_store.labels_path)
+        labels_js = None
+    else:
+        labels_path = None
+        labels_js = limg.labels_store.get_wrapped_labels().to_json()
+    if image_path is not None:
+        image_path = str(image_path)
+        image_size = None
+    else:
+        image_size = tuple(limg.image_source.image_size)
+    return name, image_path, labels_path, labels_js, image_size
+
+
+def render_batch(labelled_images: Union[PathType, Sequence[labelled_image.LabelledImage]],
+                 output_dir: PathType, label_classes: Any, mode: str = MODE_CLASSES, fmt: str = FORMAT_PNG,
+                 fill: bool = True, n_workers: Optional[int] = None, chunksize: int = 8,
+                 backend: Optional[str] = None, image_filename_patterns: Sequence[str] = ('*.png', '*.jpg'),
+                 labels_dir: Optional[PathType] = None,
+                 progress_fn: Optional[Callable[[str, BatchRenderStats], None]] = None) -> BatchRenderStats:
+    """Render ground truth label images for many labelled images using a pool of worker processes.
+
+    The output for an image is written to `output_dir` with a filename derived from the name of the image file
+    (or `image_<index>` for images that are not stored in files) with the suffix `__classes` or
+    `__instances` and the extension `.png` or `.npz`. PNG files contain the label image only, as 8- or 16-bit
+    greyscale. NPZ files contain the label image as `label_image` and, when rendering instances,
+    `label_index_to_cls` and `object_ids` as returned by `ImageLabels.render_label_instances`.
+
+    :param labelled_images: either a sequence of `LabelledImage` instances or the path of a directory of
+        images (and label files) to search using `LabelledImage.for_directory`
+    :param output_dir: the directory into which the rendered images will be written
+    :param label_classes: label class mapping, see `ImageLabels.render_label_classes`. Must be picklable
+        (e.g. a sequence or dictionary) if `n_workers` is not 0
+    :param mode: `MODE_CLASSES` to render label class images, `MODE_INSTANCES` to render label instance images
+    :param fmt: output file format; `FORMAT_PNG` or `FORMAT_NPZ`
+    :param fill: if True, labels will be filled, otherwise they will be outlined
+    :param n_workers: the number of worker processes, `None` to use one per CPU, 0 to render in this process
+    :param chunksize: the number of images sent to a worker process at a time
+    :param backend: [optional] rasteriser backend, see `AbstractLabel.render_mask`
+    :param image_filename_patterns: image filename patterns used if `labelled_images` is a directory
+    :param labels_dir: [optional] the labels directory used if `labelled_images` is a directory
+    :param progress_fn: [optional] a callback of the form `fn(name, stats)` invoked after each image is rendered
+    :return: a `BatchRenderStats` instance reporting throughput
+    """
+    if mode not in {MODE_CLASSES, MODE_INSTANCES}:
+        raise ValueError('Unknown mode {}; should be {} or {}'.format(mode, MODE_CLASSES, MODE_INSTANCES))
+    if fmt not in {FORMAT_PNG, FORMAT_NPZ}:
+        raise ValueError('Unknown format {}; should be {} or {}'.format(fmt, FORMAT_PNG, FORMAT_NPZ))
+    if isinstance(labelled_images, (str, pathlib.Path)):
+        labelled_images = labelled_image.LabelledImage.for_directory(
+            labelled_images, image_filename_patterns=image_filename_patterns, labels_dir=labels_dir,
+            readonly=True)
+    output_dir = pathlib.Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    jobs = [_job_for_labelled_image(i, limg) for i, limg in enumerate(labelled_images)]
+    job_fn = functools.partial(_render_job, output_dir=output_dir, label_classes=label_classes, mode=mode,
+                               fmt=fmt, fill=fill, backend=backend)
+
+    stats = BatchRenderStats()
+
+    def _consume(results):
+        for name, n_labels, n_pixels in results:
+            stats._update(n_labels, n_pixels)
+            if progress_fn is not None:
+                progress_fn(name, stats)
+
+    if n_workers == 0:
+        _consume(job_fn(job) for job in jobs)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=n_workers) as executor:
+            _consume(executor.map(job_fn, jobs, chunksize=chunksize))
+
+    return stats
+
+
+@click.command()
+@click.option('--images_dir', type=click.Path(dir_okay=True, file_okay=False, exists=True), default='./images')
+@click.option('--images_pat', type=str, default='*.png|*.jpg')
+@click.option('--labels_dir', type=click.Path(dir_okay=True, file_okay=False))
+@click.option('--output_dir', type=click.Path(dir_okay=True, file_okay=False, writable=True), required=True)
+@click.option('--classes', type=str, help='Comma separated list of label classes; if not given, the classes '
+                                          'in schema.json in the images directory will be used')
+@click.option('--mode', type=click.Choice([MODE_CLASSES, MODE_INSTANCES]), default=MODE_CLASSES)
+@click.option('--format', 'fmt', type=click.Choice([FORMAT_PNG, FORMAT_NPZ]), default=FORMAT_PNG)
+@click.option('--outline', is_flag=True, default=False, help='Render label outlines rather than filled labels')
+@click.option('--num_workers', type=int, default=None, help='Number of worker processes (default: one per CPU)')
+@click.option('--backend', type=click.Choice([labelling_tool.RENDER_BACKEND_PIL,
+                                              labelling_tool.RENDER_BACKEND_OPENCV]), default=None)
+@click.option('--progress_every', type=click.IntRange(min=0), default=100,
+              help='Report throughput every N images; 0 to disable')
+def render_app(images_dir, images_pat, labels_dir, output_dir, classes, mode, fmt, outline, num_workers,
+               backend, progress_every):
+    if classes is not None:
+        label_classes = [cls_name.strip() for cls_name in classes.split(',')]
+    else:
+        schema_path = pathlib.Path(images_dir) / 'schema.json'
+        if not schema_path.exists():
+            raise click.UsageError('No --classes given and no schema found at {}'.format(schema_path))
+        schema = labelling_schema.FileSchemaStore(schema_path, readonly=True).get_schema()
+        label_classes = [lcls.name for group in schema.label_class_groups for lcls in group.group_classes]
+    print('Rendering {} with classes {}'.format(mode, ', '.join(label_classes)))
+
+    if progress_every > 0:
+        def progress_fn(name, stats):
+            if stats.n_images % progress_every == 0:
+                print(stats)
+    else:
+        progress_fn = None
+
+    stats = render_batch(images_dir, output_dir, label_classes, mode=mode, fmt=fmt, fill=not outline,
+                         n_workers=num_workers, backend=backend, image_filename_patterns=images_pat.split('|'),
+                         labels_dir=labels_dir, progress_fn=progress_fn)
+    print(stats)
+
+
+if __name__ == '__main__':
+    render_app()
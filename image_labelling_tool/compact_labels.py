@@ -0,0 +1,228 @@
+"""Compact encoding of labels in JSON form.
+
+In the standard JSON form of labels, each polygon vertex is an object of the form `{"x": <x>, "y": <y>}`,
+taking around 40 bytes per vertex. The compact encoding moves the vertices of all polygon labels into
+a single block of little-endian floating point values, encoded as base64, optionally compressed with zlib,
+that takes around 11 bytes per vertex when stored as 32-bit floats before compression.
+
+A compact encoded label list is a dict of the form:
+
+    {
+        'compact_labels': 1,            # format version
+        'labels': [...],                # labels in JSON form, with polygon regions replaced
+        'vertex_dtype': 'float32',      # 'float32' or 'float64'
+        'compression': None,            # None or 'zlib'
+        'vertices': '<base64>'          # the vertices of all polygon regions as `[x0, y0, x1, y1, ...]`
+    }
+
+The `regions` entry of each polygon label is replaced by `region_sizes`, a list giving the number of vertices
+in each region. The vertices of the regions are stored in the vertex block in the order in which the polygon
+labels appear in a depth-first traversal of the labels (including the components of group labels).
+
+Use `is_compact` to distinguish compact encoded labels from labels in standard JSON form, which are a list,
+so that both forms can be accepted transparently.
+"""
+import base64
+import zlib
+from typing import Any, Optional, Sequence, List, Tuple
+import numpy as np
+
+
+COMPACT_LABELS_VERSION = 1
+COMPRESSION_ZLIB = 'zlib'
+
+_VERTEX_DTYPES = {
+    'float32': np.dtype('<f4'),
+    'float64': np.dtype('<f8'),
+}
+
+
+def is_compact(labels_js: Any) -> bool:
+    """Determine if labels are compact encoded.
+
+    :param labels_js: labels in JSON form or compact encoded
+    :return: True if `labels_js` is compact encoded
+    """
+    return isinstance(labels_js, dict) and 'compact_labels' in labels_js
+
+
+def _region_array(region: Any) -> np.ndarray:
+    # Convert a region in JSON form (a list of `{'x': <x>, 'y': <y>}` dicts) or as an array to a `(N, 2)` array
+    if isinstance(region, np.ndarray):
+        return region.reshape((-1, 2))
+    return np.array([[v['x'] for v in region], [v['y'] for v in region]], dtype=float).T
+
+
+def _check_compression(compression: Optional[str]):
+    if compression not in (None, COMPRESSION_ZLIB):
+        raise ValueError('compression should be None or \'{}\', not {}'.format(COMPRESSION_ZLIB, compression))
+
+
+def _encode_vertex_bytes(vertex_bytes: bytes, compression: Optional[str]) -> str:
+    if compression == COMPRESSION_ZLIB:
+        vertex_bytes = zlib.compress(vertex_bytes)
+    return base64.b64encode(vertex_bytes).decode('ascii')
+
+
+def _decode_vertex_bytes(compact_js: Any) -> bytes:
+    version = compact_js['compact_labels']
+    if version > COMPACT_LABELS_VERSION:
+        raise ValueError('Compact labels version {} is not supported; the most recent supported version '
+                         'is {}'.format(version, COMPACT_LABELS_VERSION))
+    vertex_bytes = base64.b64decode(compact_js['vertices'])
+    compression = compact_js.get('compression')
+    if compression == COMPRESSION_ZLIB:
+        vertex_bytes = zlib.decompress(vertex_bytes)
+    elif compression is not None:
+        raise ValueError('Unknown compression {}'.format(compression))
+    return vertex_bytes
+
+
+def encode(labels_js: Sequence[Any], vertex_dtype: str = 'float32', compression: Optional[str] = None) -> Any:
+    """Compact encode labels.
+
+    :param labels_js: labels in JSON form; polygon regions may also be given as `(N, 2)` arrays
+    :param vertex_dtype: 'float32' (default) or 'float64'; vertices stored as 32-bit floats are rounded
+        to the nearest representable value
+    :param compression: [optional] None or 'zlib'
+    :return: compact encoded labels as a dict
+    """
+    if vertex_dtype not in _VERTEX_DTYPES:
+        raise ValueError('vertex_dtype should be one of {}, not {}'.format(
+            list(_VERTEX_DTYPES.keys()), vertex_dtype))
+    _check_compression(compression)
+    regions = []
+
+    def encode_label(label_js):
+        if 'regions' in label_js and label_js.get('label_type') == 'polygon':
+            label_regions = [_region_array(region) for region in label_js['regions']]
+            regions.extend(label_regions)
+            label_js = {key: value for key, value in label_js.items() if key != 'regions'}
+            label_js['region_sizes'] = [len(region) for region in label_regions]
+        elif 'component_models' in label_js:
+            label_js = label_js.copy()
+            label_js['component_models'] = [encode_label(comp_js) for comp_js in label_js['component_models']]
+        return label_js
+
+    compact_labels_js = [encode_label(label_js) for label_js in labels_js]
+    if len(regions) > 0:
+        vertices = np.concatenate(regions, axis=0).astype(_VERTEX_DTYPES[vertex_dtype])
+    else:
+        vertices = np.zeros((0, 2), dtype=_VERTEX_DTYPES[vertex_dtype])
+    return {
+        'compact_labels': COMPACT_LABELS_VERSION,
+        'labels': compact_labels_js,
+        'vertex_dtype': vertex_dtype,
+        'compression': compression,
+        'vertices': _encode_vertex_bytes(vertices.tobytes(), compression),
+    }
+
+
+def decode_vertices(compact_js: Any) -> np.ndarray:
+    """Decode the vertex block of compact encoded labels.
+
+    :param compact_js: compact encoded labels
+    :return: the vertices of all polygon regions as a `(V, 2)` array of dtype float64
+    """
+    vertex_dtype = compact_js.get('vertex_dtype', 'float32')
+    if vertex_dtype not in _VERTEX_DTYPES:
+        raise ValueError('Unknown vertex_dtype {}'.format(vertex_dtype))
+    vertex_bytes = _decode_vertex_bytes(compact_js)
+    return np.frombuffer(vertex_bytes, dtype=_VERTEX_DTYPES[vertex_dtype]).astype(float).reshape((-1, 2))
+
+
+def _decode_label(label_js: Any, vertices: np.ndarray, start: int, regions_as_arrays: bool) -> Tuple[Any, int]:
+    if 'region_sizes' in label_js:
+        regions = []
+        for size in label_js['region_sizes']:
+            region = vertices[start:start + size]
+            start += size
+            if regions_as_arrays:
+                regions.append(region)
+            else:
+                regions.append([{'x': x, 'y': y} for x, y in region.tolist()])
+        label_js = {key: value for key, value in label_js.items() if key != 'region_sizes'}
+        label_js['regions'] = regions
+    elif 'component_models' in label_js:
+        label_js = label_js.copy()
+        components = []
+        for comp_js in label_js['component_models']:
+            comp_js, start = _decode_label(comp_js, vertices, start, regions_as_arrays)
+            components.append(comp_js)
+        label_js['component_models'] = components
+    return label_js, start
+
+
+def decode_label(label_js: Any, vertices: np.ndarray, start: int,
+                 regions_as_arrays: bool = False) -> Tuple[Any, int]:
+    """Decode a single label taken from the `'labels'` list of compact encoded labels.
+
+    :param label_js: a compact encoded label
+    :param vertices: the decoded vertex block, as returned by `decode_vertices`
+    :param start: the index in `vertices` of the first vertex of the label
+    :param regions_as_arrays: if True, the regions of polygon labels are given as `(N, 2)` arrays
+    :return: tuple `(decoded_label_js, end)` where `end` is the index of the vertex following the label's
+        vertices, which is the start of the next label
+    """
+    return _decode_label(label_js, vertices, start, regions_as_arrays)
+
+
+def n_label_vertices(label_js: Any) -> int:
+    """Get the number of vertices that a compact encoded label takes from the vertex block, including the
+    vertices of its components if it is a group.
+
+    :param label_js: a compact encoded label
+    :return: the number of vertices
+    """
+    if 'region_sizes' in label_js:
+        return sum(label_js['region_sizes'])
+    elif 'component_models' in label_js:
+        return sum(n_label_vertices(comp_js) for comp_js in label_js['component_models'])
+    return 0
+
+
+def decode(compact_js: Any, regions_as_arrays: bool = False) -> List[Any]:
+    """Decode compact encoded labels to labels in JSON form.
+
+    :param compact_js: compact encoded labels
+    :param regions_as_arrays: if True, the regions of polygon labels are given as `(N, 2)` arrays rather
+        than lists of `{'x': <x>, 'y': <y>}` dicts; `PolygonLabel.regions_from_json` accepts either
+    :return: labels in JSON form
+    """
+    vertices = decode_vertices(compact_js)
+    position = 0
+    labels_js = []
+    for label_js in compact_js['labels']:
+        label_js, position = _decode_label(label_js, vertices, position, regions_as_arrays)
+        labels_js.append(label_js)
+    if position != len(vertices):
+        raise ValueError('The region sizes account for {} vertices, but there are {}'.format(
+            position, len(vertices)))
+    return labels_js
+
+
+def recompress(compact_js: Any, compression: Optional[str] = None) -> Any:
+    """Change the compression of the vertex block of compact encoded labels, without decoding the labels.
+
+    :param compact_js: compact encoded labels
+    :param compression: None or 'zlib'
+    :return: compact encoded labels
+    """
+    _check_compression(compression)
+    if compact_js.get('compression') == compression:
+        return compact_js
+    recompressed = compact_js.copy()
+    recompressed['compression'] = compression
+    recompressed['vertices'] = _encode_vertex_bytes(_decode_vertex_bytes(compact_js), compression)
+    return recompressed
+
+
+def n_labels(labels_js: Any) -> int:
+    """Get the number of top-level labels, whether compact encoded or in JSON form.
+
+    :param labels_js: labels in JSON form or compact encoded
+    :return: the number of labels
+    """
+    if is_compact(labels_js):
+        return len(labels_js['labels'])
+    return len(labels_js)
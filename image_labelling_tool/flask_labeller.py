@@ -30,7 +30,8 @@ import uuid
 import os
 from PIL import Image
 import numpy as np
-from image_labelling_tool import labelling_tool, labelling_schema, labelled_image, schema_editor_messages
+from image_labelling_tool import labelling_tool, labelling_schema, labelled_image, schema_editor_messages, json_codec, \
+    compact_labels
 
 import click
 
@@ -55,13 +56,23 @@ def image_url_salt():
 
 def _register_labeller_routes(app: Flask, socketio: Any, socketio_emit: Any,
                               images_table: Mapping[str, labelled_image.LabelledImage],
-                              dextr_fn: Optional[DextrFunctionType]):
+                              dextr_fn: Optional[DextrFunctionType], dextr_simplify_tolerance: float = 0.0,
+                              use_compact_labels: bool = False):
+    def labels_json_for_client(wrapped_labels: labelling_tool.WrappedImageLabels) -> Any:
+        # The client responds to compact encoded labels by sending compact encoded labels back;
+        # `WrappedImageLabels` accepts either form
+        if use_compact_labels:
+            return compact_labels.encode(wrapped_labels.labels_json)
+        else:
+            return wrapped_labels.labels_json
+
     def apply_dextr_js(image: labelled_image.LabelledImage, dextr_points_js: Any):
         image_for_dextr = image.image_source.image_as_array_or_pil()
         dextr_points = np.array([[p['y'], p['x']] for p in dextr_points_js])
         if dextr_fn is not None:
             mask = dextr_fn(image_for_dextr, dextr_points)
-            regions = labelling_tool.PolygonLabel.mask_image_to_regions_cv(mask, sort_decreasing_area=True)
+            regions = labelling_tool.PolygonLabel.mask_image_to_regions_cv(
+                mask, sort_decreasing_area=True, simplify_tolerance=dextr_simplify_tolerance)
             regions_js = labelling_tool.PolygonLabel.regions_to_json(regions)
             return regions_js
         else:
@@ -78,7 +89,7 @@ def _register_labeller_routes(app: Flask, socketio: Any, socketio_emit: Any,
             wrapped_labels = image.labels_store.get_wrapped_labels()
 
             label_header = dict(image_id=image_id,
-                                labels=wrapped_labels.labels_json,
+                                labels=labels_json_for_client(wrapped_labels),
                                 completed_tasks=wrapped_labels.completed_tasks,
                                 timeElapsed=0.0,
                                 state='editable',
@@ -136,21 +147,21 @@ def _register_labeller_routes(app: Flask, socketio: Any, socketio_emit: Any,
 
             label_header = {
                 'image_id': image_id,
-                'labels': wrapped_labels.labels_json,
+                'labels': labels_json_for_client(wrapped_labels),
                 'completed_tasks': wrapped_labels.completed_tasks,
                 'timeElapsed': 0.0,
                 'state': 'editable',
                 'session_id': str(uuid.uuid4()),
             }
 
-            r = make_response(json.dumps(label_header))
+            r = make_response(json_codec.dumps_bytes(label_header))
             r.mimetype = 'application/json'
             return r
 
 
         @app.route('/labeller/set_labels', methods=['POST'])
         def set_labels():
-            label_header = json.loads(request.form['labels'])
+            label_header = json_codec.loads(request.form['labels'])
             image_id = label_header['image_id']
 
             image = images_table[image_id]
@@ -247,7 +258,8 @@ def flask_labeller(labelled_images: Sequence[labelled_image.LabelledImage],
                    tasks: Optional[Sequence[Any]] = None,
                    anno_controls: Optional[Sequence[Any]] = None,
                    config: Optional[Mapping[str, Any]] = None,
-                   dextr_fn: Optional[DextrFunctionType] = None, use_reloader: bool = True, debug: bool = True,
+                   dextr_fn: Optional[DextrFunctionType] = None, dextr_simplify_tolerance: float = 0.0,
+                   use_compact_labels: bool = False, use_reloader: bool = True, debug: bool = True,
                    port: Optional[int] = None):
     # Generate image IDs list
     image_ids = [str(i)   for i in range(len(labelled_images))]
@@ -299,7 +311,9 @@ def flask_labeller(labelled_images: Sequence[labelled_image.LabelledImage],
                                dextr_available=dextr_fn is not None,
                                use_websockets=socketio is not None)
 
-    _register_labeller_routes(app, socketio, socketio_emit, images_table, dextr_fn)
+    _register_labeller_routes(app, socketio, socketio_emit, images_table, dextr_fn,
+                              dextr_simplify_tolerance=dextr_simplify_tolerance,
+                              use_compact_labels=use_compact_labels)
 
     if socketio is not None:
         socketio.run(app, debug=debug, port=port, use_reloader=use_reloader)
@@ -312,8 +326,9 @@ def flask_labeller_and_schema_editor(labelled_images: Sequence[labelled_image.La
                                      tasks: Optional[Sequence[Any]] = None,
                                      anno_controls: Optional[Sequence[Any]] = None,
                                      config: Optional[Mapping[str, Any]] = None,
-                                     dextr_fn: Optional[DextrFunctionType] = None, use_reloader: bool = True,
-                                     debug: bool = True, port: Optional[int] = None):
+                                     dextr_fn: Optional[DextrFunctionType] = None,
+                                     dextr_simplify_tolerance: float = 0.0, use_compact_labels: bool = False,
+                                     use_reloader: bool = True, debug: bool = True, port: Optional[int] = None):
     vue_tmpl_path = pathlib.Path(__file__).parent / 'templates' / 'inline' / 'schema_editor_vue_templates.html'
 
     # Generate image IDs list
@@ -377,7 +392,9 @@ def flask_labeller_and_schema_editor(labelled_images: Sequence[labelled_image.La
                                schema=schema_store.get_schema_json(),
                                schema_editor_vue_templates_html=schema_editor_vue_templates_html)
 
-    _register_labeller_routes(app, socketio, socketio_emit, images_table, dextr_fn)
+    _register_labeller_routes(app, socketio, socketio_emit, images_table, dextr_fn,
+                              dextr_simplify_tolerance=dextr_simplify_tolerance,
+                              use_compact_labels=use_compact_labels)
     _register_schema_editor_routes(app, socketio, socketio_emit, schema_store)
 
 
@@ -396,8 +413,12 @@ def flask_labeller_and_schema_editor(labelled_images: Sequence[labelled_image.La
 @click.option('--update_label_object_ids', is_flag=True, default=False, help='Update object IDs in label JSON files')
 @click.option('--enable_dextr', is_flag=True, default=False)
 @click.option('--dextr_weights', type=click.Path())
+@click.option('--dextr_simplify_tolerance', type=float, default=0.0,
+              help='Simplify DEXTR polygons with this tolerance in pixels')
+@click.option('--compact_labels', 'use_compact_labels', is_flag=True, default=False,
+              help='Send labels to the browser using the compact encoding')
 def run_app(images_dir, images_pat, labels_dir, readonly, update_label_object_ids,
-            enable_dextr, dextr_weights):
+            enable_dextr, dextr_weights, dextr_simplify_tolerance, use_compact_labels):
     if enable_dextr or dextr_weights is not None:
         from dextr.model import DextrModel
         import torch
@@ -517,7 +538,8 @@ def run_app(images_dir, images_pat, labels_dir, readonly, update_label_object_id
     ]
 
     flask_labeller_and_schema_editor(labelled_images, schema_store, tasks=tasks,
-                   anno_controls=anno_controls, config=config, dextr_fn=dextr_fn)
+                   anno_controls=anno_controls, config=config, dextr_fn=dextr_fn,
+                   dextr_simplify_tolerance=dextr_simplify_tolerance, use_compact_labels=use_compact_labels)
 
 
 if __name__ == '__main__':
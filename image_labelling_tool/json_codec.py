@@ -0,0 +1,85 @@
+"""Fast JSON encoding and decoding of label data.
+
+Label data sent to and received from the labelling tool and stored by the Django app can be many
+megabytes in size. The functions in this module use `orjson` when it is installed, which is several times
+faster than the `json` module in the standard library, falling back to the standard library otherwise.
+
+NumPy arrays and scalars are serialised directly, as are objects that have a `to_json` method,
+such as `labelling_tool.ImageLabels` and labels, so label data does not have to be converted to JSON
+form beforehand.
+
+Both implementations produce compact JSON with no whitespace.
+"""
+import json
+from typing import Any, Union
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(obj: Any) -> Any:
+    # Convert objects that the encoder cannot serialise natively
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    elif isinstance(obj, np.generic):
+        return obj.item()
+    elif hasattr(obj, 'to_json'):
+        return obj.to_json()
+    raise TypeError('Object of type {} is not JSON serializable'.format(type(obj).__name__))
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumps_bytes(obj: Any) -> bytes:
+        """Serialise to JSON as UTF-8 encoded bytes.
+
+        :param obj: the object to serialise
+        :return: JSON as `bytes`
+        """
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+
+    def dumps(obj: Any) -> str:
+        """Serialise to JSON as a string.
+
+        :param obj: the object to serialise
+        :return: JSON as a `str`
+        """
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS).decode('utf-8')
+
+    def loads(data: Union[str, bytes, bytearray, memoryview]) -> Any:
+        """Parse JSON.
+
+        :param data: JSON as a `str` or UTF-8 encoded bytes
+        :return: the parsed data
+        """
+        return orjson.loads(data)
+else:
+    def dumps_bytes(obj: Any) -> bytes:
+        """Serialise to JSON as UTF-8 encoded bytes.
+
+        :param obj: the object to serialise
+        :return: JSON as `bytes`
+        """
+        return dumps(obj).encode('utf-8')
+
+    def dumps(obj: Any) -> str:
+        """Serialise to JSON as a string.
+
+        :param obj: the object to serialise
+        :return: JSON as a `str`
+        """
+        return json.dumps(obj, default=_default, separators=(',', ':'))
+
+    def loads(data: Union[str, bytes, bytearray, memoryview]) -> Any:
+        """Parse JSON.
+
+        :param data: JSON as a `str` or UTF-8 encoded bytes
+        :return: the parsed data
+        """
+        if isinstance(data, memoryview):
+            data = bytes(data)
+        return json.loads(data)
@@ -18,6 +18,7 @@ from PIL import Image
 from skimage.util import img_as_ubyte
 from skimage import transform
 from image_labelling_tool.labelling_tool import WrappedImageLabels, ImageLabels, LabelClass
+from image_labelling_tool.mask_rle import RLEInstanceMasks
 
 
 PathType = Union[pathlib.Path, str]
@@ -405,13 +406,14 @@ class LabelledImage:
         # Get the wrapped labels
         wlabels = self.labels_store.get_wrapped_labels()
         # Get the ImageLabels instance and warp it
-        warped_image_labels = wlabels.labels.warped(transformation)
+        warped_image_labels = wlabels.labels.warp(transformation)
         # Wrapped labels instance with labels replaced
         warped_labels = wlabels.with_labels(warped_image_labels)
         return LabelledImage(InMemoryImageSource(warped_pixels), InMemoryLabelsStore(warped_labels))
 
     def render_label_classes(self, label_classes: _LabelClassMappingType,
-                             multichannel_mask: bool = False, fill: bool = True) -> np.ndarray:
+                             multichannel_mask: bool = False, fill: bool = True,
+                             backend: Optional[str] = None) -> np.ndarray:
         """
         Render label classes to a create a label class image suitable for use as a
         semantic segmentation ground truth image.
@@ -421,14 +423,36 @@ class LabelledImage:
         :param label_classes: label class mapping
         :param multichannel_mask: if False return label class image, if True return multi-channel mask
         :param fill: if True, labels will be filled, otherwise they will be outlined
+        :param backend: [optional] rasteriser backend, see `AbstractLabel.render_mask`
         :return: (H,W) array with dtype=int if multichannel is False, otherwise (H,W,n_classes) with dtype=bool
         """
         return self.labels_store.get_wrapped_labels().labels.render_label_classes(
-            label_classes, self.image_source.image_size, multichannel_mask=multichannel_mask, fill=fill)
+            label_classes, self.image_source.image_size, multichannel_mask=multichannel_mask, fill=fill,
+            backend=backend)
+
+    def iter_label_class_tiles(self, label_classes: _LabelClassMappingType, tile_shape: Tuple[int, int],
+                               multichannel_mask: bool = False, fill: bool = True,
+                               backend: Optional[str] = None):
+        """
+        Render label classes tile by tile over the whole image, for images that are too large to render at once.
+
+        See `ImageLabels.iter_label_class_tiles` for full description.
+
+        :param label_classes: label class mapping
+        :param tile_shape: `(tile_height, tile_width)` tuple specifying the shape of the tiles
+        :param multichannel_mask: if False generate label class images, if True generate multi-channel masks
+        :param fill: if True, labels will be filled, otherwise they will be outlined
+        :param backend: [optional] rasteriser backend, see `AbstractLabel.render_mask`
+        :return: generator yielding `(window, tile)` tuples, where `window` is a `(y0, x0, height, width)` tuple
+        """
+        return self.labels_store.get_wrapped_labels().labels.iter_label_class_tiles(
+            label_classes, self.image_source.image_size, tile_shape, multichannel_mask=multichannel_mask,
+            fill=fill, backend=backend)
 
     def render_label_instances(self, label_classes: Optional[_LabelClassMappingType],
                                multichannel_mask: bool = False,
-                               fill: bool = True) -> Union[Tuple[np.ndarray, np.ndarray],
+                               fill: bool = True,
+                               backend: Optional[str] = None) -> Union[Tuple[np.ndarray, np.ndarray],
                                                            Tuple[np.ndarray, np.ndarray, np.ndarray]]:
         """
         Render a label instance image suitable for use as an instance segmentation ground truth image.
@@ -438,6 +462,7 @@ class LabelledImage:
         :param label_classes: [optional] label class mapping, if None render all labels
         :param multichannel_mask: if False return label class image, if True return multi-channel mask
         :param fill: if True, labels will be filled, otherwise they will be outlined
+        :param backend: [optional] rasteriser backend, see `AbstractLabel.render_mask`
         :return: tuple of (label_image, label_index_to_cls) where:
             label_image is a (H,W) array with dtype=int
             label_index_to_cls is a 1D array that gives the class index of each labels. The first entry
@@ -445,20 +470,41 @@ class LabelledImage:
                 index of the class in `label_class` + 1.
         """
         return self.labels_store.get_wrapped_labels().labels.render_label_instances(
-            label_classes, self.image_source.image_size, multichannel_mask=multichannel_mask, fill=fill)
+            label_classes, self.image_source.image_size, multichannel_mask=multichannel_mask, fill=fill,
+            backend=backend)
+
+    def render_label_instances_rle(self, label_classes: Optional[_LabelClassMappingType],
+                                   fill: bool = True, compress: bool = False,
+                                   backend: Optional[str] = None) -> Tuple[RLEInstanceMasks, np.ndarray]:
+        """
+        Render label instance masks as COCO-compatible run-length encoded masks, without constructing a
+        dense multi-channel mask.
+
+        :param label_classes: [optional] label class mapping, if None render all labels
+        :param fill: if True, labels will be filled, otherwise they will be outlined
+        :param compress: if True, the RLE counts will be stored as COCO compressed strings
+        :param backend: [optional] rasteriser backend, see `AbstractLabel.render_mask`
+        :return: tuple of (masks, label_index_to_cls) where:
+            masks is a `RLEInstanceMasks` sequence that decodes each mask on demand
+            label_index_to_cls is a 1D array that gives the class index of each label/instance
+        """
+        return self.labels_store.get_wrapped_labels().labels.render_label_instances_rle(
+            label_classes, self.image_source.image_size, fill=fill, compress=compress, backend=backend)
 
-    def extract_label_images(self, label_class_set: Optional[Container[str]] = None) -> List[np.ndarray]:
+    def extract_label_images(self, label_class_set: Optional[Container[str]] = None,
+                             backend: Optional[str] = None) -> List[np.ndarray]:
         """
         Extract an image of each labelled entity.
         The resulting image is the original image masked with an alpha channel that results from rendering the label
 
         :param label_class_set: a set/container of classes whose labels should be rendered, or None for all labels
+        :param backend: [optional] rasteriser backend, see `AbstractLabel.render_mask`
         :return: a list of (H,W,C) image arrays
         """
         # Get the image as a NumPy array
         image_pixels = np.array(self.image_source.image_as_array_or_pil())
         return self.labels_store.get_wrapped_labels().labels.extract_label_images(
-            image_pixels, label_class_set=label_class_set)
+            image_pixels, label_class_set=label_class_set, backend=backend)
 
     @staticmethod
     def _compute_labels_path(image_path: pathlib.Path, labels_dir: pathlib.Path,
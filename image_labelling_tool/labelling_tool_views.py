@@ -2,14 +2,47 @@ from typing import Any, Optional, Container, Sequence, List, Dict, Union
 from abc import abstractmethod
 import json, datetime, uuid
 
-from django.http import HttpRequest, JsonResponse
+from django.http import HttpRequest, HttpResponse, JsonResponse
 from django.views.decorators.cache import never_cache
 from django.views import View
 from django.utils.decorators import method_decorator
 
 from django.conf import settings
+from django.db import transaction
 
-from . import models
+from . import models, json_codec, compact_labels, labels_patch
+
+
+def _labels_json_response(data: Any) -> HttpResponse:
+    # Label data can be large, so serialise it using the fast JSON codec rather than `JsonResponse`
+    return HttpResponse(json_codec.dumps_bytes(data), content_type='application/json')
+
+
+def _labels_model_json_for_client(labels: models.Labels) -> Any:
+    # Send labels compact encoded if `settings.LABELLING_TOOL_COMPACT_LABELS` is True; the client
+    # will send compact encoded labels back in response
+    if getattr(settings, 'LABELLING_TOOL_COMPACT_LABELS', False):
+        return labels.labels_compact_json
+    else:
+        return labels.labels_json
+
+
+def _labels_model_response(labels_header: Dict[str, Any], labels: models.Labels) -> HttpResponse:
+    # Respond with `labels_header` with the labels from `labels` added under the `'labels'` key.
+    # If the labels are stored as JSON text (possibly compressed) in the form that the client expects,
+    # splice the text into the response rather than parsing and serialising them again.
+    if not getattr(settings, 'LABELLING_TOOL_COMPACT_LABELS', False):
+        labels_text = labels.stored_labels_json_text()
+        if labels_text is not None:
+            if isinstance(labels_text, str):
+                labels_text = labels_text.encode('utf-8')
+            if labels_text[:1] == b'[':
+                header_bytes = json_codec.dumps_bytes(labels_header)
+                return HttpResponse(header_bytes[:-1] + b',"labels":' + labels_text + b'}',
+                                    content_type='application/json')
+    labels_header = dict(labels_header)
+    labels_header['labels'] = _labels_model_json_for_client(labels)
+    return _labels_json_response(labels_header)
 
 
 class LabellingToolView (View):
@@ -28,6 +61,15 @@ class LabellingToolView (View):
     Note that if `get_labels` returns a dict, you must implement the `update_labels` method to define
     how labels are updated in response to edits by the user.
 
+    When `get_labels` returns a `models.Labels` instance, the client sends patches that describe only the
+    labels that have changed (see the `labels_patch` module); these are applied by the `update_labels_with_patch`
+    method rather than `update_labels`. If you override `update_labels` but not `update_labels_with_patch`,
+    patches are disabled so that all edits pass through your `update_labels` (see `labels_patches_supported`).
+    Patches identify the version of the labels that the client's edits are based on, so an update based on labels
+    that another user has changed since they were loaded is rejected with a `'version_conflict'` error and the
+    client asks the user whether to reload the labels or overwrite them. When patches are disabled, or for
+    clients that send the complete labels without a base version, the last update to be received wins.
+
     In some cases you wish to have `get_labels` return the `models.Labels` instance that is to be displayed
     to the user and apply updates to a different `models.Labels` instance. For example, if automatically
     generated labels are available and no manually created labels are available, you may
@@ -172,6 +214,42 @@ class LabellingToolView (View):
         labels.update_labels(labels_json, completed_tasks, time_elapsed, request.user, save=True, check_lock=False)
         return labels
 
+    def update_labels_with_patch(self, request: HttpRequest, image_id_str: str, patch_json: Any,
+                                 completed_tasks: Container[str], time_elapsed: float,
+                                 *args, **kwargs) -> models.Labels:
+        """Update the `Labels` instance identified by `image_id_str` by applying a patch sent by the client.
+        Raises `labels_patch.LabelsPatchConflictError` if the patch cannot be applied, e.g. because
+        the labels have been changed since the client received them.
+
+        :param request: HTTP request
+        :param image_id_str: image ID that identifies the image that we are labelling
+        :param patch_json: labels patch in JSON format (see the `labels_patch` module)
+        :param completed_tasks: sequence of `LabellingTask` instances that lists the tasks that have been completed
+        :param time_elapsed: the amount of time taken by users to label this image
+        :param args: additional arguments
+        :param kwargs:additional keyword arguments
+        :return: the `Labels` instance that was updated
+        """
+        labels = self.get_labels_for_update(request, image_id_str, *args, **kwargs)
+        labels.update_labels(None, completed_tasks, time_elapsed, request.user, save=True, check_lock=False,
+                             patch_json=patch_json)
+        return labels
+
+    def labels_patches_supported(self) -> bool:
+        """Determine if the client should send patches that are applied by `update_labels_with_patch`, rather
+        than the complete labels. By default this is the case unless a subclass overrides `update_labels`
+        without also overriding `update_labels_with_patch`, so that customisations in `update_labels`
+        are not bypassed. Override to return True if your `update_labels` need not see patched edits.
+
+        :return: True if patches are supported
+        """
+        def defining_class(name):
+            for cls in type(self).__mro__:
+                if name in cls.__dict__:
+                    return cls
+            return None
+        return issubclass(defining_class('update_labels_with_patch'), defining_class('update_labels'))
+
     def dextr_request(self, request: HttpRequest, image_id_str: str, dextr_id: int,
                       dextr_points: List[Dict[str, float]]) -> Optional[List[List[Dict[str, float]]]]:
         """Process incoming DEXTR request. If the inference step can be handled immediately
@@ -207,7 +285,7 @@ class LabellingToolView (View):
         raise NotImplementedError('dextr_poll not implemented for {}'.format(type(self)))
 
     @method_decorator(never_cache)
-    def get(self, request: HttpRequest, *args, **kwargs) -> JsonResponse:
+    def get(self, request: HttpRequest, *args, **kwargs) -> HttpResponse:
         if 'labels_for_image_id' in request.GET:
             image_id_str = request.GET['labels_for_image_id']
 
@@ -231,9 +309,12 @@ class LabellingToolView (View):
                     'completed_tasks': [task.name for task in labels.completed_tasks.all()],
                     'timeElapsed': labels.edit_time_elapsed,
                     'state': 'editable',
-                    'labels': labels.labels_json,
                     'session_id': session_id,
                 }
+                if self.labels_patches_supported():
+                    # The version that the client should compute patches against
+                    labels_header['version'] = labels.version_tag
+                return _labels_model_response(labels_header, labels)
             elif isinstance(labels, dict):
                 labels_header = {
                     'image_id': image_id_str,
@@ -247,7 +328,7 @@ class LabellingToolView (View):
                 raise TypeError('labels returned by get_labels metod should be None, a Labels model '
                                 'or a dictionary; not a {}'.format(type(labels)))
 
-            return JsonResponse(labels_header)
+            return _labels_json_response(labels_header)
         elif 'next_unlocked_image_id_after' in request.GET:
             return JsonResponse({'error': 'operation_not_supported'})
         else:
@@ -257,20 +338,41 @@ class LabellingToolView (View):
     def post(self, request: HttpRequest, *args, **kwargs) -> JsonResponse:
         if 'labels' in request.POST:
             # Write labels
-            labels = json.loads(request.POST['labels'])
+            labels = json_codec.loads(request.POST['labels'])
             image_id = labels['image_id']
             completed_task_names = labels['completed_tasks']
             time_elapsed = labels['timeElapsed']
-            label_data = labels['labels']
 
             completed_tasks = models.LabellingTask.objects.filter(enabled=True, name__in=completed_task_names)
 
+            patches_supported = self.labels_patches_supported()
             try:
-                self.update_labels(request, str(image_id), label_data, completed_tasks, time_elapsed, *args, **kwargs)
+                if 'labels_patch' in labels:
+                    if not patches_supported:
+                        raise labels_patch.LabelsPatchConflictError('Labels patches are not supported by this view')
+                    # Only the labels that have changed
+                    updated = self.update_labels_with_patch(request, str(image_id), labels['labels_patch'],
+                                                            completed_tasks, time_elapsed, *args, **kwargs)
+                else:
+                    label_data = labels['labels']
+                    if compact_labels.is_compact(label_data):
+                        label_data = compact_labels.decode(label_data)
+                    updated = self.update_labels(request, str(image_id), label_data, completed_tasks, time_elapsed,
+                                                 *args, **kwargs)
             except models.LabelsLockedError:
                 return JsonResponse({'error': 'locked'})
+            except labels_patch.LabelsPatchConflictError:
+                # The client should send the complete labels
+                return JsonResponse({'error': 'patch_conflict'})
+            except models.LabelsVersionConflictError:
+                # The labels were saved by another request while this one was being handled
+                return JsonResponse({'error': 'version_conflict'})
             else:
-                return JsonResponse({'response': 'success'})
+                response = {'response': 'success'}
+                if patches_supported and isinstance(updated, models.Labels):
+                    # The version that the client should compute its next patch against
+                    response['version'] = updated.version_tag
+                return JsonResponse(response)
         elif 'dextr' in request.POST:
             # DEXTR
             dextr_js = json.loads(request.POST['dextr'])
@@ -373,10 +475,40 @@ class LabellingToolViewWithLocking (LabellingToolView):
         """
         expire_after = getattr(settings, 'LABELLING_TOOL_LOCK_TIME', 600)
         labels = self.get_labels_for_update(request, image_id_str, *args, **kwargs)
-        labels.update_labels(labels_json, completed_tasks, time_elapsed, request.user, check_lock=True, save=False)
-        if request.user.is_authenticated:
-            labels.refresh_lock(request.user, datetime.timedelta(seconds=expire_after), save=False)
-        labels.save()
+        # Roll back the change to the completed tasks if the labels were saved by another request
+        with transaction.atomic():
+            labels.update_labels(labels_json, completed_tasks, time_elapsed, request.user, check_lock=True, save=False)
+            if request.user.is_authenticated:
+                labels.refresh_lock(request.user, datetime.timedelta(seconds=expire_after), save=False)
+            labels.save_if_unchanged()
+        return labels
+
+    def update_labels_with_patch(self, request: HttpRequest, image_id_str: str, patch_json: Any,
+                                 completed_tasks: Container[str], time_elapsed: float,
+                                 *args, **kwargs) -> models.Labels:
+        """
+        Update the `Labels` instance identified by `image_id_str` by applying a patch sent by the client.
+        Raises `labels_patch.LabelsPatchConflictError` if the patch cannot be applied, e.g. because
+        the labels have been changed since the client received them.
+
+        :param request: HTTP request
+        :param image_id_str: image ID that identifies the image that we are labelling
+        :param patch_json: labels patch in JSON format (see the `labels_patch` module)
+        :param completed_tasks: sequence of `LabellingTask` instances that lists the tasks that have been completed
+        :param time_elapsed: the amount of time taken by users to label this image
+        :param args: additional arguments
+        :param kwargs:additional keyword arguments
+        :return: the `Labels` instance that was updated
+        """
+        expire_after = getattr(settings, 'LABELLING_TOOL_LOCK_TIME', 600)
+        labels = self.get_labels_for_update(request, image_id_str, *args, **kwargs)
+        # Roll back the change to the completed tasks if the labels were saved by another request
+        with transaction.atomic():
+            labels.update_labels(None, completed_tasks, time_elapsed, request.user, check_lock=True, save=False,
+                                 patch_json=patch_json)
+            if request.user.is_authenticated:
+                labels.refresh_lock(request.user, datetime.timedelta(seconds=expire_after), save=False)
+            labels.save_if_unchanged()
         return labels
 
     @method_decorator(never_cache)
@@ -392,32 +524,34 @@ class LabellingToolViewWithLocking (LabellingToolView):
                 raise TypeError('labels returned by get_labels metod should be a Labels '
                                 'model, not a {}'.format(type(labels)))
 
-            # Remove existing lock
+            # Remove existing locks, with a single query
             if request.user.is_authenticated:
-                already_locked = models.Labels.objects.locked_by_user(request.user)
-                for locked_labels in already_locked:
-                    locked_labels.unlock(from_user=request.user, save=True)
+                models.Labels.objects.locked_by_user(request.user).unlock()
 
             if labels.is_locked_to(request.user):
                 state = 'locked'
-                attempt_lock = False
             else:
                 state = 'editable'
-                attempt_lock = True
+                if request.user.is_authenticated:
+                    # Lock with a single conditional query; it fails if another user has locked the labels
+                    # since they were loaded
+                    expire_after = getattr(settings, 'LABELLING_TOOL_LOCK_TIME', 600)
+                    n_locked = models.Labels.objects.filter(pk=labels.pk).lock(
+                        request.user, datetime.timedelta(seconds=expire_after))
+                    if n_locked == 0:
+                        state = 'locked'
             labels_header = {
                 'image_id': image_id_str,
                 'completed_tasks': [task.name for task in labels.completed_tasks.all()],
                 'timeElapsed': labels.edit_time_elapsed,
                 'state': state,
-                'labels': labels.labels_json,
                 'session_id': session_id,
             }
+            if self.labels_patches_supported():
+                # The version that the client should compute patches against
+                labels_header['version'] = labels.version_tag
 
-            if attempt_lock and request.user.is_authenticated:
-                expire_after = getattr(settings, 'LABELLING_TOOL_LOCK_TIME', 600)
-                labels.lock(request.user, datetime.timedelta(seconds=expire_after), save=True)
-
-            return JsonResponse(labels_header)
+            return _labels_model_response(labels_header, labels)
         else:
             return JsonResponse({'error': 'unknown_operation'})
 
@@ -0,0 +1,86 @@
+"""Compression of labels in JSON text form for storage.
+
+Labels with many polygons can take megabytes of JSON text. Compressed, they typically take 4-5 times less
+space. Compressed data starts with a format marker that identifies the compression method, so that
+data compressed with different methods can be decompressed:
+
+    b'zlib:' followed by a zlib stream
+    b'zstd:' followed by a zstd frame
+
+zlib is always available. zstd, which compresses and decompresses faster than zlib, requires the
+`zstandard` package.
+"""
+import zlib
+from typing import Union
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+COMPRESSION_ZLIB = 'zlib'
+COMPRESSION_ZSTD = 'zstd'
+
+COMPRESSIONS = (COMPRESSION_ZLIB, COMPRESSION_ZSTD)
+
+_MARKER_SEP = b':'
+_MARKER_LEN = 5
+
+
+def check_compression(compression: str):
+    """Check that a compression method is known and available, raising `ValueError` if not.
+
+    :param compression: the compression method; 'zlib' or 'zstd'
+    """
+    if compression not in COMPRESSIONS:
+        raise ValueError('compression should be one of {}, not {}'.format(list(COMPRESSIONS), compression))
+    if compression == COMPRESSION_ZSTD and zstandard is None:
+        raise ValueError('zstd compression requires the zstandard package to be installed')
+
+
+def compress(data: Union[str, bytes], compression: str) -> bytes:
+    """Compress labels in JSON text form.
+
+    :param data: JSON as a `str` or UTF-8 encoded bytes
+    :param compression: the compression method; 'zlib' or 'zstd'
+    :return: the compressed data, starting with a format marker
+    """
+    check_compression(compression)
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    if compression == COMPRESSION_ZSTD:
+        compressed = zstandard.ZstdCompressor().compress(data)
+    else:
+        compressed = zlib.compress(data, 6)
+    return compression.encode('ascii') + _MARKER_SEP + compressed
+
+
+def compression_of(data: Union[bytes, bytearray, memoryview]) -> str:
+    """Get the compression method of compressed data from its format marker.
+
+    :param data: data returned by `compress`
+    :return: the compression method; 'zlib' or 'zstd'
+    """
+    marker = bytes(data[:_MARKER_LEN])
+    compression = marker[:-1].decode('ascii', errors='replace')
+    if marker[-1:] != _MARKER_SEP or compression not in COMPRESSIONS:
+        raise ValueError('Compressed labels have an unknown format marker {!r}'.format(marker))
+    return compression
+
+
+def decompress(data: Union[bytes, bytearray, memoryview]) -> bytes:
+    """Decompress labels compressed by `compress`.
+
+    :param data: the compressed data, e.g. as read from a database `BinaryField`
+    :return: JSON as UTF-8 encoded bytes
+    """
+    compression = compression_of(data)
+    payload = memoryview(data)[_MARKER_LEN:]
+    if compression == COMPRESSION_ZSTD:
+        if zstandard is None:
+            raise ValueError('Labels are compressed with zstd; install the zstandard package to decompress them')
+        # Frames written by `ZstdCompressor.compress` include the content size
+        return zstandard.ZstdDecompressor().decompress(payload)
+    else:
+        return zlib.decompress(payload)
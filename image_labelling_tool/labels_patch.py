@@ -0,0 +1,149 @@
+"""Incremental updates to labels in JSON form.
+
+Rather than sending the complete list of labels whenever a label is edited, the labelling tool client can
+send a patch that describes only the labels that have been added, modified or deleted, identified by their
+object ID. A patch in JSON form is a dict of the form:
+
+    {
+        'base_version': <version>,      # the version of the labels that the patch was computed against
+        'set': [...],                   # labels in JSON form that were added or modified
+        'delete': ['<object_id>', ...]  # the object IDs of labels that were deleted
+    }
+
+The version is provided by the server along with the labels and is opaque to the client.
+
+A replacement patch replaces all of the labels, while still identifying the version that the client's labels
+are based on, so that the server can detect that another user has changed them in the meantime:
+
+    {
+        'base_version': <version>,
+        'labels': [...]                 # the complete list of labels in JSON form, possibly compact encoded
+    }
+
+Applying a patch replaces each label in `set` that has the object ID of an existing label in place and
+appends the others in the order given, after removing the labels whose IDs are in `delete`.
+`apply_patch` raises `LabelsPatchConflictError` if the labels have changed since the patch was computed,
+as indicated by the version, or if the patch cannot be applied; the client should respond by sending
+the complete list of labels instead.
+
+Patches only apply to top-level labels; a modified group or composite label is sent in its entirety.
+A replacement patch is used when the changes cannot be expressed as a patch.
+"""
+from typing import Any, Optional, Sequence, List
+
+from . import compact_labels
+
+
+class LabelsPatchConflictError (ValueError):
+    """Raised when a labels patch cannot be applied"""
+    pass
+
+
+def is_patch(patch_js: Any) -> bool:
+    """Determine if a JSON value is a labels patch.
+
+    :param patch_js: the value to test
+    :return: True if `patch_js` is a labels patch
+    """
+    return isinstance(patch_js, dict) and 'base_version' in patch_js and \
+        ('set' in patch_js or 'delete' in patch_js or 'labels' in patch_js)
+
+
+def is_replacement(patch_js: Any) -> bool:
+    """Determine if a labels patch is a replacement patch, that replaces all of the labels.
+
+    :param patch_js: the patch in JSON form
+    :return: True if `patch_js` is a replacement patch
+    """
+    return is_patch(patch_js) and 'labels' in patch_js
+
+
+def _object_id_to_index(labels_js: Sequence[Any]) -> dict:
+    object_id_to_index = {}
+    for i, label_js in enumerate(labels_js):
+        object_id = label_js.get('object_id')
+        if object_id is None:
+            raise LabelsPatchConflictError('Cannot patch labels that do not have object IDs')
+        if object_id in object_id_to_index:
+            raise LabelsPatchConflictError('Cannot patch labels with duplicate object ID {}'.format(object_id))
+        object_id_to_index[object_id] = i
+    return object_id_to_index
+
+
+def make_patch(old_labels_js: Sequence[Any], new_labels_js: Sequence[Any], base_version: Any) -> Optional[Any]:
+    """Compute a patch that converts one list of labels into another.
+
+    :param old_labels_js: the labels in JSON form that the patch will be applied to
+    :param new_labels_js: the labels in JSON form that applying the patch should produce
+    :param base_version: the version of `old_labels_js`
+    :return: the patch in JSON form, or None if the labels cannot be expressed as a patch, e.g. because
+        they have been re-ordered or lack object IDs
+    """
+    try:
+        old_id_to_index = _object_id_to_index(old_labels_js)
+        new_id_to_index = _object_id_to_index(new_labels_js)
+    except LabelsPatchConflictError:
+        return None
+    deleted_ids = [object_id for object_id in old_id_to_index.keys() if object_id not in new_id_to_index]
+    changed = []
+    added_ids = []
+    for label_js in new_labels_js:
+        object_id = label_js['object_id']
+        old_index = old_id_to_index.get(object_id)
+        if old_index is None:
+            added_ids.append(object_id)
+            changed.append(label_js)
+        elif old_labels_js[old_index] != label_js:
+            changed.append(label_js)
+    # Applying the patch must preserve the order of the labels
+    expected_order = [label_js['object_id'] for label_js in old_labels_js
+                      if label_js['object_id'] in new_id_to_index] + added_ids
+    if expected_order != [label_js['object_id'] for label_js in new_labels_js]:
+        return None
+    return {'base_version': base_version, 'set': changed, 'delete': deleted_ids}
+
+
+def apply_patch(labels_js: Sequence[Any], patch_js: Any, version: Optional[Any] = None) -> List[Any]:
+    """Apply a patch to a list of labels.
+
+    :param labels_js: the labels in JSON form; not modified
+    :param patch_js: the patch in JSON form
+    :param version: [optional] the version of `labels_js`; if given, it must match the base version of the patch
+    :return: the patched labels as a new list, or the labels given by a replacement patch
+    """
+    if not is_patch(patch_js):
+        raise TypeError('patch_js should be a labels patch, not a {}'.format(type(patch_js)))
+    if version is not None and patch_js['base_version'] != version:
+        raise LabelsPatchConflictError('Patch base version {} does not match labels version {}'.format(
+            patch_js['base_version'], version))
+    if 'labels' in patch_js:
+        labels_js = patch_js['labels']
+        if compact_labels.is_compact(labels_js):
+            labels_js = compact_labels.decode(labels_js)
+        return list(labels_js)
+    object_id_to_index = _object_id_to_index(labels_js)
+    result = list(labels_js)
+    deleted = set()
+    for object_id in patch_js.get('delete', []):
+        index = object_id_to_index.get(object_id)
+        if index is None:
+            raise LabelsPatchConflictError('Cannot delete label {}; it does not exist'.format(object_id))
+        deleted.add(index)
+    appended = []
+    appended_ids = set()
+    for label_js in patch_js.get('set', []):
+        object_id = label_js.get('object_id')
+        if object_id is None:
+            raise LabelsPatchConflictError('Labels in a patch must have object IDs')
+        index = object_id_to_index.get(object_id)
+        if index is None or index in deleted:
+            if object_id in appended_ids:
+                raise LabelsPatchConflictError('Patch adds object ID {} more than once'.format(object_id))
+            appended_ids.add(object_id)
+            appended.append(label_js)
+        else:
+            result[index] = label_js
+    if len(deleted) > 0:
+        result = [label_js for i, label_js in enumerate(result) if i not in deleted]
+    result.extend(appended)
+    return result
@@ -0,0 +1,237 @@
+"""Streaming reading and writing of label files.
+
+Label files generated automatically can be hundreds of megabytes in size. `iter_labels_json` reads the labels
+from a label file one at a time, so the memory required is proportional to the size of the largest label
+rather than the size of the file. `LabelsFileWriter` writes a label file one label at a time.
+
+The file is read in chunks and each label is parsed by the C accelerated decoder in the `json` module, so reading
+is about as fast as `json.load` and has no additional dependencies.
+
+Example: convert the labels in a file, without loading the whole file:
+
+    metadata = {}
+    with LabelsFileWriter('out.json', image_filename='img.png') as writer:
+        for label_js in iter_labels_json('in.json', metadata=metadata):
+            writer.write(convert(label_js))
+"""
+import codecs
+import json
+import pathlib
+import re
+from typing import Any, Optional, Union, IO, Iterable, Mapping, Container, Generator
+from . import json_codec, compact_labels
+
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+
+class _JSONStreamScanner:
+    """Reads JSON values from a file in chunks, one value at a time."""
+    def __init__(self, file: IO, chunk_size: int):
+        self._file = file
+        self._chunk_size = chunk_size
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+        self._decoder = json.JSONDecoder()
+        self._bytes_decoder = None
+
+    def _fill(self, size: int) -> bool:
+        # Read more data into the buffer, discarding the data before the current position.
+        # Returns False if the end of the file has been reached.
+        if self._eof:
+            return False
+        chunk = self._file.read(size)
+        if len(chunk) == 0:
+            self._eof = True
+            return False
+        if isinstance(chunk, (bytes, bytearray)):
+            if self._bytes_decoder is None:
+                self._bytes_decoder = codecs.getincrementaldecoder('utf-8')()
+            chunk = self._bytes_decoder.decode(chunk)
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Skip whitespace and get the next character, or an empty string at the end of the file."""
+        while True:
+            self._pos = _WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer) or not self._fill(self._chunk_size):
+                return self._buffer[self._pos:self._pos + 1]
+
+    def expect(self, chars: str) -> str:
+        """Skip whitespace and consume the next character, which must be one of `chars`."""
+        ch = self.peek()
+        if ch == '' or ch not in chars:
+            raise ValueError('Expected one of {} in label file, got {!r}'.format(list(chars), ch))
+        self._pos += 1
+        return ch
+
+    def value(self) -> Any:
+        """Skip whitespace and parse the next JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            else:
+                # A value that extends to the end of the buffer (e.g. a number) may continue in the next chunk
+                if end < len(self._buffer) or self._eof:
+                    self._pos = end
+                    return value
+            # The value is incomplete; read more. Read at least as much again as is buffered, so that
+            # the cost of re-parsing a large value is linear in its size.
+            self._fill(max(self._chunk_size, len(self._buffer) - self._pos))
+
+
+def _iter_array(scanner: _JSONStreamScanner) -> Generator[Any, None, None]:
+    scanner.expect('[')
+    if scanner.peek() == ']':
+        scanner.expect(']')
+        return
+    while True:
+        yield scanner.value()
+        if scanner.expect(',]') == ']':
+            return
+
+
+def _iter_labels_in_file(file: IO, metadata: Optional[dict], chunk_size: int) -> Generator[Any, None, None]:
+    scanner = _JSONStreamScanner(file, chunk_size)
+    ch = scanner.peek()
+    if ch == '[':
+        # No metadata
+        yield from _iter_array(scanner)
+    elif ch == '{':
+        scanner.expect('{')
+        if scanner.peek() == '}':
+            raise ValueError('Label file does not contain labels')
+        has_labels = False
+        while True:
+            key = scanner.value()
+            scanner.expect(':')
+            if key == 'labels':
+                has_labels = True
+                if scanner.peek() == '[':
+                    yield from _iter_array(scanner)
+                else:
+                    # Compact encoded labels keep the vertices of all labels in one block, so must be
+                    # read in one go
+                    labels_js = scanner.value()
+                    if not compact_labels.is_compact(labels_js):
+                        raise TypeError('labels should be a list or compact encoded labels')
+                    yield from compact_labels.decode(labels_js)
+            else:
+                value = scanner.value()
+                if metadata is not None:
+                    metadata[key] = value
+            if scanner.expect(',}') == '}':
+                break
+        if not has_labels:
+            raise ValueError('Label file does not contain labels')
+    else:
+        raise TypeError('Labels loaded from file must either be a dict or a list, not {!r}'.format(ch))
+
+
+def iter_labels_json(f: Union[str, pathlib.Path, IO], metadata: Optional[dict] = None,
+                     chunk_size: int = DEFAULT_CHUNK_SIZE) -> Generator[Any, None, None]:
+    """Read the labels in a label file one at a time, without loading the whole file.
+
+    Accepts the formats read by `WrappedImageLabels.from_file`: a list of labels, or a dict with a `'labels'`
+    entry and metadata. Compact encoded labels (see the `compact_labels` module) are supported, but
+    are read in one go.
+
+    :param f: a path as a `str` or `pathlib.Path` or a file opened in text or binary mode; a file that
+        is opened from a path is closed when the iterator is exhausted or closed
+    :param metadata: [optional] a dict that entries in the file other than `'labels'` (e.g. `'image_filename'`
+        and `'completed_tasks'`) are added to as they are read; entries that follow the labels in the file
+        are only added when the iterator is exhausted
+    :param chunk_size: the number of characters to read at a time
+    :return: an iterator that yields labels in JSON form
+    """
+    if isinstance(f, str):
+        f = pathlib.Path(f)
+    if isinstance(f, pathlib.Path):
+        with f.open('r') as file:
+            yield from _iter_labels_in_file(file, metadata, chunk_size)
+    elif hasattr(f, 'read'):
+        yield from _iter_labels_in_file(f, metadata, chunk_size)
+    else:
+        raise TypeError('f should be a path as a string or `pathlib.Path` or a file, not a {}'.format(type(f)))
+
+
+class LabelsFileWriter:
+    """Write a label file one label at a time, in the format written by `WrappedImageLabels.write_to_file`.
+
+    Use as a context manager, or call `close` when done; the file is not valid JSON until then.
+    """
+    def __init__(self, f: Union[str, pathlib.Path, IO], image_filename: Optional[str] = None,
+                 completed_tasks: Optional[Container[str]] = None, metadata: Optional[Mapping[str, Any]] = None):
+        """
+        :param f: a path as a `str` or `pathlib.Path` or a file opened in text mode; a file that is opened
+            from a path is closed by `close`
+        :param image_filename: [optional] the image filename as a string
+        :param completed_tasks: [optional] a list of completed tasks
+        :param metadata: [optional] metadata as a dictionary
+        """
+        if isinstance(f, str):
+            f = pathlib.Path(f)
+        if isinstance(f, pathlib.Path):
+            self._file = f.open('w')
+            self._owns_file = True
+        elif hasattr(f, 'write'):
+            self._file = f
+            self._owns_file = False
+        else:
+            raise TypeError('f should be a path as a string or `pathlib.Path` or a file, not a {}'.format(type(f)))
+        header = dict(metadata) if metadata is not None else {}
+        if image_filename is not None:
+            header['image_filename'] = image_filename
+        header['completed_tasks'] = list(completed_tasks) if completed_tasks is not None else []
+        # Leave the dict open so that the labels can follow
+        self._file.write(json_codec.dumps(header)[:-1] + ',"labels":[')
+        self._n_labels = 0
+        self._closed = False
+
+    @property
+    def n_labels(self) -> int:
+        """The number of labels written so far."""
+        return self._n_labels
+
+    def write(self, label: Any):
+        """Write a label
+
+        :param label: a label in JSON form or a label object (an `AbstractLabel` instance)
+        """
+        if self._closed:
+            raise ValueError('Cannot write to a closed LabelsFileWriter')
+        if self._n_labels > 0:
+            self._file.write(',')
+        self._file.write(json_codec.dumps(label))
+        self._n_labels += 1
+
+    def write_all(self, labels: Iterable[Any]):
+        """Write labels
+
+        :param labels: an iterable of labels in JSON form or label objects
+        """
+        for label in labels:
+            self.write(label)
+
+    def close(self):
+        """Finish the file, closing it if it was opened from a path."""
+        if not self._closed:
+            self._file.write(']}')
+            self._closed = True
+            if self._owns_file:
+                self._file.close()
+
+    def __enter__(self) -> 'LabelsFileWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
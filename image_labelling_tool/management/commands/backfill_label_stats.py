@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from ... import models
+
+class Command(BaseCommand):
+    help = 'Computes the label statistics (label count, class histogram, vertex count and extent) stored ' \
+           'in Labels models'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', default=False,
+                            help='Recompute the statistics of all Labels models, not just those that lack them')
+        parser.add_argument('--batch_size', type=int, default=500,
+                            help='Number of Labels models to update per transaction (default 500)')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('batch_size should be >= 1, not {}'.format(batch_size))
+        stats_fields = ['label_count', 'label_class_counts', 'vertex_count',
+                        'extent_x_min', 'extent_y_min', 'extent_x_max', 'extent_y_max']
+
+        if options['all']:
+            queryset = models.Labels.objects.all()
+        else:
+            queryset = models.Labels.objects.without_label_stats()
+        ids = list(queryset.order_by('id').values_list('id', flat=True))
+
+        n_updated = 0
+        for start in range(0, len(ids), batch_size):
+            with transaction.atomic():
+                # Lock the rows so that labels saved while the batch is being processed do not end up with
+                # statistics computed from their previous labels
+                batch_qs = models.Labels.objects.filter(id__in=ids[start:start + batch_size]).select_for_update()
+                batch = list(batch_qs.only('id', 'labels_json_str', 'labels_json_data', 'labels_json_compressed'))
+                for labels in batch:
+                    labels.update_label_stats()
+                models.Labels.objects.bulk_update(batch, stats_fields)
+            n_updated += len(batch)
+            print('Updated {}/{} Labels models'.format(n_updated, len(ids)))
+
+        if len(ids) == 0:
+            print('No Labels models to update')
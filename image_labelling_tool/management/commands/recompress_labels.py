@@ -0,0 +1,93 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from image_labelling_tool import labels_compression
+from ... import models
+
+class Command(BaseCommand):
+    help = 'Compresses or decompresses the label JSON stored in Labels models, reporting the change in size'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--compression', type=str, default=None,
+                            choices=['none'] + list(labels_compression.COMPRESSIONS),
+                            help='Compression to use; \'none\' to decompress (default: '
+                                 'settings.LABELLING_TOOL_LABELS_COMPRESSION)')
+        parser.add_argument('--batch_size', type=int, default=100,
+                            help='Number of Labels models to update per transaction (default 100)')
+        parser.add_argument('--dry_run', action='store_true', default=False,
+                            help='Report the effect of recompression without saving changes')
+
+    def handle(self, *args, **options):
+        compression = options['compression']
+        if compression is None:
+            compression = getattr(settings, 'LABELLING_TOOL_LABELS_COMPRESSION', None)
+        elif compression == 'none':
+            compression = None
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        if batch_size < 1:
+            raise CommandError('batch_size should be >= 1, not {}'.format(batch_size))
+        if compression is not None:
+            try:
+                labels_compression.check_compression(compression)
+            except ValueError as e:
+                raise CommandError(str(e))
+
+        # Labels stored in the JSON field are not affected
+        queryset = models.Labels.objects.filter(labels_json_data__isnull=True)
+        ids = list(queryset.order_by('id').values_list('id', flat=True))
+
+        n_updated = 0
+        n_processed = 0
+        size_before = 0
+        size_after = 0
+        for start in range(0, len(ids), batch_size):
+            with transaction.atomic():
+                # Lock the rows so that labels saved while the batch is being processed are not overwritten
+                batch_qs = queryset.filter(id__in=ids[start:start + batch_size])
+                if not dry_run:
+                    batch_qs = batch_qs.select_for_update()
+                batch = list(batch_qs.only(
+                    'id', 'label_count', 'labels_json_str', 'labels_json_data', 'labels_json_compressed', 'version'))
+                to_update = []
+                for labels in batch:
+                    stored = labels.labels_json_compressed
+                    if stored is not None:
+                        current_compression = labels_compression.compression_of(stored)
+                        before = len(stored)
+                    else:
+                        current_compression = None
+                        before = len(labels.labels_json_str.encode('utf-8'))
+                    # Empty label lists are always stored uncompressed as '[]'
+                    target_compression = compression if not labels.is_empty else None
+                    if target_compression != current_compression:
+                        labels_text = labels.stored_labels_json_text()
+                        if target_compression is None:
+                            if isinstance(labels_text, bytes):
+                                labels_text = labels_text.decode('utf-8')
+                            labels.labels_json_str = labels_text
+                            labels.labels_json_compressed = None
+                            after = len(labels_text.encode('utf-8'))
+                        else:
+                            labels.labels_json_str = ''
+                            labels.labels_json_compressed = labels_compression.compress(
+                                labels_text, target_compression)
+                            after = len(labels.labels_json_compressed)
+                        # Patches that clients computed against the labels as previously stored are rejected
+                        labels.version += 1
+                        to_update.append(labels)
+                    else:
+                        after = before
+                    size_before += before
+                    size_after += after
+                if not dry_run and len(to_update) > 0:
+                    models.Labels.objects.bulk_update(
+                        to_update, ['labels_json_str', 'labels_json_compressed', 'version'])
+            n_updated += len(to_update)
+            n_processed += len(batch)
+            print('Processed {}/{} Labels models, {} {}; {} -> {} bytes'.format(
+                n_processed, len(ids), 'would update' if dry_run else 'updated', n_updated,
+                size_before, size_after))
+
+        if len(ids) == 0:
+            print('No Labels models to process')
@@ -0,0 +1,74 @@
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from image_labelling_tool import labelling_tool
+from ... import models
+
+class Command(BaseCommand):
+    help = 'Simplifies the polygons in label JSON to reduce its size, reporting the vertex reduction and IoU loss'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tolerance', type=float, default=0.5,
+                            help='Douglas-Peucker tolerance in pixels (default 0.5)')
+        parser.add_argument('--no_iou', action='store_true', default=False,
+                            help='Do not compute the IoU between the original and simplified polygons')
+        parser.add_argument('--batch_size', type=int, default=100,
+                            help='Number of Labels models to update per transaction (default 100)')
+        parser.add_argument('--dry_run', action='store_true', default=False,
+                            help='Report the effect of simplification without saving changes')
+
+    def handle(self, *args, **options):
+        tolerance = options['tolerance']
+        compute_iou = not options['no_iou']
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        if tolerance < 0.0:
+            raise CommandError('tolerance should be >= 0, not {}'.format(tolerance))
+        if batch_size < 1:
+            raise CommandError('batch_size should be >= 1, not {}'.format(batch_size))
+        # Assigning `labels_json` updates the stored labels, their statistics and the version
+        update_fields = ['labels_json_str', 'labels_json_data', 'labels_json_compressed', 'version',
+                         'label_count', 'label_class_counts', 'vertex_count',
+                         'extent_x_min', 'extent_y_min', 'extent_x_max', 'extent_y_max']
+
+        ids = list(models.Labels.objects.order_by('id').values_list('id', flat=True))
+
+        n_processed = 0
+        n_updated = 0
+        n_vertices_before = 0
+        n_vertices_after = 0
+        ious = []
+        for start in range(0, len(ids), batch_size):
+            with transaction.atomic():
+                # Lock the rows so that labels saved while the batch is being processed are not overwritten
+                batch_qs = models.Labels.objects.filter(id__in=ids[start:start + batch_size])
+                if not dry_run:
+                    batch_qs = batch_qs.select_for_update()
+                to_update = []
+                for labels in batch_qs.only('id', 'labels_json_str', 'labels_json_data', 'labels_json_compressed',
+                                            'version'):
+                    image_labels = labelling_tool.ImageLabels.from_json(labels.labels_json)
+                    n_before, n_after, label_ious = image_labels.simplify_polygons(
+                        tolerance, compute_iou=compute_iou)
+                    n_vertices_before += n_before
+                    n_vertices_after += n_after
+                    ious.extend(label_ious)
+                    if n_after < n_before:
+                        if not dry_run:
+                            # Patches that clients computed against the unsimplified labels are rejected,
+                            # as the version is incremented
+                            labels.labels_json = image_labels.to_json()
+                            to_update.append(labels)
+                        n_updated += 1
+                    n_processed += 1
+                if len(to_update) > 0:
+                    models.Labels.objects.bulk_update(to_update, update_fields)
+
+        print('{} {}/{} Label models'.format('Would update' if dry_run else 'Updated', n_updated, n_processed))
+        if n_vertices_before > 0:
+            print('Vertices: {} -> {} ({:.1%} reduction)'.format(
+                n_vertices_before, n_vertices_after, 1.0 - n_vertices_after / n_vertices_before))
+        if len(ious) > 0:
+            ious = np.array(ious)
+            print('IoU between original and simplified polygons: mean {:.4f}, min {:.4f}'.format(
+                ious.mean(), ious.min()))
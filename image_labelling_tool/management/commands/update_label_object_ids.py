@@ -17,7 +17,7 @@ class Command(BaseCommand):
         n_updated = 0
         with transaction.atomic():
             for labels in models.Labels.objects.all():
-                labels_js = json.loads(labels.labels_json_str)
+                labels_js = labels.labels_json
                 id_prefix = str(uuid.uuid4())
                 while id_prefix in used_uuids:
                     id_prefix = str(uuid.uuid4())
@@ -25,7 +25,7 @@ class Command(BaseCommand):
                 modified = labelling_tool.ensure_json_object_ids_have_prefix(
                     labels_js, id_prefix=id_prefix)
                 if modified:
-                    labels.labels_json_str = json.dumps(labels_js)
+                    labels.labels_json = labels_js
                     labels.save()
                     n_updated += 1
                 n_processed += 1
@@ -1,15 +1,27 @@
 import datetime
-from django.db import models
-from django.db.models import Q
+from django.conf import settings
+from django.db import models, connections
+from django.db.models import Q, Sum, Min, Max, Count, IntegerField
+from django.db.models.fields.json import KeyTextTransform
+from django.db.models.functions import Cast, Coalesce
 from django.utils import timezone
 
 
-class LabelsManager (models.Manager):
+# Key under which labels with no classification are counted in `Labels.label_class_counts`
+UNCLASSIFIED_KEY = ''
+
+
+class LabelsQuerySet (models.QuerySet):
     def empty(self):
-        return self.filter(labels_json_str='[]')
+        # Labels whose statistics have not been computed yet (see the `backfill_label_stats` command)
+        # are identified by their JSON
+        return self.filter(Q(label_count=0) | Q(label_count=None, labels_json_str='[]'))
 
     def not_empty(self):
-        return self.exclude(labels_json_str='[]')
+        return self.exclude(Q(label_count=0) | Q(label_count=None, labels_json_str='[]'))
+
+    def without_label_stats(self):
+        return self.filter(label_count=None)
 
     def modified_by_user(self, user):
         return self.filter(last_modified_by=user)
@@ -18,11 +30,139 @@ class LabelsManager (models.Manager):
         return self.filter(locked_by=user)
 
     def unlocked(self):
-        return self.filter(self.unlocked_q())
+        return self.filter(LabelsManager.unlocked_q())
 
-    @staticmethod
-    def unlocked_q():
+    def lock(self, to_user, expire_after):
+        """
+        Lock the labels that are not locked by another user to `to_user`, with a single `UPDATE` query.
+        Checking and acquiring the lock in one query ensures that two users cannot both acquire it.
+
+        :param to_user: the user to lock the labels to
+        :param expire_after: the duration of the lock as a `datetime.timedelta`
+        :return: the number of labels locked
+        """
         now = timezone.now()
-        return Q(locked_by=None) | Q(lock_expiry_datetime__gte=now)
+        return self.filter(LabelsManager.unlocked_q() | Q(locked_by=to_user)).update(
+            locked_by=to_user, lock_expiry_datetime=now + expire_after)
+
+    # Not copied to the manager, so that all labels cannot be locked by accident
+    lock.queryset_only = True
+
+    def unlock(self):
+        """
+        Unlock the labels, with a single `UPDATE` query.
+
+        :return: the number of labels unlocked
+        """
+        return self.update(locked_by=None, lock_expiry_datetime=timezone.now())
+
+    unlock.queryset_only = True
+
+    def total_label_count(self):
+        """
+        Get the total number of labels, computed in the database.
+        Labels whose statistics have not been computed are not counted.
+
+        :return: the number of labels as an int
+        """
+        return self.aggregate(n=Coalesce(Sum('label_count'), 0))['n']
+
+    def total_vertex_count(self):
+        """
+        Get the total number of polygon vertices, computed in the database.
+        Labels whose statistics have not been computed are not counted.
+
+        :return: the number of vertices as an int
+        """
+        return self.aggregate(n=Coalesce(Sum('vertex_count'), 0))['n']
 
+    def _query_labels_json_data(self):
+        # Labels stored in `labels_json_data` can be queried directly if the database supports it
+        return getattr(settings, 'LABELLING_TOOL_LABELS_JSON_FIELD', False) and \
+            connections[self.db].features.supports_json_field_contains
 
+    def _label_class_q(self, label_class):
+        key = UNCLASSIFIED_KEY if label_class is None else label_class
+        q = Q(label_class_counts__has_key=key)
+        if self._query_labels_json_data():
+            # Labels whose statistics have not been computed are matched by their JSON
+            q = q | Q(label_count=None, labels_json_data__contains=[{'label_class': label_class}])
+        return q
+
+    def with_label_class(self, label_class):
+        """
+        Filter to labels that include at least one (top-level) label of the given class, in the database.
+        Labels whose statistics have not been computed are excluded, unless they are stored in
+        `labels_json_data` (`settings.LABELLING_TOOL_LABELS_JSON_FIELD` is True) and the database
+        supports JSON containment queries (e.g. PostgreSQL), in which case their labels are searched.
+
+        :param label_class: the label class name, or None for labels with no classification
+        :return: a query set
+        """
+        return self.filter(self._label_class_q(label_class))
+
+    def _label_class_names(self, label_classes):
+        if label_classes is None:
+            label_class_model = self.model._meta.apps.get_model(self.model._meta.app_label, 'LabelClass')
+            label_classes = list(label_class_model.objects.values_list('name', flat=True).distinct())
+            label_classes.append(None)
+        return list(label_classes)
+
+    def count_by_class(self, label_classes=None):
+        """
+        Get the number of `Labels` instances that include at least one label of each class, counted in
+        the database. Labels whose statistics have not been computed are counted as in `with_label_class`.
+
+        :param label_classes: [optional] the names of the label classes to count; if None, count the label
+            classes defined by the `LabelClass` model, along with labels that have no classification
+        :return: a dict mapping label class name to count; labels with no classification are counted under None
+        """
+        label_classes = self._label_class_names(label_classes)
+        if len(label_classes) == 0:
+            return {}
+        aggregates = {}
+        for i, cls in enumerate(label_classes):
+            aggregates['cls_{}'.format(i)] = Count('pk', filter=self._label_class_q(cls))
+        counts = self.aggregate(**aggregates)
+        return {cls: counts['cls_{}'.format(i)] for i, cls in enumerate(label_classes)}
+
+    def label_class_histogram(self, label_classes=None):
+        """
+        Get the number of labels of each class, summed in the database.
+        Labels whose statistics have not been computed are not counted.
+
+        :param label_classes: [optional] the names of the label classes to count; if None, count the label
+            classes defined by the `LabelClass` model, along with labels that have no classification
+        :return: a dict mapping label class name to count; labels with no classification are counted under None
+        """
+        label_classes = self._label_class_names(label_classes)
+        if len(label_classes) == 0:
+            return {}
+        aggregates = {}
+        for i, cls in enumerate(label_classes):
+            key = UNCLASSIFIED_KEY if cls is None else cls
+            count = Cast(KeyTextTransform(key, 'label_class_counts'), IntegerField())
+            aggregates['cls_{}'.format(i)] = Coalesce(Sum(count), 0)
+        counts = self.aggregate(**aggregates)
+        return {cls: counts['cls_{}'.format(i)] for i, cls in enumerate(label_classes)}
+
+    def extent(self):
+        """
+        Get the extent of all labels, computed in the database.
+        Labels whose statistics have not been computed are not included.
+
+        :return: `(x_min, y_min, x_max, y_max)` tuple, or None if no labels have an extent
+        """
+        ext = self.aggregate(x_min=Min('extent_x_min'), y_min=Min('extent_y_min'),
+                             x_max=Max('extent_x_max'), y_max=Max('extent_y_max'))
+        if ext['x_min'] is None:
+            return None
+        return ext['x_min'], ext['y_min'], ext['x_max'], ext['y_max']
+
+
+class LabelsManager (models.Manager.from_queryset(LabelsQuerySet)):
+    @staticmethod
+    def unlocked_q():
+        # Locks are active until their expiry time; see `Labels.is_lock_active`
+        now = timezone.now()
+        return Q(locked_by=None) | Q(lock_expiry_datetime__lte=now)
@@ -0,0 +1,271 @@
+"""Run-length encoded (RLE) masks, compatible with the COCO RLE format.
+
+A COCO RLE mask is a dictionary of the form `{'size': [height, width], 'counts': counts}`, where `counts`
+lists the lengths of alternating runs of 0s and 1s, starting with 0s, with the pixels of the mask visited
+in column-major (Fortran) order. `counts` is either a list of integers (uncompressed RLE) or a string
+(compressed RLE, using the LEB128-like encoding used by the COCO API).
+
+The functions in this module can encode a mask that has been cropped to a window of the image, so that
+instance masks can be encoded without materialising a full size mask, and decode to a window of the image.
+`RLEInstanceMasks` holds a list of instance masks and decodes them on demand.
+"""
+from typing import Any, Sequence, Tuple, List, Dict, Union
+import numpy as np
+
+
+RLEMask = Dict[str, Any]
+Window = Tuple[int, int, int, int]
+
+
+def counts_to_string(counts: Sequence[int]) -> str:
+    """Compress RLE counts to a string using the COCO compressed RLE encoding.
+
+    :param counts: the run lengths
+    :return: compressed counts as a string
+    """
+    chars = []
+    for i, x in enumerate(counts):
+        x = int(x)
+        if i > 2:
+            x -= int(counts[i - 2])
+        more = True
+        while more:
+            c = x & 0x1f
+            x >>= 5
+            more = (x != -1) if (c & 0x10) else (x != 0)
+            if more:
+                c |= 0x20
+            chars.append(chr(c + 48))
+    return ''.join(chars)
+
+
+def string_to_counts(s: Union[str, bytes]) -> List[int]:
+    """Decompress RLE counts from a COCO compressed RLE string.
+
+    :param s: compressed counts as a `str` or `bytes`
+    :return: the run lengths as a list of ints
+    """
+    if isinstance(s, str):
+        s = s.encode('ascii')
+    counts = []
+    p = 0
+    while p < len(s):
+        x = 0
+        k = 0
+        more = True
+        while more:
+            c = s[p] - 48
+            x |= (c & 0x1f) << (5 * k)
+            more = bool(c & 0x20)
+            p += 1
+            k += 1
+            if not more and (c & 0x10):
+                x |= -1 << (5 * k)
+        if len(counts) > 2:
+            x += counts[-2]
+        counts.append(x)
+    return counts
+
+
+def _runs_to_counts(starts: np.ndarray, ends: np.ndarray, n_pixels: int) -> List[int]:
+    # Convert runs of 1s given as [start, end) positions into alternating 0/1 run lengths
+    bounds = np.empty((len(starts) * 2 + 2,), dtype=np.int64)
+    bounds[0] = 0
+    bounds[1:-1:2] = starts
+    bounds[2:-1:2] = ends
+    bounds[-1] = n_pixels
+    counts = np.diff(bounds)
+    if len(counts) > 1 and counts[-1] == 0:
+        counts = counts[:-1]
+    return counts.tolist()
+
+
+def _counts_to_runs(counts: Sequence[int]) -> Tuple[np.ndarray, np.ndarray]:
+    # Convert alternating 0/1 run lengths to runs of 1s given as [start, end) positions
+    bounds = np.cumsum(np.asarray(counts, dtype=np.int64))
+    n_runs = len(bounds) // 2
+    starts = bounds[0:n_runs * 2:2]
+    ends = bounds[1:n_runs * 2:2]
+    return starts, ends
+
+
+def _rle_counts(rle: RLEMask) -> List[int]:
+    counts = rle['counts']
+    if isinstance(counts, (str, bytes)):
+        return string_to_counts(counts)
+    else:
+        return list(counts)
+
+
+def encode(mask: np.ndarray, compress: bool = False) -> RLEMask:
+    """Encode a full size mask as a COCO RLE mask.
+
+    :param mask: mask as a `(height, width)` array
+    :param compress: if True, `counts` will be a compressed string, otherwise a list of ints
+    :return: COCO RLE mask as a dict
+    """
+    height, width = mask.shape
+    return encode_window(mask, (0, 0, height, width), (height, width), compress=compress)
+
+
+def encode_window(mask: np.ndarray, window: Window, image_shape: Tuple[int, int],
+                  compress: bool = False) -> RLEMask:
+    """Encode a mask that covers a window of the image as a COCO RLE mask for the whole image, without
+    constructing a full size mask. Pixels outside the window are background.
+
+    :param mask: mask as a `(y1-y0, x1-x0)` array
+    :param window: the window covered by `mask` as a tuple `(y0, x0, y1, x1)`
+    :param image_shape: `(height, width)` tuple specifying the shape of the image
+    :param compress: if True, `counts` will be a compressed string, otherwise a list of ints
+    :return: COCO RLE mask as a dict
+    """
+    height, width = image_shape
+    y0, x0, y1, x1 = window
+    if mask.shape != (y1 - y0, x1 - x0):
+        raise ValueError('mask shape {} does not match window {}'.format(mask.shape, window))
+    if mask.size > 0:
+        # Walk the mask column by column, with a 0 pad either side of each column so that runs
+        # start and end within each column; runs of 1s cannot span columns in the cropped mask
+        cols = np.zeros((x1 - x0, y1 - y0 + 2), dtype=np.int8)
+        cols[:, 1:-1] = mask.T != 0
+        delta = np.diff(cols, axis=1)
+        start_x, start_y = np.nonzero(delta == 1)
+        end_x, end_y = np.nonzero(delta == -1)
+        starts = (start_x + x0) * height + start_y + y0
+        ends = (end_x + x0) * height + end_y + y0
+        # Merge runs that continue from the bottom of one column to the top of the next
+        if len(starts) > 1:
+            join = ends[:-1] == starts[1:]
+            if join.any():
+                keep_starts = np.append(True, ~join)
+                keep_ends = np.append(~join, True)
+                starts = starts[keep_starts]
+                ends = ends[keep_ends]
+    else:
+        starts = ends = np.zeros((0,), dtype=np.int64)
+    counts = _runs_to_counts(starts, ends, height * width)
+    return {'size': [height, width], 'counts': counts_to_string(counts) if compress else counts}
+
+
+def decode(rle: RLEMask) -> np.ndarray:
+    """Decode a COCO RLE mask.
+
+    :param rle: COCO RLE mask as a dict
+    :return: mask as a `(height, width)` array of dtype bool
+    """
+    height, width = rle['size']
+    return decode_window(rle, (0, 0, height, width))
+
+
+def decode_window(rle: RLEMask, window: Window) -> np.ndarray:
+    """Decode the part of a COCO RLE mask that lies within a window of the image.
+
+    :param rle: COCO RLE mask as a dict
+    :param window: the window to decode as a tuple `(y0, x0, y1, x1)`
+    :return: mask as a `(y1-y0, x1-x0)` array of dtype bool
+    """
+    height, width = rle['size']
+    y0, x0, y1, x1 = window
+    starts, ends = _counts_to_runs(_rle_counts(rle))
+    # Decode the columns spanned by the window in column-major order
+    lo = x0 * height
+    hi = x1 * height
+    starts = np.clip(starts, lo, hi) - lo
+    ends = np.clip(ends, lo, hi) - lo
+    nonempty = ends > starts
+    starts = starts[nonempty]
+    ends = ends[nonempty]
+    delta = np.zeros((hi - lo + 1,), dtype=np.int32)
+    np.add.at(delta, starts, 1)
+    np.add.at(delta, ends, -1)
+    cols = np.cumsum(delta[:-1]).astype(bool).reshape((x1 - x0, height))
+    return cols[:, y0:y1].T
+
+
+def bounding_window(rle: RLEMask) -> Window:
+    """Compute the smallest window of the image that contains all of the pixels of a COCO RLE mask,
+    without decoding it.
+
+    :param rle: COCO RLE mask as a dict
+    :return: the window as a tuple `(y0, x0, y1, x1)`; `(0, 0, 0, 0)` if the mask is empty
+    """
+    height, width = rle['size']
+    starts, ends = _counts_to_runs(_rle_counts(rle))
+    nonempty = ends > starts
+    starts = starts[nonempty]
+    ends = ends[nonempty]
+    if len(starts) == 0:
+        return 0, 0, 0, 0
+    last = ends - 1
+    x0 = int(starts.min() // height)
+    x1 = int(last.max() // height) + 1
+    if (starts // height != last // height).any():
+        # A run wraps from one column to the next, so the mask spans the full height of the image
+        y0, y1 = 0, height
+    else:
+        y0 = int((starts % height).min())
+        y1 = int((last % height).max()) + 1
+    return y0, x0, y1, x1
+
+
+def area(rle: RLEMask) -> int:
+    """Compute the number of pixels covered by a COCO RLE mask.
+
+    :param rle: COCO RLE mask as a dict
+    :return: area in pixels
+    """
+    return int(sum(_rle_counts(rle)[1::2]))
+
+
+class RLEInstanceMasks (Sequence):
+    """A sequence of instance masks stored as COCO RLE masks.
+
+    Masks are decoded on demand when indexed, so that a stack of instance masks never needs to be
+    held in memory in dense form unless `to_dense` is called. The window of the image that contains each
+    mask is stored alongside it so that masks can be decoded cropped to their window using `crop`.
+    """
+    def __init__(self, rles: List[RLEMask], windows: List[Window], image_shape: Tuple[int, int]):
+        if len(rles) != len(windows):
+            raise ValueError('rles and windows should have the same length ({} != {})'.format(
+                len(rles), len(windows)))
+        self.rles = rles
+        self.windows = windows
+        self.image_shape = tuple(image_shape)
+
+    def __len__(self):
+        return len(self.rles)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return RLEInstanceMasks(self.rles[index], self.windows[index], self.image_shape)
+        return decode(self.rles[index])
+
+    def crop(self, index: int) -> Tuple[np.ndarray, Window]:
+        """Decode a mask cropped to its window.
+
+        :param index: the index of the mask
+        :return: tuple `(mask, window)` where `mask` is a boolean mask of shape `(y1-y0, x1-x0)`
+            and window is a tuple `(y0, x0, y1, x1)`
+        """
+        window = self.windows[index]
+        return decode_window(self.rles[index], window), window
+
+    def areas(self) -> np.ndarray:
+        """Compute the area of each mask.
+
+        :return: array of shape `(N,)`
+        """
+        return np.array([area(rle) for rle in self.rles], dtype=np.int64)
+
+    def to_dense(self) -> np.ndarray:
+        """Decode all masks into a multi-channel mask, as produced by
+        `ImageLabels.render_label_instances(multichannel_mask=True)`.
+
+        :return: array of shape `(H, W, N)` with dtype bool
+        """
+        height, width = self.image_shape
+        dense = np.zeros((height, width, len(self)), dtype=bool)
+        for i, window in enumerate(self.windows):
+            y0, x0, y1, x1 = window
+            dense[y0:y1, x0:x1, i] = decode_window(self.rles[i], window)
+        return dense
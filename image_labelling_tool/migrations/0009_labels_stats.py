@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('image_labelling_tool', '0008_auto_20210324_1416'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='labels',
+            name='extent_x_max',
+            field=models.FloatField(default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='labels',
+            name='extent_x_min',
+            field=models.FloatField(default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='labels',
+            name='extent_y_max',
+            field=models.FloatField(default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='labels',
+            name='extent_y_min',
+            field=models.FloatField(default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='labels',
+            name='label_class_counts',
+            field=models.JSONField(default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='labels',
+            name='label_count',
+            field=models.IntegerField(db_index=True, default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='labels',
+            name='vertex_count',
+            field=models.IntegerField(default=None, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('image_labelling_tool', '0009_labels_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='labels',
+            name='labels_json_data',
+            field=models.JSONField(default=None, null=True),
+        ),
+    ]
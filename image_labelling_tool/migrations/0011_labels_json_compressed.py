@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('image_labelling_tool', '0010_labels_json_data'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='labels',
+            name='labels_json_compressed',
+            field=models.BinaryField(default=None, null=True),
+        ),
+    ]
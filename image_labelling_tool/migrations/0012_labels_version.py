@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('image_labelling_tool', '0011_labels_json_compressed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='labels',
+            name='version',
+            field=models.IntegerField(default=0),
+        ),
+    ]
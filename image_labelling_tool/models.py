@@ -1,9 +1,10 @@
-import json, datetime, re
-from django.db import models
+import datetime, re
+import numpy as np
+from django.db import models, transaction
 from django.conf import settings
 from django.utils import timezone
 from django.contrib.auth import get_user_model
-from . import managers
+from . import managers, json_codec, compact_labels, labels_compression, labels_patch, labelling_tool
 from django.core.validators import RegexValidator
 
 _IDENTIFIER_PAT = re.compile(r'[a-zA-Z_][a-zA-Z0-9_]*')
@@ -144,6 +145,10 @@ class LabelsLockedError (Exception):
     pass
 
 
+class LabelsVersionConflictError (Exception):
+    pass
+
+
 class LabellingTask (models.Model):
     enabled = models.BooleanField(default=True)
     name = models.CharField(max_length=256)
@@ -157,9 +162,18 @@ class LabellingTask (models.Model):
         return 'Task {} (identifier {})'.format(self.human_name, self.name)
 
 
+# Fields saved when locking and unlocking labels; saving only these leaves labels saved by other requests intact
+_LOCK_FIELDS = ['locked_by', 'lock_expiry_datetime']
+
+
 class Labels (models.Model):
-    # Label data
+    # Label data, stored as JSON text in `labels_json_str`, or in `labels_json_data` if
+    # `settings.LABELLING_TOOL_LABELS_JSON_FIELD` is True, or compressed in `labels_json_compressed`
+    # if `settings.LABELLING_TOOL_LABELS_COMPRESSION` is set (see `labels_compression`); in the latter
+    # two cases `labels_json_str` is ''. Use the `labels_json` property to access them.
     labels_json_str = models.TextField(default='[]')
+    labels_json_data = models.JSONField(null=True, default=None)
+    labels_json_compressed = models.BinaryField(null=True, default=None)
 
     # Task completion
     completed_tasks = models.ManyToManyField(LabellingTask)
@@ -180,16 +194,181 @@ class Labels (models.Model):
         settings.AUTH_USER_MODEL, models.SET_NULL, related_name='locked_labels', null=True, default=None)
     lock_expiry_datetime = models.DateTimeField(default=datetime.datetime.now)
 
+    # Labels version; incremented whenever labels are assigned via `labels_json`, so that clients
+    # can send patches computed against a known version (see `update_labels`)
+    version = models.IntegerField(default=0)
+
+    # Label statistics, maintained when labels are assigned via `labels_json` (see `update_label_stats`)
+    # so that they can be queried and aggregated in the database. None if not computed yet; use the
+    # `backfill_label_stats` management command to compute them for existing labels.
+    # Number of top-level labels
+    label_count = models.IntegerField(null=True, default=None, db_index=True)
+    # Number of top-level labels of each class as a dict; labels with no classification use the key ''
+    label_class_counts = models.JSONField(null=True, default=None)
+    # Number of polygon vertices, including those of the components of groups
+    vertex_count = models.IntegerField(null=True, default=None)
+    # Bounding extent of the labels; None if there are no labels with a bounding box
+    extent_x_min = models.FloatField(null=True, default=None)
+    extent_y_min = models.FloatField(null=True, default=None)
+    extent_x_max = models.FloatField(null=True, default=None)
+    extent_y_max = models.FloatField(null=True, default=None)
+
     # Manager
     objects = managers.LabelsManager()
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Labels, cls).from_db(db, field_names, values)
+        # Remember the version in the database for `save_if_unchanged`
+        instance._db_version = instance.__dict__.get('version')
+        return instance
+
+    def save_if_unchanged(self):
+        """
+        Save with a single `UPDATE ... WHERE version = <version>`, where the version is that of the labels
+        when this instance was loaded, so that labels saved by another request in the meantime are not
+        overwritten. Instances that were not loaded from the database are saved normally.
+
+        Raises `LabelsVersionConflictError` if the labels were saved by another request.
+        """
+        db_version = getattr(self, '_db_version', None)
+        if self.pk is None or db_version is None:
+            self.save()
+        else:
+            deferred = self.get_deferred_fields()
+            values = {field.attname: getattr(self, field.attname) for field in self._meta.concrete_fields
+                      if not field.primary_key and field.attname not in deferred}
+            n_updated = Labels.objects.filter(pk=self.pk, version=db_version).update(**values)
+            if n_updated == 0:
+                raise LabelsVersionConflictError
+        self._db_version = self.version
+
+    def stored_labels_json_text(self):
+        """
+        Get the labels in JSON text form as stored, decompressed if necessary, without parsing them.
+        They may be compact encoded.
+
+        :return: JSON as a `str` or UTF-8 encoded `bytes`, or None if the labels are stored in `labels_json_data`
+        """
+        if self.labels_json_data is not None:
+            return None
+        elif self.labels_json_compressed is not None:
+            return labels_compression.decompress(self.labels_json_compressed)
+        return self.labels_json_str
+
+    def _stored_labels_js(self):
+        # The labels as stored; compact encoded if they were stored that way
+        if self.labels_json_data is not None:
+            return self.labels_json_data
+        return json_codec.loads(self.stored_labels_json_text())
+
     @property
     def labels_json(self):
-        return json.loads(self.labels_json_str)
+        """
+        Access labels in JSON form.
+
+        The labels decoded from `labels_json_str` or `labels_json_compressed` are cached until it is assigned,
+        so repeated access does not parse them again. The cached value is returned, so modify it in place only
+        if you are going to assign it back to `labels_json`.
+        """
+        if self.labels_json_data is not None:
+            labels_js = self.labels_json_data
+            if compact_labels.is_compact(labels_js):
+                labels_js = compact_labels.decode(labels_js)
+            return labels_js
+        # The stored data is not modified in place, so the cache is valid while it refers to the same object
+        source = self.labels_json_compressed if self.labels_json_compressed is not None else self.labels_json_str
+        cache = getattr(self, '_labels_json_cache', None)
+        if cache is not None and cache[0] is source:
+            return cache[1]
+        labels_js = json_codec.loads(self.stored_labels_json_text())
+        if compact_labels.is_compact(labels_js):
+            labels_js = compact_labels.decode(labels_js)
+        self._labels_json_cache = (source, labels_js)
+        return labels_js
 
     @labels_json.setter
     def labels_json(self, label_js):
-        self.labels_json_str = json.dumps(label_js)
+        if getattr(settings, 'LABELLING_TOOL_LABELS_JSON_FIELD', False):
+            # Stored in plain JSON form in the JSON field, where the database can query it
+            if compact_labels.is_compact(label_js):
+                label_js = compact_labels.decode(label_js)
+            self.labels_json_data = label_js
+            self.labels_json_compressed = None
+            self.labels_json_str = ''
+        else:
+            # Labels are stored compact encoded if `settings.LABELLING_TOOL_COMPACT_LABELS` is True.
+            # Empty label lists are always stored as `'[]'` so that `is_empty` and the manager can identify them.
+            if getattr(settings, 'LABELLING_TOOL_COMPACT_LABELS', False) and compact_labels.n_labels(label_js) > 0:
+                compression = getattr(settings, 'LABELLING_TOOL_COMPACT_LABELS_COMPRESSION', None)
+                if compact_labels.is_compact(label_js):
+                    label_js = compact_labels.recompress(label_js, compression=compression)
+                else:
+                    label_js = compact_labels.encode(label_js, compression=compression)
+            elif compact_labels.is_compact(label_js):
+                label_js = compact_labels.decode(label_js)
+            self.labels_json_data = None
+            compression = getattr(settings, 'LABELLING_TOOL_LABELS_COMPRESSION', None)
+            if compression is not None and compact_labels.n_labels(label_js) > 0:
+                self.labels_json_compressed = labels_compression.compress(json_codec.dumps_bytes(label_js),
+                                                                          compression)
+                self.labels_json_str = ''
+            else:
+                self.labels_json_compressed = None
+                self.labels_json_str = json_codec.dumps(label_js)
+        self.update_label_stats(label_js)
+        self.version += 1
+
+    @staticmethod
+    def compute_label_stats(labels_js):
+        """
+        Compute the label statistics that are stored in the `label_count`, `label_class_counts`, `vertex_count`
+        and `extent_*` fields.
+
+        :param labels_js: labels in JSON form or compact encoded
+        :return: a dict mapping field name to value
+        """
+        image_labels = labelling_tool.ImageLabels.from_json(labels_js)
+        label_class_counts = {}
+        for cls, count in image_labels.label_class_histogram().items():
+            key = managers.UNCLASSIFIED_KEY if cls is None else cls
+            label_class_counts[key] = label_class_counts.get(key, 0) + count
+        vertex_count = sum(lab.n_vertices for lab in image_labels.flatten()
+                           if isinstance(lab, labelling_tool.PolygonLabel))
+        stats = dict(label_count=len(image_labels), label_class_counts=label_class_counts,
+                     vertex_count=vertex_count, extent_x_min=None, extent_y_min=None,
+                     extent_x_max=None, extent_y_max=None)
+        if len(image_labels) > 0:
+            boxes = image_labels.bounding_boxes()
+            boxes = boxes[~np.isnan(boxes).any(axis=1)]
+            if len(boxes) > 0:
+                stats.update(extent_x_min=float(boxes[:, 0].min()), extent_y_min=float(boxes[:, 1].min()),
+                             extent_x_max=float(boxes[:, 2].max()), extent_y_max=float(boxes[:, 3].max()))
+        return stats
+
+    def update_label_stats(self, labels_js=None):
+        """
+        Update the label statistics fields (`label_count`, `label_class_counts`, `vertex_count` and `extent_*`).
+        Called when labels are assigned via `labels_json`; call it after assigning `labels_json_str` directly.
+
+        :param labels_js: [optional] the labels in JSON form or compact encoded, if already available
+        """
+        if labels_js is None:
+            labels_js = self._stored_labels_js()
+        for field_name, value in self.compute_label_stats(labels_js).items():
+            setattr(self, field_name, value)
+
+    @property
+    def labels_compact_json(self):
+        """
+        Access labels compact encoded without compression, e.g. for sending to the client.
+        If the labels are stored compact encoded they are not decoded.
+        """
+        labels_js = self._stored_labels_js()
+        if compact_labels.is_compact(labels_js):
+            return compact_labels.recompress(labels_js, compression=None)
+        else:
+            return compact_labels.encode(labels_js)
 
     @property
     def metadata(self):
@@ -306,7 +485,9 @@ class Labels (models.Model):
         keys = ['creation_date', 'completed_tasks', 'last_modified_by', 'last_modified_datetime']
         kwargs = {key: metadata[key] for key in keys}
 
-        return Labels(labels_json_str=labels_json_str, **kwargs)
+        labels = Labels(labels_json_str=labels_json_str, **kwargs)
+        labels.update_label_stats()
+        return labels
 
     @staticmethod
     def from_labels_json_str_and_metadata_json(labels_json_str, metadata_json):
@@ -314,18 +495,35 @@ class Labels (models.Model):
             labels_json_str, Labels.metadata_json_to_dict(metadata_json))
 
 
+    @property
+    def version_tag(self):
+        """
+        The version of the labels qualified by the ID of this instance, sent to the client as the version
+        that patches are computed against, so that a patch computed against a different `Labels` instance
+        is rejected (see `LabellingToolView.get_labels_for_update`)
+        """
+        return '{}:{}'.format(self.pk, self.version)
+
     @property
     def is_empty(self):
+        if self.label_count is not None:
+            return self.label_count == 0
+        elif self.labels_json_data is not None:
+            return compact_labels.n_labels(self.labels_json_data) == 0
+        elif self.labels_json_compressed is not None:
+            return compact_labels.n_labels(self.labels_json) == 0
         return self.labels_json_str == '[]'
 
     @property
     def label_classes(self):
-        label_classes = [x['label_class']   for x in self.labels_json]
-        return set(label_classes)
+        return set(self.label_class_histogram.keys())
 
     @property
     def label_class_histogram(self):
-        if self.is_empty:
+        if self.label_class_counts is not None:
+            return {(None if cls == managers.UNCLASSIFIED_KEY else cls): count
+                    for cls, count in self.label_class_counts.items()}
+        elif self.is_empty:
             return {}
         else:
             histogram = {}
@@ -334,16 +532,28 @@ class Labels (models.Model):
                 histogram[cls] = histogram.get(cls, 0) + 1
             return histogram
 
-    def update_labels(self, labels_json, completed_tasks, time_elapsed, user, save=False, check_lock=False):
+    def update_labels(self, labels_json, completed_tasks, time_elapsed, user, save=False, check_lock=False,
+                      patch_json=None):
         """
         Update labels, normally called by Django views that are responding to user input received from the client
 
-        :param labels_json: labels in JSON form
+        :param labels_json: labels in JSON form; None if `patch_json` is given
         :param completed_tasks: sequence of LabellingTask instances
         :param time_elapsed: labelling time elapsed
         :param user: user account being used to edit the labels
-        :param save: if `True`, invoke `self.save()` afterwards
+        :param save: if `True`, invoke `self.save_if_unchanged()` afterwards, raising `LabelsVersionConflictError`
+            if the labels were saved by another request since this instance was loaded, in which case the
+            completed tasks are not changed either. If `False`, the completed tasks are written to the database
+            immediately; call `save_if_unchanged` within the same `transaction.atomic()` block so that they
+            are rolled back if it fails.
         :param check_lock: if `True`, raise `LabelsLockedError` if this labels instance is locked by another user
+        :param patch_json: [optional] a patch in JSON form (see the `labels_patch` module) to apply to the
+            current labels instead of replacing them with `labels_json`. Raises `LabelsVersionConflictError` if
+            its base version is an earlier version of these labels, i.e. they have been changed by another user
+            since the client received them. Raises `labels_patch.LabelsPatchConflictError` if the patch cannot
+            be applied, in which case the client should send a replacement patch. A replacement patch whose
+            base version refers to a different `Labels` instance (see `LabellingToolView.get_labels_for_update`)
+            is applied, as there is no earlier version to compare against.
         """
         # Verify time elapsed is within the bounds of possibility
         current_time = timezone.now()
@@ -363,15 +573,29 @@ class Labels (models.Model):
         if check_lock:
             if self.is_locked_to(user):
                 raise LabelsLockedError
+        if patch_json is not None:
+            base_version = patch_json['base_version']
+            if base_version != self.version_tag:
+                if str(base_version).split(':')[0] == str(self.pk):
+                    # The client's labels are based on an earlier version of these labels
+                    raise LabelsVersionConflictError
+                elif not labels_patch.is_replacement(patch_json):
+                    raise labels_patch.LabelsPatchConflictError(
+                        'Patch base version {} refers to different labels'.format(base_version))
+            labels_json = labels_patch.apply_patch(self.labels_json, patch_json)
         self.labels_json = labels_json
-        self.completed_tasks.set(completed_tasks)
         if user.is_authenticated:
             self.last_modified_by = user
         else:
             self.last_modified_by = None
         self.last_modified_datetime = timezone.now()
         if save:
-            self.save()
+            # Roll back the change to the completed tasks if the labels were saved by another request
+            with transaction.atomic():
+                self.completed_tasks.set(completed_tasks)
+                self.save_if_unchanged()
+        else:
+            self.completed_tasks.set(completed_tasks)
 
     def is_lock_active(self):
         return timezone.now() < self.lock_expiry_datetime and self.locked_by is not None
@@ -394,7 +618,7 @@ class Labels (models.Model):
         expiry = timezone.now() + expire_after
         self.lock_expiry_datetime = expiry
         if save:
-            self.save()
+            self.save(update_fields=_LOCK_FIELDS)
 
     def refresh_lock(self, to_user, expire_after, save=False):
         if self.is_lock_active():
@@ -405,7 +629,7 @@ class Labels (models.Model):
         expiry = timezone.now() + expire_after
         self.lock_expiry_datetime = expiry
         if save:
-            self.save()
+            self.save(update_fields=_LOCK_FIELDS)
 
     def unlock(self, from_user, save=False):
         if self.is_lock_active():
@@ -416,7 +640,7 @@ class Labels (models.Model):
             self.locked_by = None
             self.lock_expiry_datetime = timezone.now()
             if save:
-                self.save()
+                self.save(update_fields=_LOCK_FIELDS)
 
     def __str__(self):
         if self.last_modified_by is not None:
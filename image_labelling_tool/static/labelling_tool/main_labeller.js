@@ -61,6 +61,166 @@ var labelling_tool;
             labels: labels,
             session_id: label_header.session_id };
     };
+    labelling_tool.is_compact_labels = function (labels) {
+        return labels !== undefined && labels !== null && !Array.isArray(labels) &&
+            labels.compact_labels !== undefined;
+    };
+    labelling_tool.decode_compact_labels = function (compact) {
+        if (compact.compression !== undefined && compact.compression !== null) {
+            throw 'Compressed compact labels are not supported (compression=' + compact.compression + ')';
+        }
+        var float64 = compact.vertex_dtype === 'float64';
+        var bytes_per_vertex = float64 ? 16 : 8;
+        var binary = atob(compact.vertices);
+        var view = new DataView(new ArrayBuffer(binary.length));
+        for (var i = 0; i < binary.length; i++) {
+            view.setUint8(i, binary.charCodeAt(i));
+        }
+        var vertex_index = 0;
+        var decode_label = function (label) {
+            if (label.region_sizes !== undefined) {
+                var decoded = {};
+                for (var key in label) {
+                    if (key !== 'region_sizes') {
+                        decoded[key] = label[key];
+                    }
+                }
+                decoded.regions = [];
+                for (var region_i = 0; region_i < label.region_sizes.length; region_i++) {
+                    var region = [];
+                    for (var j = 0; j < label.region_sizes[region_i]; j++) {
+                        var offset = vertex_index * bytes_per_vertex;
+                        if (float64) {
+                            region.push({ x: view.getFloat64(offset, true), y: view.getFloat64(offset + 8, true) });
+                        }
+                        else {
+                            region.push({ x: view.getFloat32(offset, true), y: view.getFloat32(offset + 4, true) });
+                        }
+                        vertex_index += 1;
+                    }
+                    decoded.regions.push(region);
+                }
+                return decoded;
+            }
+            else if (label.component_models !== undefined) {
+                var decoded = {};
+                for (var key in label) {
+                    decoded[key] = label[key];
+                }
+                decoded.component_models = label.component_models.map(decode_label);
+                return decoded;
+            }
+            return label;
+        };
+        return compact.labels.map(decode_label);
+    };
+    labelling_tool.encode_compact_labels = function (labels) {
+        var regions = [];
+        var encode_label = function (label) {
+            if (label.label_type === 'polygon' && label.regions !== undefined) {
+                var encoded = {};
+                for (var key in label) {
+                    if (key !== 'regions') {
+                        encoded[key] = label[key];
+                    }
+                }
+                encoded.region_sizes = [];
+                for (var region_i = 0; region_i < label.regions.length; region_i++) {
+                    regions.push(label.regions[region_i]);
+                    encoded.region_sizes.push(label.regions[region_i].length);
+                }
+                return encoded;
+            }
+            else if (label.component_models !== undefined) {
+                var encoded = {};
+                for (var key in label) {
+                    encoded[key] = label[key];
+                }
+                encoded.component_models = label.component_models.map(encode_label);
+                return encoded;
+            }
+            return label;
+        };
+        var compact_labels = labels.map(encode_label);
+        var n_vertices = 0;
+        for (var region_i = 0; region_i < regions.length; region_i++) {
+            n_vertices += regions[region_i].length;
+        }
+        var view = new DataView(new ArrayBuffer(n_vertices * 8));
+        var offset = 0;
+        for (var region_i = 0; region_i < regions.length; region_i++) {
+            var region = regions[region_i];
+            for (var j = 0; j < region.length; j++) {
+                view.setFloat32(offset, region[j].x, true);
+                view.setFloat32(offset + 4, region[j].y, true);
+                offset += 8;
+            }
+        }
+        // Build the binary string in chunks; `String.fromCharCode` has a limit on the number of arguments
+        var bytes = new Uint8Array(view.buffer);
+        var chunks = [];
+        for (var i = 0; i < bytes.length; i += 8192) {
+            chunks.push(String.fromCharCode.apply(null, bytes.subarray(i, i + 8192)));
+        }
+        return { compact_labels: 1, labels: compact_labels, vertex_dtype: 'float32', compression: null,
+            vertices: btoa(chunks.join('')) };
+    };
+    labelling_tool.make_labels_snapshot = function (labels) {
+        var object_ids = [];
+        var label_strs = {};
+        for (var i = 0; i < labels.length; i++) {
+            var object_id = labels[i].object_id;
+            if (object_id === undefined || object_id === null || label_strs.hasOwnProperty(object_id)) {
+                // Labels without unique object IDs cannot be patched
+                return null;
+            }
+            object_ids.push(object_id);
+            label_strs[object_id] = JSON.stringify(labels[i]);
+        }
+        return { object_ids: object_ids, label_strs: label_strs };
+    };
+    labelling_tool.make_labels_patch = function (base, base_version, labels, current) {
+        if (base === null || current === null) {
+            return null;
+        }
+        var deleted = [];
+        var expected_order = [];
+        for (var i = 0; i < base.object_ids.length; i++) {
+            var object_id = base.object_ids[i];
+            if (current.label_strs.hasOwnProperty(object_id)) {
+                expected_order.push(object_id);
+            }
+            else {
+                deleted.push(object_id);
+            }
+        }
+        var changed = [];
+        for (var i = 0; i < labels.length; i++) {
+            var object_id = current.object_ids[i];
+            if (!base.label_strs.hasOwnProperty(object_id)) {
+                expected_order.push(object_id);
+                changed.push(labels[i]);
+            }
+            else if (base.label_strs[object_id] !== current.label_strs[object_id]) {
+                changed.push(labels[i]);
+            }
+        }
+        // The server modifies labels in place and appends new labels, so the patch must preserve their order
+        for (var i = 0; i < expected_order.length; i++) {
+            if (expected_order[i] !== current.object_ids[i]) {
+                return null;
+            }
+        }
+        return { base_version: base_version, set: changed, delete: deleted };
+    };
+    labelling_tool.label_header_with_patch = function (label_header, patch) {
+        return { image_id: label_header.image_id,
+            completed_tasks: label_header.completed_tasks,
+            timeElapsed: label_header.timeElapsed,
+            state: label_header.state,
+            labels_patch: patch,
+            session_id: label_header.session_id };
+    };
     /*
    Labelling tool view; links to the server side data structures
     */
@@ -83,7 +243,15 @@ var labelling_tool;
                 asynchronously send modified labels for storage. When the response to the request is
                 available(e.g. when the HTTP request succeeds), reply by invoking the `notifyLabelUpdateResponse`
                 method, passing a message of the form `{error: undefined}` if everything is okay,
-                or `{error: 'locked'}` to indicate that these labels are locked
+                or `{error: 'locked'}` to indicate that these labels are locked.
+                If the label header given to `loadLabels` has a `version`, `label_header` may have a
+                `labels_patch` entry (see `LabelsPatchModel`) describing only the labels that changed in place
+                of `labels`. Reply with `{error: undefined, version: <new version>}` if the update succeeded,
+                `{error: 'patch_conflict'}` if the patch could not be applied, in which case the complete labels
+                will be sent, or `{error: 'version_conflict'}` if the labels were changed by another user,
+                in which case the user is asked whether to reload the labels or overwrite them.
+                Updates are sent one at a time; invoke `notifyLabelUpdateResponse` with an error if the
+                request fails.
             getUnlockedImageIDCallback: (optional, can be null) a function of the form
                 `function(image_id_list)` that the annotator uses to asynchronously request the ID of the next
                 available unlocked image, chosen from the list of image IDs provided as an argument.
@@ -242,6 +410,14 @@ var labelling_tool;
             this._pushDataTimeout = null;
             // Frozen flag; while frozen, data will not be sent to backend
             this.frozen = false;
+            // Compact labels flag; if the server sends compact encoded labels, send them back compact encoded
+            this._compact_labels = false;
+            // Label update state for the labels that are loaded (see `LabelsPushState`), the update awaiting
+            // a response and those waiting to be sent. Updates are sent one at a time, so that each patch is
+            // computed against the version produced by the previous update.
+            this._labels_push_state = null;
+            this._push_in_flight = null;
+            this._push_queue = [];
             this._lockableControls = $('.anno_lockable');
             /*
              *
@@ -920,6 +1096,7 @@ var labelling_tool;
                 labels: [],
                 session_id: labelling_tool.ObjectIDTable.uuidv4(),
             });
+            this._reset_labels_patch_state(null);
             this._resetStopwatch();
             for (var task_name in self._task_checkboxes) {
                 var task_check = self._task_checkboxes[task_name];
@@ -936,8 +1113,14 @@ var labelling_tool;
         };
         DjangoLabeller.prototype.loadLabels = function (label_header) {
             var self = this;
+            // Decode compact encoded labels
+            this._compact_labels = labelling_tool.is_compact_labels(label_header.labels);
+            if (this._compact_labels) {
+                label_header = labelling_tool.replace_label_header_labels(label_header, labelling_tool.decode_compact_labels(label_header.labels));
+            }
             // Update the image SVG element
             this.root_view.set_model(label_header);
+            this._reset_labels_patch_state(label_header.version);
             this._resetStopwatch();
             this._update_image_index_input_by_id(this.root_view.model.image_id);
             if (this.root_view.model.state === 'locked') {
@@ -979,8 +1162,14 @@ var labelling_tool;
             else {
                 this._image_initialised = false;
             }
+            // Decode compact encoded labels
+            this._compact_labels = labelling_tool.is_compact_labels(label_header.labels);
+            if (this._compact_labels) {
+                label_header = labelling_tool.replace_label_header_labels(label_header, labelling_tool.decode_compact_labels(label_header.labels));
+            }
             // Update the image SVG element
             this.root_view.set_model(label_header);
+            this._reset_labels_patch_state(label_header.version);
             this._resetStopwatch();
             this._update_image_index_input_by_id(this.root_view.model.image_id);
             if (this.root_view.model.state === 'locked') {
@@ -1083,13 +1272,61 @@ var labelling_tool;
             }
         };
         DjangoLabeller.prototype.notifyLabelUpdateResponse = function (msg) {
+            var state = this._push_in_flight;
+            this._push_in_flight = null;
             if (msg.error === undefined) {
                 // All good
+                if (state !== null && msg.version !== undefined) {
+                    // Subsequent patches are computed against the labels that were sent
+                    state.version = msg.version;
+                    state.base = state.sent;
+                    state.overwrite = false;
+                }
             }
             else if (msg.error === 'locked') {
                 // Lock controls
                 this.lockLabels();
             }
+            else if (msg.error === 'patch_conflict') {
+                if (state !== null) {
+                    if (state.sent_replacement) {
+                        // The server no longer accepts patches
+                        state.version = null;
+                    }
+                    else {
+                        // Send all of the labels
+                        state.send_replacement = true;
+                    }
+                    this._enqueue_push(state);
+                }
+            }
+            else if (msg.error === 'version_conflict') {
+                if (state !== null) {
+                    this._resolve_version_conflict(state);
+                }
+            }
+            this._send_next_push();
+        };
+        DjangoLabeller.prototype._resolve_version_conflict = function (state) {
+            // The labels were changed by another user since the labels being edited were loaded
+            var is_current = state === this._labels_push_state;
+            var discard = confirm('The labels for image ' + state.header.image_id + ' have been changed by ' +
+                'another user since you loaded them.\n\nPress OK to discard your changes' +
+                (is_current ? ' and reload the labels' : '') + ' or Cancel to overwrite their changes with yours.');
+            if (discard) {
+                state.discarded = true;
+                var index = this._push_queue.indexOf(state);
+                if (index !== -1) {
+                    this._push_queue.splice(index, 1);
+                }
+                if (is_current) {
+                    this._requestLabelsCallback(state.header.image_id);
+                }
+            }
+            else {
+                state.overwrite = true;
+                this._enqueue_push(state);
+            }
         };
         DjangoLabeller.prototype.notifyStopwatchChanges = function () {
             var self = this;
@@ -1280,13 +1517,69 @@ var labelling_tool;
         DjangoLabeller.prototype.thaw = function () {
             this.frozen = false;
         };
+        DjangoLabeller.prototype._reset_labels_patch_state = function (version) {
+            // Patches are computed against the labels that were loaded, if the server provided their version.
+            // Updates to previously loaded labels that are waiting to be sent are still sent.
+            var has_version = version !== undefined && version !== null;
+            this._labels_push_state = {
+                header: this.root_view.model,
+                version: has_version ? version : null,
+                base: has_version ? labelling_tool.make_labels_snapshot(labelling_tool.get_label_header_labels(this.root_view.model)) : null,
+                sent: null,
+                sent_replacement: false,
+                send_replacement: false,
+                overwrite: false,
+                discarded: false,
+                compact: this._compact_labels
+            };
+        };
+        DjangoLabeller.prototype._enqueue_push = function (state) {
+            if (this._push_queue.indexOf(state) === -1) {
+                this._push_queue.push(state);
+            }
+        };
+        DjangoLabeller.prototype._send_next_push = function () {
+            if (this._push_in_flight !== null || this._push_queue.length === 0) {
+                return;
+            }
+            var state = this._push_queue.shift();
+            var label_header = state.header;
+            var labels = labelling_tool.get_label_header_labels(label_header);
+            var snapshot = labelling_tool.make_labels_snapshot(labels);
+            state.sent_replacement = false;
+            if (state.version !== null && !state.overwrite) {
+                var patch = null;
+                if (!state.send_replacement) {
+                    patch = labelling_tool.make_labels_patch(state.base, state.version, labels, snapshot);
+                }
+                if (patch === null) {
+                    // Send all of the labels along with the version that they are based on
+                    patch = { base_version: state.version,
+                        labels: state.compact ? labelling_tool.encode_compact_labels(labels) : labels };
+                    state.sent_replacement = true;
+                }
+                label_header = labelling_tool.label_header_with_patch(label_header, patch);
+            }
+            else if (state.compact) {
+                label_header = labelling_tool.replace_label_header_labels(label_header, labelling_tool.encode_compact_labels(labels));
+            }
+            state.send_replacement = false;
+            state.sent = snapshot;
+            this._push_in_flight = state;
+            this._sendLabelHeaderFn(label_header);
+        };
         DjangoLabeller.prototype.queue_push_label_data = function () {
             var _this = this;
             if (!this.frozen) {
                 if (this._pushDataTimeout === null) {
                     this._pushDataTimeout = setTimeout(function () {
                         _this._pushDataTimeout = null;
-                        _this._sendLabelHeaderFn(_this.root_view.model);
+                        var state = _this._labels_push_state;
+                        if (state !== null && !state.discarded) {
+                            state.header = _this.root_view.model;
+                            _this._enqueue_push(state);
+                            _this._send_next_push();
+                        }
                     }, 0);
                 }
             }
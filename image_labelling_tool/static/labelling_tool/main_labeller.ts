@@ -68,23 +68,25 @@ module labelling_tool {
     export interface LabelHeaderModel {
         image_id: string,
         completed_tasks: string[],
-        labels: any[],
+        labels: any[] | CompactLabelsModel,
         timeElapsed: number,
         state: string,
         session_id: string,
+        version?: any,
     }
 
-    export var get_label_header_labels = function(label_header: LabelHeaderModel) {
+    export var get_label_header_labels = function(label_header: LabelHeaderModel): any[] {
         var labels = label_header.labels;
         if (labels === undefined || labels === null) {
             return [];
         }
         else {
-            return labels;
+            return <any[]>labels;
         }
     };
 
-    export var replace_label_header_labels = function(label_header: LabelHeaderModel, labels: any[]): LabelHeaderModel {
+    export var replace_label_header_labels = function(label_header: LabelHeaderModel,
+                                                      labels: any[] | CompactLabelsModel): LabelHeaderModel {
         return {image_id: label_header.image_id,
                 completed_tasks: label_header.completed_tasks,
                 timeElapsed: label_header.timeElapsed,
@@ -93,6 +95,237 @@ module labelling_tool {
                 session_id: label_header.session_id};
     };
 
+    /*
+    Compact encoded labels
+
+    The server may send labels in the compact encoding defined by the Python `compact_labels` module.
+    The vertices of all polygon labels are stored in a single base64 encoded block of little-endian floats
+    and the `regions` of each polygon label are replaced by `region_sizes`, the number of vertices in each region.
+    The vertices are stored in the order in which the polygon labels appear in a depth-first traversal of the
+    labels, including the components of group labels.
+     */
+    export interface CompactLabelsModel {
+        compact_labels: number,
+        labels: any[],
+        vertex_dtype: string,
+        compression: string,
+        vertices: string,
+    }
+
+    export var is_compact_labels = function(labels: any): boolean {
+        return labels !== undefined && labels !== null && !Array.isArray(labels) &&
+            labels.compact_labels !== undefined;
+    };
+
+    export var decode_compact_labels = function(compact: CompactLabelsModel): any[] {
+        if (compact.compression !== undefined && compact.compression !== null) {
+            throw 'Compressed compact labels are not supported (compression=' + compact.compression + ')';
+        }
+        let float64 = compact.vertex_dtype === 'float64';
+        let bytes_per_vertex = float64 ? 16 : 8;
+        let binary = atob(compact.vertices);
+        let view = new DataView(new ArrayBuffer(binary.length));
+        for (var i = 0; i < binary.length; i++) {
+            view.setUint8(i, binary.charCodeAt(i));
+        }
+        var vertex_index = 0;
+        let decode_label = function(label: any): any {
+            if (label.region_sizes !== undefined) {
+                let decoded: any = {};
+                for (var key in label) {
+                    if (key !== 'region_sizes') {
+                        decoded[key] = label[key];
+                    }
+                }
+                decoded.regions = [];
+                for (var region_i = 0; region_i < label.region_sizes.length; region_i++) {
+                    let region: Vector2[] = [];
+                    for (var j = 0; j < label.region_sizes[region_i]; j++) {
+                        let offset = vertex_index * bytes_per_vertex;
+                        if (float64) {
+                            region.push({x: view.getFloat64(offset, true), y: view.getFloat64(offset + 8, true)});
+                        }
+                        else {
+                            region.push({x: view.getFloat32(offset, true), y: view.getFloat32(offset + 4, true)});
+                        }
+                        vertex_index += 1;
+                    }
+                    decoded.regions.push(region);
+                }
+                return decoded;
+            }
+            else if (label.component_models !== undefined) {
+                let decoded: any = {};
+                for (var key in label) {
+                    decoded[key] = label[key];
+                }
+                decoded.component_models = label.component_models.map(decode_label);
+                return decoded;
+            }
+            return label;
+        };
+        return compact.labels.map(decode_label);
+    };
+
+    export var encode_compact_labels = function(labels: any[]): CompactLabelsModel {
+        let regions: Vector2[][] = [];
+        let encode_label = function(label: any): any {
+            if (label.label_type === 'polygon' && label.regions !== undefined) {
+                let encoded: any = {};
+                for (var key in label) {
+                    if (key !== 'regions') {
+                        encoded[key] = label[key];
+                    }
+                }
+                encoded.region_sizes = [];
+                for (var region_i = 0; region_i < label.regions.length; region_i++) {
+                    regions.push(label.regions[region_i]);
+                    encoded.region_sizes.push(label.regions[region_i].length);
+                }
+                return encoded;
+            }
+            else if (label.component_models !== undefined) {
+                let encoded: any = {};
+                for (var key in label) {
+                    encoded[key] = label[key];
+                }
+                encoded.component_models = label.component_models.map(encode_label);
+                return encoded;
+            }
+            return label;
+        };
+        let compact_labels = labels.map(encode_label);
+
+        var n_vertices = 0;
+        for (var region_i = 0; region_i < regions.length; region_i++) {
+            n_vertices += regions[region_i].length;
+        }
+        let view = new DataView(new ArrayBuffer(n_vertices * 8));
+        var offset = 0;
+        for (var region_i = 0; region_i < regions.length; region_i++) {
+            let region = regions[region_i];
+            for (var j = 0; j < region.length; j++) {
+                view.setFloat32(offset, region[j].x, true);
+                view.setFloat32(offset + 4, region[j].y, true);
+                offset += 8;
+            }
+        }
+        // Build the binary string in chunks; `String.fromCharCode` has a limit on the number of arguments
+        let bytes = new Uint8Array(view.buffer);
+        let chunks: string[] = [];
+        for (var i = 0; i < bytes.length; i += 8192) {
+            chunks.push(String.fromCharCode.apply(null, bytes.subarray(i, i + 8192)));
+        }
+        return {compact_labels: 1, labels: compact_labels, vertex_dtype: 'float32', compression: null,
+                vertices: btoa(chunks.join(''))};
+    };
+
+    /*
+    Labels patches
+
+    Rather than sending all of the labels whenever they are edited, send a patch that describes the labels
+    that were added, modified or deleted relative to the labels of a version provided by the server,
+    identified by object ID. When the changes cannot be expressed as a patch, send a replacement patch that
+    has all of the labels in `labels`. See the Python `labels_patch` module.
+     */
+    export interface LabelsPatchModel {
+        base_version: any,
+        set?: any[],
+        delete?: string[],
+        labels?: any[] | CompactLabelsModel,
+    }
+
+    /*
+    The object IDs and JSON text of a list of labels, used to determine which labels have changed
+     */
+    export interface LabelsSnapshot {
+        object_ids: string[],
+        label_strs: {[object_id: string]: string},
+    }
+
+    export var make_labels_snapshot = function(labels: any[]): LabelsSnapshot {
+        let object_ids: string[] = [];
+        let label_strs: {[object_id: string]: string} = {};
+        for (var i = 0; i < labels.length; i++) {
+            let object_id = labels[i].object_id;
+            if (object_id === undefined || object_id === null || label_strs.hasOwnProperty(object_id)) {
+                // Labels without unique object IDs cannot be patched
+                return null;
+            }
+            object_ids.push(object_id);
+            label_strs[object_id] = JSON.stringify(labels[i]);
+        }
+        return {object_ids: object_ids, label_strs: label_strs};
+    };
+
+    export var make_labels_patch = function(base: LabelsSnapshot, base_version: any,
+                                            labels: any[], current: LabelsSnapshot): LabelsPatchModel {
+        if (base === null || current === null) {
+            return null;
+        }
+        let deleted: string[] = [];
+        let expected_order: string[] = [];
+        for (var i = 0; i < base.object_ids.length; i++) {
+            let object_id = base.object_ids[i];
+            if (current.label_strs.hasOwnProperty(object_id)) {
+                expected_order.push(object_id);
+            }
+            else {
+                deleted.push(object_id);
+            }
+        }
+        let changed: any[] = [];
+        for (var i = 0; i < labels.length; i++) {
+            let object_id = current.object_ids[i];
+            if (!base.label_strs.hasOwnProperty(object_id)) {
+                expected_order.push(object_id);
+                changed.push(labels[i]);
+            }
+            else if (base.label_strs[object_id] !== current.label_strs[object_id]) {
+                changed.push(labels[i]);
+            }
+        }
+        // The server modifies labels in place and appends new labels, so the patch must preserve their order
+        for (var i = 0; i < expected_order.length; i++) {
+            if (expected_order[i] !== current.object_ids[i]) {
+                return null;
+            }
+        }
+        return {base_version: base_version, set: changed, delete: deleted};
+    };
+
+    /*
+    The state of the updates sent to the server for the labels of one image
+     */
+    interface LabelsPushState {
+        // The label header, updated whenever an update is queued
+        header: LabelHeaderModel,
+        // The version of the labels on the server that the labels being edited are based on and their snapshot;
+        // null if the server does not provide versions
+        version: any,
+        base: LabelsSnapshot,
+        // Snapshot of the labels in the update awaiting a response and whether it was a replacement patch
+        sent: LabelsSnapshot,
+        sent_replacement: boolean,
+        // Send a replacement patch rather than a patch
+        send_replacement: boolean,
+        // Send the labels without a base version, overwriting changes made by another user
+        overwrite: boolean,
+        // The user chose to discard their changes
+        discarded: boolean,
+        // Send the labels compact encoded
+        compact: boolean,
+    }
+
+    export var label_header_with_patch = function(label_header: LabelHeaderModel, patch: LabelsPatchModel): any {
+        return {image_id: label_header.image_id,
+                completed_tasks: label_header.completed_tasks,
+                timeElapsed: label_header.timeElapsed,
+                state: label_header.state,
+                labels_patch: patch,
+                session_id: label_header.session_id};
+    };
+
     /*
     DEXTR labels
      */
@@ -145,6 +378,10 @@ module labelling_tool {
 
         private _pushDataTimeout: any;
         private frozen: boolean;
+        private _compact_labels: boolean;
+        private _labels_push_state: LabelsPushState;
+        private _push_in_flight: LabelsPushState;
+        private _push_queue: LabelsPushState[];
 
         private _colour_scheme_selector_menu: JQuery;
         private _label_class_selector_select: JQuery = null;
@@ -196,7 +433,15 @@ module labelling_tool {
                 asynchronously send modified labels for storage. When the response to the request is
                 available(e.g. when the HTTP request succeeds), reply by invoking the `notifyLabelUpdateResponse`
                 method, passing a message of the form `{error: undefined}` if everything is okay,
-                or `{error: 'locked'}` to indicate that these labels are locked
+                or `{error: 'locked'}` to indicate that these labels are locked.
+                If the label header given to `loadLabels` has a `version`, `label_header` may have a
+                `labels_patch` entry (see `LabelsPatchModel`) describing only the labels that changed in place
+                of `labels`. Reply with `{error: undefined, version: <new version>}` if the update succeeded,
+                `{error: 'patch_conflict'}` if the patch could not be applied, in which case the complete labels
+                will be sent, or `{error: 'version_conflict'}` if the labels were changed by another user,
+                in which case the user is asked whether to reload the labels or overwrite them.
+                Updates are sent one at a time; invoke `notifyLabelUpdateResponse` with an error if the
+                request fails.
             getUnlockedImageIDCallback: (optional, can be null) a function of the form
                 `function(image_id_list)` that the annotator uses to asynchronously request the ID of the next
                 available unlocked image, chosen from the list of image IDs provided as an argument.
@@ -379,6 +624,14 @@ module labelling_tool {
             this._pushDataTimeout = null;
             // Frozen flag; while frozen, data will not be sent to backend
             this.frozen = false;
+            // Compact labels flag; if the server sends compact encoded labels, send them back compact encoded
+            this._compact_labels = false;
+            // Label update state for the labels that are loaded (see `LabelsPushState`), the update awaiting
+            // a response and those waiting to be sent. Updates are sent one at a time, so that each patch is
+            // computed against the version produced by the previous update.
+            this._labels_push_state = null;
+            this._push_in_flight = null;
+            this._push_queue = [];
 
 
             this._lockableControls = $('.anno_lockable');
@@ -1179,6 +1432,7 @@ module labelling_tool {
                 labels: [],
                 session_id: ObjectIDTable.uuidv4(),
             });
+            this._reset_labels_patch_state(null);
             this._resetStopwatch();
             for (let task_name in self._task_checkboxes) {
                 let task_check: JQuery = self._task_checkboxes[task_name];
@@ -1199,8 +1453,16 @@ module labelling_tool {
         loadLabels(label_header: LabelHeaderModel) {
             var self = this;
 
+            // Decode compact encoded labels
+            this._compact_labels = is_compact_labels(label_header.labels);
+            if (this._compact_labels) {
+                label_header = replace_label_header_labels(
+                    label_header, decode_compact_labels(<CompactLabelsModel>label_header.labels));
+            }
+
             // Update the image SVG element
             this.root_view.set_model(label_header);
+            this._reset_labels_patch_state(label_header.version);
             this._resetStopwatch();
 
             this._update_image_index_input_by_id(this.root_view.model.image_id);
@@ -1246,8 +1508,16 @@ module labelling_tool {
                 this._image_initialised = false;
             }
 
+            // Decode compact encoded labels
+            this._compact_labels = is_compact_labels(label_header.labels);
+            if (this._compact_labels) {
+                label_header = replace_label_header_labels(
+                    label_header, decode_compact_labels(<CompactLabelsModel>label_header.labels));
+            }
+
             // Update the image SVG element
             this.root_view.set_model(label_header);
+            this._reset_labels_patch_state(label_header.version);
             this._resetStopwatch();
 
             this._update_image_index_input_by_id(this.root_view.model.image_id);
@@ -1361,13 +1631,64 @@ module labelling_tool {
         }
 
         notifyLabelUpdateResponse(msg: any) {
+            let state = this._push_in_flight;
+            this._push_in_flight = null;
+
             if (msg.error === undefined) {
                 // All good
+                if (state !== null && msg.version !== undefined) {
+                    // Subsequent patches are computed against the labels that were sent
+                    state.version = msg.version;
+                    state.base = state.sent;
+                    state.overwrite = false;
+                }
             }
             else if (msg.error === 'locked') {
                 // Lock controls
                 this.lockLabels();
             }
+            else if (msg.error === 'patch_conflict') {
+                if (state !== null) {
+                    if (state.sent_replacement) {
+                        // The server no longer accepts patches
+                        state.version = null;
+                    }
+                    else {
+                        // Send all of the labels
+                        state.send_replacement = true;
+                    }
+                    this._enqueue_push(state);
+                }
+            }
+            else if (msg.error === 'version_conflict') {
+                if (state !== null) {
+                    this._resolve_version_conflict(state);
+                }
+            }
+
+            this._send_next_push();
+        }
+
+        _resolve_version_conflict(state: LabelsPushState) {
+            // The labels were changed by another user since the labels being edited were loaded
+            let is_current = state === this._labels_push_state;
+            let discard = confirm('The labels for image ' + state.header.image_id + ' have been changed by ' +
+                'another user since you loaded them.\n\nPress OK to discard your changes' +
+                (is_current ? ' and reload the labels' : '') + ' or Cancel to overwrite their changes with yours.');
+            if (discard) {
+                state.discarded = true;
+                let index = this._push_queue.indexOf(state);
+                if (index !== -1) {
+                    this._push_queue.splice(index, 1);
+                }
+                if (is_current) {
+                    this._requestLabelsCallback(state.header.image_id);
+                }
+            }
+            else {
+                state.overwrite = true;
+                this._enqueue_push(state);
+            }
         }
 
         notifyStopwatchChanges() {
@@ -1595,12 +1916,71 @@ module labelling_tool {
             this.frozen = false;
         }
 
+        _reset_labels_patch_state(version: any) {
+            // Patches are computed against the labels that were loaded, if the server provided their version.
+            // Updates to previously loaded labels that are waiting to be sent are still sent.
+            let has_version = version !== undefined && version !== null;
+            this._labels_push_state = {
+                header: this.root_view.model,
+                version: has_version ? version : null,
+                base: has_version ? make_labels_snapshot(get_label_header_labels(this.root_view.model)) : null,
+                sent: null,
+                sent_replacement: false,
+                send_replacement: false,
+                overwrite: false,
+                discarded: false,
+                compact: this._compact_labels,
+            };
+        }
+
+        _enqueue_push(state: LabelsPushState) {
+            if (this._push_queue.indexOf(state) === -1) {
+                this._push_queue.push(state);
+            }
+        }
+
+        _send_next_push() {
+            if (this._push_in_flight !== null || this._push_queue.length === 0) {
+                return;
+            }
+            let state = this._push_queue.shift();
+            let label_header: any = state.header;
+            let labels = get_label_header_labels(label_header);
+            let snapshot = make_labels_snapshot(labels);
+            state.sent_replacement = false;
+            if (state.version !== null && !state.overwrite) {
+                let patch: LabelsPatchModel = null;
+                if (!state.send_replacement) {
+                    patch = make_labels_patch(state.base, state.version, labels, snapshot);
+                }
+                if (patch === null) {
+                    // Send all of the labels along with the version that they are based on
+                    patch = {base_version: state.version,
+                             labels: state.compact ? encode_compact_labels(labels) : labels};
+                    state.sent_replacement = true;
+                }
+                label_header = label_header_with_patch(label_header, patch);
+            }
+            else if (state.compact) {
+                label_header = replace_label_header_labels(label_header, encode_compact_labels(labels));
+            }
+            state.send_replacement = false;
+            state.sent = snapshot;
+            this._push_in_flight = state;
+            this._sendLabelHeaderFn(label_header);
+        }
+
         queue_push_label_data() {
             if (!this.frozen) {
                 if (this._pushDataTimeout === null) {
                     this._pushDataTimeout = setTimeout(() => {
                         this._pushDataTimeout = null;
-                        this._sendLabelHeaderFn(this.root_view.model);
+                        let state = this._labels_push_state;
+                        if (state !== null && !state.discarded) {
+                            state.header = this.root_view.model;
+                            this._enqueue_push(state);
+                            this._send_next_push();
+                        }
                     }, 0);
                 }
             }
@@ -0,0 +1,75 @@
+import pathlib
+import tempfile
+import numpy as np
+from PIL import Image
+from unittest import TestCase
+from . import labelling_tool, labelled_image, batch_render
+
+
+class BatchRenderTestCase(TestCase):
+    @staticmethod
+    def _make_labels():
+        a = labelling_tool.BoxLabel(centre_xy=np.array([15.0, 25.0]), size_xy=np.array([8.0, 12.0]),
+                                    classification='a')
+        b = labelling_tool.PolygonLabel(regions=[np.array([[20.0, 5.0], [35.0, 5.0], [35.0, 20.0]])],
+                                        classification='b')
+        c = labelling_tool.PointLabel(position_xy=np.array([5.0, 5.0]), classification='c')
+        return labelling_tool.ImageLabels([a, b, c])
+
+    def _make_images(self, tmp_dir: pathlib.Path):
+        labels = self._make_labels()
+        for i in range(3):
+            Image.fromarray(np.zeros((40, 48, 3), dtype=np.uint8)).save(str(tmp_dir / 'img{}.png'.format(i)))
+            with (tmp_dir / 'img{}__labels.json'.format(i)).open('w') as f:
+                labelling_tool.WrappedImageLabels(image_filename='img{}.png'.format(i), labels=labels).write_to_file(f)
+        return labels
+
+    def test_render_directory(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tmp_dir = pathlib.Path(tmp_dir)
+            labels = self._make_images(tmp_dir)
+            expected = labels.render_label_classes(['a', 'b'], (40, 48))
+            for n_workers in [0, 2]:
+                out_dir = tmp_dir / 'out{}'.format(n_workers)
+                progress = []
+                stats = batch_render.render_batch(tmp_dir, out_dir, ['a', 'b'], n_workers=n_workers,
+                                                  image_filename_patterns=['*.png'],
+                                                  progress_fn=lambda name, s: progress.append(name))
+                self.assertEqual(stats.n_images, 3)
+                self.assertEqual(stats.n_labels, 9)
+                self.assertEqual(sorted(progress), ['img0', 'img1', 'img2'])
+                for i in range(3):
+                    label_image = np.array(Image.open(str(out_dir / 'img{}__classes.png'.format(i))))
+                    self.assertTrue((label_image == expected).all())
+
+    def test_render_in_memory_instances(self):
+        labels = self._make_labels()
+        limg = labelled_image.LabelledImage.in_memory(
+            np.zeros((40, 48, 3)), labelling_tool.WrappedImageLabels(labels=labels))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tmp_dir = pathlib.Path(tmp_dir)
+            batch_render.render_batch([limg], tmp_dir, None, mode=batch_render.MODE_INSTANCES,
+                                      fmt=batch_render.FORMAT_NPZ, n_workers=0)
+            expected, expected_cls, expected_ids = labels.render_label_instances(None, (40, 48),
+                                                                                 return_object_ids=True)
+            data = np.load(str(tmp_dir / 'image_000000__instances.npz'))
+            self.assertTrue((data['label_image'] == expected).all())
+            self.assertEqual(data['label_index_to_cls'].tolist(), expected_cls.tolist())
+            self.assertEqual(data['object_ids'].tolist(), [''] + expected_ids[1:])
+
+        self.assertRaises(ValueError, lambda: batch_render.render_batch([limg], '.', None, mode='panoptic'))
+
+    def test_render_app_progress_every(self):
+        from click.testing import CliRunner
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tmp_dir = pathlib.Path(tmp_dir)
+            self._make_images(tmp_dir)
+            args = ['--images_dir', str(tmp_dir), '--images_pat', '*.png', '--output_dir', str(tmp_dir / 'out'),
+                    '--classes', 'a,b', '--num_workers', '0']
+            runner = CliRunner()
+            # 0 disables progress reports
+            result = runner.invoke(batch_render.render_app, args + ['--progress_every', '0'])
+            self.assertEqual(result.exit_code, 0, msg=result.output)
+            self.assertTrue((tmp_dir / 'out' / 'img2__classes.png').exists())
+            result = runner.invoke(batch_render.render_app, args + ['--progress_every', '-1'])
+            self.assertNotEqual(result.exit_code, 0)
@@ -0,0 +1,81 @@
+import numpy as np
+from unittest import TestCase
+from . import compact_labels, labelling_tool
+
+
+def _make_labels():
+    return labelling_tool.ImageLabels([
+        labelling_tool.PolygonLabel([np.array([[1.5, 2.25], [3.0, 4.0], [5.0, 6.5]]),
+                                     np.array([[10.0, 10.0], [20.0, 10.0], [20.0, 20.0], [10.0, 20.0]])],
+                                    object_id='a', classification='cls_a'),
+        labelling_tool.GroupLabel([
+            labelling_tool.PolygonLabel([np.array([[0.5, 0.5], [1.0, 0.0], [1.0, 1.0]])],
+                                        object_id='c', classification='cls_b'),
+            labelling_tool.PointLabel(np.array([3.0, 4.0]), object_id='d', classification='cls_b'),
+        ], object_id='b', classification='cls_b'),
+        labelling_tool.PolygonLabel([], object_id='e', classification='cls_a'),
+    ])
+
+
+class CompactLabelsTestCase(TestCase):
+    def test_encode_decode(self):
+        labels_js = _make_labels().to_json()
+        for vertex_dtype in ['float32', 'float64']:
+            for compression in [None, 'zlib']:
+                compact = compact_labels.encode(labels_js, vertex_dtype=vertex_dtype, compression=compression)
+                self.assertTrue(compact_labels.is_compact(compact))
+                self.assertEqual(compact['compact_labels'], compact_labels.COMPACT_LABELS_VERSION)
+                self.assertEqual(compact['labels'][0]['region_sizes'], [3, 4])
+                self.assertNotIn('regions', compact['labels'][0])
+                self.assertEqual(compact['labels'][1]['component_models'][0]['region_sizes'], [3])
+                self.assertEqual(compact['labels'][2]['region_sizes'], [])
+                self.assertEqual(compact_labels.decode(compact), labels_js)
+                self.assertEqual(compact_labels.n_labels(compact), 3)
+                self.assertEqual(compact_labels.decode(compact_labels.recompress(compact, 'zlib')), labels_js)
+                self.assertEqual(compact_labels.decode(compact_labels.recompress(compact, None)), labels_js)
+        self.assertFalse(compact_labels.is_compact(labels_js))
+        self.assertFalse(compact_labels.is_compact({'labels': labels_js}))
+        self.assertEqual(compact_labels.decode(compact_labels.encode([])), [])
+
+        # Vertices stored as 32-bit floats are rounded
+        poly = labelling_tool.PolygonLabel([np.array([[0.1, 0.2], [1.0, 0.0], [1.0, 1.0]])])
+        compact = compact_labels.encode([poly.to_json()])
+        self.assertAlmostEqual(compact_labels.decode(compact)[0]['regions'][0][0]['x'], 0.1, places=6)
+
+        with self.assertRaises(ValueError):
+            compact_labels.encode(labels_js, vertex_dtype='float16')
+        with self.assertRaises(ValueError):
+            compact_labels.encode(labels_js, compression='lzma')
+        future = compact_labels.encode(labels_js)
+        future['compact_labels'] = compact_labels.COMPACT_LABELS_VERSION + 1
+        with self.assertRaises(ValueError):
+            compact_labels.decode(future)
+
+    def test_image_labels(self):
+        labels = _make_labels()
+        compact = labels.to_compact_json(compression='zlib')
+        for data in [compact, {'labels': compact}]:
+            decoded = labelling_tool.ImageLabels.from_json(data)
+            self.assertEqual(decoded.to_json(), labels.to_json())
+            self.assertTrue(decoded[0].regions[0].flags.owndata)
+
+        # Smaller than the JSON form
+        big = labelling_tool.ImageLabels([labelling_tool.PolygonLabel([np.random.uniform(0.0, 1000.0, size=(100, 2))])])
+        from . import json_codec
+        self.assertLess(len(json_codec.dumps(big.to_compact_json())) * 3, len(json_codec.dumps(big.to_json())))
+
+    def test_wrapped_image_labels(self):
+        labels = _make_labels()
+        compact = labels.to_compact_json()
+        wrapped = labelling_tool.WrappedImageLabels(image_filename='img.png', completed_tasks=['finished'],
+                                                   labels_json=compact)
+        self.assertFalse(wrapped.is_blank)
+        self.assertEqual(wrapped.to_json(compact=True)['labels'], compact)
+        self.assertEqual(wrapped.to_json(compact=True, compression='zlib')['labels']['compression'], 'zlib')
+        self.assertEqual(wrapped.labels_json, labels.to_json())
+        self.assertEqual(wrapped.to_json()['labels'], labels.to_json())
+        self.assertEqual(wrapped.to_json()['image_filename'], 'img.png')
+
+        from_wrapped_json = labelling_tool.WrappedImageLabels.from_json(wrapped.to_json(compact=True))
+        self.assertEqual(from_wrapped_json.labels.to_json(), labels.to_json())
+        self.assertTrue(labelling_tool.WrappedImageLabels(labels_json=compact_labels.encode([])).is_blank)
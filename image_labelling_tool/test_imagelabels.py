@@ -1,10 +1,41 @@
+import copy
 import math
 import numpy as np
 from PIL import Image, ImageDraw
-from unittest import TestCase
+from unittest import TestCase, skipIf
 from . import labelling_tool
 
 
+class SimplifyContourTestCase(TestCase):
+    def test_redundant_vertices(self):
+        # Repeated vertices and vertices along straight edges are removed
+        cs = np.array([[0.0, 0.0], [0.0, 0.0], [1.0, 0.0], [2.0, 0.0], [2.0, 2.0], [2.0, 2.0], [0.0, 2.0],
+                       [0.0, 1.0], [0.0, 0.0]])
+        simp = labelling_tool._simplify_contour(cs)
+        self.assertEqual(simp.tolist(), [[0.0, 0.0], [2.0, 0.0], [2.0, 2.0], [0.0, 2.0]])
+        # Nothing remains of a contour whose vertices are all the same
+        self.assertIsNone(labelling_tool._simplify_contour(np.array([[1.0, 1.0], [1.0, 1.0]])))
+        self.assertIsNone(labelling_tool._simplify_contour(np.zeros((0, 2))))
+
+    def test_tolerance(self):
+        thetas = np.linspace(0.0, 2.0 * math.pi, 1000, endpoint=False)
+        circle = np.stack([np.cos(thetas), np.sin(thetas)], axis=1) * 100.0 + 150.0
+        self.assertEqual(len(labelling_tool._simplify_contour(circle)), 1000)
+        for tolerance in [0.1, 0.5, 2.0]:
+            simp = labelling_tool._simplify_contour(circle, tolerance=tolerance)
+            self.assertLess(len(simp), 200)
+            self.assertGreaterEqual(len(simp), 3)
+            # Every original vertex lies within `tolerance` of the simplified polygon
+            starts = simp
+            ends = np.append(simp[1:], simp[:1], axis=0)
+            d = ends - starts
+            t = np.clip((((circle[:, None, :] - starts[None, :, :]) * d[None, :, :]).sum(axis=2) /
+                         (d ** 2).sum(axis=1)[None, :]), 0.0, 1.0)
+            nearest = starts[None, :, :] + t[:, :, None] * d[None, :, :]
+            dist = np.sqrt(((circle[:, None, :] - nearest) ** 2).sum(axis=2)).min(axis=1)
+            self.assertLessEqual(dist.max(), tolerance + 1.0e-9)
+
+
 class AbstractLabelTestCase(TestCase):
     def test_constructor(self):
         a = labelling_tool.AbstractLabel()
@@ -254,6 +285,23 @@ class PolygonLabelTestCase(TestCase):
         self.assertTrue((b.render_mask(50, 50, fill=True, dx=5.0, dy=-5.0, ctx=None) ==
                          np.array(tgt_b_filled_dxy)).all())
 
+    def test_render_mask_multiple_regions(self):
+        # Regions are combined with XOR; compare against rendering each region into a full size image
+        rng = np.random.default_rng(12345)
+        for i in range(50):
+            regions = [rng.uniform(-10.0, 60.0, size=(rng.integers(3, 10), 2))
+                       for _ in range(rng.integers(2, 5))]
+            a = labelling_tool.PolygonLabel(regions=regions)
+            for dx, dy in [(0.0, 0.0), (5.0, -5.0)]:
+                tgt = np.zeros((50, 50), dtype=bool)
+                for region in regions:
+                    region_img = Image.new('L', (50, 50), 0)
+                    # Whole pixel offsets are applied after PIL's truncation of the co-ordinates
+                    ImageDraw.Draw(region_img).polygon([tuple(v) for v in np.trunc(region) + np.array([dx, dy])],
+                                                       outline=1, fill=1)
+                    tgt ^= np.array(region_img) > 0
+                self.assertTrue((a.render_mask(50, 50, fill=True, dx=dx, dy=dy, ctx=None) == tgt).all())
+
     def test_to_json(self):
         outer_rect = np.array([[10.0, 10.0], [40.0, 10.0], [40.0, 40.0], [10.0, 40.0]])
         inner_rect = np.array([[20.0, 20.0], [30.0, 20.0], [30.0, 30.0], [20.0, 30.0]])
@@ -344,6 +392,37 @@ class PolygonLabelTestCase(TestCase):
         self.assertTrue(self.are_polygons_cyclically_equal(reg_b[0], outer_rect.astype(int), both_directions=True))
         self.assertTrue(self.are_polygons_cyclically_equal(reg_b[1], inner_rect_v2.astype(int), both_directions=True))
 
+    def test_simplify(self):
+        yx = np.mgrid[:200, :200]
+        disc = ((yx[0] - 100.0) ** 2 + (yx[1] - 100.0) ** 2) < 80.0 ** 2
+
+        regions = labelling_tool.PolygonLabel.mask_image_to_regions(disc)
+        simp_regions = labelling_tool.PolygonLabel.mask_image_to_regions(disc, simplify_tolerance=1.0)
+        self.assertEqual(len(simp_regions), 1)
+        self.assertLess(len(simp_regions[0]), len(regions[0]) // 2)
+        if labelling_tool.cv2 is not None:
+            cv_regions = labelling_tool.PolygonLabel.mask_image_to_regions_cv(disc)
+            simp_cv_regions = labelling_tool.PolygonLabel.mask_image_to_regions_cv(disc, simplify_tolerance=1.0)
+            self.assertEqual(len(simp_cv_regions), 1)
+            self.assertLess(len(simp_cv_regions[0]), len(cv_regions[0]))
+
+        lab = labelling_tool.PolygonLabel(regions, object_id='abc', classification='cls_a', source='auto:test',
+                                          anno_data=dict(a=1))
+        simp = lab.simplified(1.0)
+        self.assertEqual(simp.object_id, 'abc')
+        self.assertEqual(simp.classification, 'cls_a')
+        self.assertEqual(simp.source, 'auto:test')
+        self.assertEqual(simp.anno_data, dict(a=1))
+        self.assertEqual(simp.n_vertices, len(simp_regions[0]))
+        self.assertLess(simp.n_vertices, lab.n_vertices // 2)
+        self.assertEqual(labelling_tool.label_mask_iou(lab, lab), 1.0)
+        self.assertGreater(labelling_tool.label_mask_iou(lab, simp), 0.98)
+
+        # Degenerate regions that are reduced to fewer than 3 vertices are dropped
+        sliver = labelling_tool.PolygonLabel([np.array([[0.0, 0.0], [10.0, 0.0], [20.0, 0.0]]),
+                                              np.array([[0.0, 0.0], [10.0, 0.0], [10.0, 10.0]])])
+        self.assertEqual(len(sliver.simplified(0.5).regions), 1)
+
 
 class BoxLabelTestCase(TestCase):
     def test_constructor(self):
@@ -847,6 +926,50 @@ class ImageLabelsTestCase(TestCase):
         self.assertEqual(labelling_tool.ImageLabels([a, b, c]).label_class_histogram(),
                          {'cls_a': 2, 'cls_b': 1})
 
+    def test_merge_and_retain(self):
+        rect = np.array([[20.0, 20.0], [30.0, 20.0], [30.0, 30.0], [20.0, 30.0]])
+        a = labelling_tool.PolygonLabel(regions=[rect], object_id='a', classification='cls_a',
+                                        anno_data={'tags': ['x']})
+        b = labelling_tool.PointLabel(np.array([5.0, 6.0]), object_id='b', classification='cls_b')
+        c = labelling_tool.BoxLabel(centre_xy=np.array([15.0, 25.0]), size_xy=np.array([8.0, 12.0]),
+                                    object_id='c', classification='cls_a')
+        bc = labelling_tool.GroupLabel(component_labels=[b, c], object_id='bc', classification='cls_c')
+        ab = labelling_tool.CompositeLabel(components=[a, b], object_id='ab', classification='cls_c')
+        labels1 = labelling_tool.ImageLabels([a, bc, ab])
+        d = labelling_tool.PolygonLabel(regions=[rect + 5.0], object_id='a', classification='cls_b')
+        labels2 = labelling_tool.ImageLabels([d])
+        labels1_js = labels1.to_json()
+
+        for copy in [False, True]:
+            merged = labelling_tool.ImageLabels.merge(labels1, labels2, copy=copy)
+            self.assertEqual(len(merged), 4)
+            self.assertEqual(merged.to_json()[:3], labels1_js)
+            m_a, m_bc, m_ab, m_d = merged.labels
+            self.assertIsNot(m_a, a)
+            self.assertIsNot(m_a.regions, a.regions)
+            # The geometry is shared unless copying
+            self.assertEqual(m_a.regions[0] is a.regions[0], not copy)
+            self.assertEqual(m_bc[0].position_xy is b.position_xy, not copy)
+            # Composite labels refer to the copies of their components
+            self.assertIs(m_ab.components[0], m_a)
+            self.assertIs(m_ab.components[1], m_bc[0])
+            # The duplicate object ID is replaced
+            self.assertIsNone(m_d.object_id)
+            self.assertEqual(d.object_id, 'a')
+
+            # Changing the copies does not affect the originals
+            m_a.classification = 'cls_b'
+            m_a.anno_data['tags'].append('y')
+            m_a.regions = [rect * 2.0]
+            m_bc.component_labels.append(labelling_tool.PointLabel(np.array([1.0, 1.0])))
+            self.assertEqual(labels1.to_json(), labels1_js)
+
+            retained = labels1.retain(['bc', 2], copy=copy)
+            self.assertEqual(retained.to_json(), labels1_js[1:])
+            self.assertIs(retained[1].components[1], retained[0][0])
+            self.assertEqual(retained[0][1].centre_xy is c.centre_xy, not copy)
+            self.assertEqual(labels1[0:2].to_json(), labels1_js[0:2])
+
     def test_replace_label_classes(self):
         a = labelling_tool.BoxLabel(centre_xy=np.array([15.0, 25.0]), size_xy=np.array([8.0, 12.0]),
                                     classification='cls_a')
@@ -890,3 +1013,533 @@ class ImageLabelsTestCase(TestCase):
         self.assertEqual(js_labels[0]['component_models'][1]['label_class'], 'cls_b')
         self.assertEqual(js_labels[1]['label_class'], 'new_a')
         self.assertEqual(js_labels[0]['label_class'], 'new_c')
+
+    def _make_random_labels(self, rng, n_labels, image_size):
+        labels = []
+        for i in range(n_labels):
+            label_type = rng.integers(0, 5)
+            centre = rng.uniform(-10.0, image_size + 10.0, size=(2,))
+            cls = 'cls_{}'.format(rng.integers(0, 3))
+            if label_type == 0:
+                lab = labelling_tool.PointLabel(position_xy=centre, classification=cls)
+            elif label_type == 1:
+                lab = labelling_tool.BoxLabel(centre_xy=centre, size_xy=rng.uniform(1.0, 20.0, size=(2,)),
+                                              classification=cls)
+            elif label_type == 2:
+                lab = labelling_tool.OrientedEllipseLabel(centre_xy=centre, radius1=rng.uniform(1.0, 15.0),
+                                                          radius2=rng.uniform(1.0, 15.0),
+                                                          orientation_rad=rng.uniform(0.0, math.pi),
+                                                          classification=cls)
+            elif label_type == 3:
+                regions = [centre[None, :] + rng.uniform(-15.0, 15.0, size=(rng.integers(3, 8), 2))
+                           for _ in range(rng.integers(1, 3))]
+                lab = labelling_tool.PolygonLabel(regions=regions, classification=cls)
+            else:
+                a = labelling_tool.BoxLabel(centre_xy=centre, size_xy=rng.uniform(1.0, 20.0, size=(2,)))
+                b = labelling_tool.PolygonLabel(regions=[centre[None, :] + rng.uniform(-15.0, 15.0, size=(5, 2))])
+                lab = labelling_tool.GroupLabel(component_labels=[a, b], classification=cls)
+            labels.append(lab)
+        return labelling_tool.ImageLabels(labels)
+
+    def test_render_label_classes_clip_to_bounding_box(self):
+        rng = np.random.default_rng(12345)
+        labels = self._make_random_labels(rng, 100, 64)
+        ctx = labelling_tool.LabelContext(point_radius=2.5)
+        for multichannel_mask in [False, True]:
+            for fill in [False, True]:
+                for c in [None, ctx]:
+                    clipped = labels.render_label_classes(['cls_0', 'cls_1', 'cls_2'], (48, 64),
+                                                          multichannel_mask=multichannel_mask, fill=fill,
+                                                          ctx=c, clip_to_bounding_box=True)
+                    full = labels.render_label_classes(['cls_0', 'cls_1', 'cls_2'], (48, 64),
+                                                       multichannel_mask=multichannel_mask, fill=fill,
+                                                       ctx=c, clip_to_bounding_box=False)
+                    self.assertEqual(clipped.shape, full.shape)
+                    self.assertTrue((clipped == full).all())
+
+    def test_render_label_classes_window(self):
+        rng = np.random.default_rng(12345)
+        labels = self._make_random_labels(rng, 60, 64)
+        classes = ['cls_0', 'cls_1', 'cls_2']
+        for multichannel_mask in [False, True]:
+            full = labels.render_label_classes(classes, (64, 64), multichannel_mask=multichannel_mask)
+            for y0, x0, h, w in [(0, 0, 64, 64), (10, 5, 20, 30), (40, 50, 24, 14), (0, 33, 1, 7)]:
+                win = labels.render_label_classes_window(classes, (y0, x0, h, w), image_shape=(64, 64),
+                                                         multichannel_mask=multichannel_mask)
+                self.assertTrue((win == full[y0:y0 + h, x0:x0 + w]).all())
+
+            tiled = np.zeros_like(full)
+            n_tiles = 0
+            for (y0, x0, h, w), tile in labels.iter_label_class_tiles(classes, (64, 64), (24, 20),
+                                                                       multichannel_mask=multichannel_mask):
+                self.assertEqual(tile.shape[:2], (h, w))
+                tiled[y0:y0 + h, x0:x0 + w] = tile
+                n_tiles += 1
+            self.assertEqual(n_tiles, 3 * 4)
+            self.assertTrue((tiled == full).all())
+
+    def test_spatial_queries(self):
+        rng = np.random.default_rng(12345)
+        labels = self._make_random_labels(rng, 200, 256)
+        flat = list(labels.flatten())
+        ctx = labelling_tool.LabelContext(point_radius=3.0)
+        boxes = [lab.bounding_box(ctx=ctx) for lab in flat]
+
+        def brute_force(lower, upper, top_level=False):
+            result = []
+            for lab, (lab_lower, lab_upper) in zip(flat, boxes):
+                if lab_lower is not None and (lab_lower <= upper).all() and (lab_upper >= lower).all():
+                    if not top_level or any(lab is top for top in labels.labels):
+                        result.append(lab)
+            return result
+
+        for i in range(100):
+            lower = rng.uniform(-20.0, 270.0, size=(2,))
+            upper = lower + rng.uniform(0.0, 80.0, size=(2,))
+            self.assertEqual(labels.labels_intersecting(lower, upper, ctx=ctx), brute_force(lower, upper))
+            self.assertEqual(labels.labels_intersecting(lower, upper, ctx=ctx, top_level=True),
+                             brute_force(lower, upper, top_level=True))
+            self.assertEqual(labels.labels_containing(lower, ctx=ctx), brute_force(lower, lower))
+        # Whole image
+        self.assertEqual(labels.labels_intersecting([-1000, -1000], [1000, 1000], ctx=ctx),
+                         [lab for lab, (lab_lower, _) in zip(flat, boxes) if lab_lower is not None])
+
+        # Assigning labels invalidates the index
+        box = labelling_tool.BoxLabel(centre_xy=np.array([1000.0, 1000.0]), size_xy=np.array([10.0, 10.0]))
+        self.assertEqual(labels.labels_containing([1000.0, 1000.0]), [])
+        labels.labels = labels.labels + [box]
+        self.assertEqual(labels.labels_containing([1000.0, 1000.0]), [box])
+        # Assigning the geometry of a label invalidates the index
+        box.centre_xy = np.array([2000.0, 2000.0])
+        self.assertEqual(labels.labels_containing([2000.0, 2000.0]), [box])
+        # As does modifying the labels list in place
+        del labels.labels[-1]
+        self.assertEqual(labels.labels_containing([2000.0, 2000.0]), [])
+        labels.labels.append(box)
+        self.assertEqual(labels.labels_containing([2000.0, 2000.0]), [box])
+        point = labelling_tool.PointLabel(np.array([2000.0, 2000.0]))
+        labels.labels[-1] = point
+        self.assertEqual(labels.labels_containing([2000.0, 2000.0]), [point])
+        # Modifying geometry in place requires explicit invalidation
+        point.position_xy[:] = [3000.0, 3000.0]
+        labels.invalidate_spatial_index()
+        self.assertEqual(labels.labels_containing([3000.0, 3000.0]), [point])
+        # Changing the geometry of labels in other `ImageLabels` instances does not invalidate the index
+        index = labels._get_spatial_index(None)
+        other = labelling_tool.ImageLabels([labelling_tool.PointLabel(np.array([5.0, 5.0]))])
+        other.labels_containing([5.0, 5.0])
+        other.labels[0].position_xy = np.array([6.0, 6.0])
+        self.assertIs(labels._get_spatial_index(None), index)
+        self.assertEqual(other.labels_containing([6.0, 6.0]), other.labels)
+        # Copies maintain their own index
+        labels_copy = copy.deepcopy(labels)
+        self.assertEqual(len(labels_copy.labels_containing([3000.0, 3000.0])), 1)
+        labels_copy.labels[-1].position_xy = np.array([4000.0, 4000.0])
+        self.assertEqual(len(labels_copy.labels_containing([4000.0, 4000.0])), 1)
+        self.assertEqual(labels.labels_containing([3000.0, 3000.0]), [point])
+        self.assertIs(labels._get_spatial_index(None), index)
+        self.assertEqual(labelling_tool.ImageLabels([]).labels_containing([0.0, 0.0]), [])
+
+    def test_render_label_classes_window_after_modification(self):
+        a = labelling_tool.BoxLabel(centre_xy=np.array([10.5, 10.5]), size_xy=np.array([5.0, 5.0]),
+                                    classification='a')
+        b = labelling_tool.BoxLabel(centre_xy=np.array([30.5, 30.5]), size_xy=np.array([5.0, 5.0]),
+                                    classification='a')
+        labels = labelling_tool.ImageLabels([a])
+        window = (0, 0, 64, 64)
+
+        def check():
+            windowed = labels.render_label_classes_window(['a'], window)
+            self.assertTrue((windowed == labels.render_label_classes(['a'], (64, 64))).all())
+            return windowed.sum()
+
+        n_pixels = check()
+        self.assertGreater(n_pixels, 0)
+        # The window renderer must see labels added in place and geometry that has been re-assigned
+        labels.labels.append(b)
+        self.assertEqual(check(), n_pixels * 2)
+        b.centre_xy = np.array([100.5, 100.5])
+        self.assertEqual(check(), n_pixels)
+        del labels.labels[0]
+        self.assertEqual(labels.render_label_classes_window(['a'], window).sum(), 0)
+
+    def test_bounding_boxes(self):
+        rng = np.random.default_rng(12345)
+        labels = self._make_random_labels(rng, 200, 256)
+        comp = labelling_tool.CompositeLabel(components=labels.labels[:2])
+        labels.labels = labels.labels + [comp]
+        ctx = labelling_tool.LabelContext(point_radius=3.0)
+        for c in [None, ctx]:
+            boxes = labels.bounding_boxes(ctx=c)
+            self.assertEqual(boxes.shape, (201, 4))
+            for lab, box in zip(labels.labels[:-1], boxes[:-1]):
+                lower, upper = lab.bounding_box(ctx=c)
+                self.assertTrue(np.allclose(box[:2], lower))
+                self.assertTrue(np.allclose(box[2:], upper))
+            self.assertTrue(np.isnan(boxes[-1]).all())
+        self.assertEqual(labelling_tool.ImageLabels([]).bounding_boxes().shape, (0, 4))
+
+        # Cached bounding boxes are read-only and are discarded when the geometry is replaced
+        poly = labelling_tool.PolygonLabel(regions=[np.array([[1.0, 2.0], [5.0, 3.0], [2.0, 7.0]])])
+        lower, upper = poly.bounding_box()
+        self.assertIs(poly.bounding_box()[0], lower)
+        self.assertFalse(lower.flags.writeable)
+        poly.regions = [np.array([[0.0, 0.0], [10.0, 1.0], [3.0, 12.0]])]
+        self.assertTrue((poly.bounding_box()[1] == np.array([10.0, 12.0])).all())
+        poly.regions[0][0] = [-1.0, -1.0]
+        poly.invalidate_bounding_box()
+        self.assertTrue((poly.bounding_box()[0] == np.array([-1.0, -1.0])).all())
+
+        ell = labelling_tool.OrientedEllipseLabel(centre_xy=np.array([15.0, 25.0]), radius1=4.0, radius2=6.0,
+                                                  orientation_rad=0.0)
+        self.assertTrue(np.allclose(ell.bounding_box()[0], np.array([11.0, 19.0])))
+        ell.orientation_rad = math.radians(90.0)
+        self.assertTrue(np.allclose(ell.bounding_box()[0], np.array([9.0, 21.0])))
+        group = labelling_tool.GroupLabel(component_labels=[poly, ell])
+        self.assertTrue(np.allclose(group.bounding_box()[1], np.array([21.0, 29.0])))
+
+    def test_bounding_boxes_subclass_override(self):
+        # Subclasses that compute their bounding boxes differently are not processed by the vectorised
+        # implementation of their base class
+        class PaddedPolygonLabel (labelling_tool.PolygonLabel):
+            def _compute_bounding_box(self):
+                lower, upper = super(PaddedPolygonLabel, self)._compute_bounding_box()
+                return lower - 1.0, upper + 1.0
+
+        class LargePointLabel (labelling_tool.PointLabel):
+            def bounding_box(self, ctx=None):
+                return self.position_xy - 5.0, self.position_xy + 5.0
+
+        region = np.array([[1.0, 2.0], [5.0, 3.0], [2.0, 7.0]])
+        labels = labelling_tool.ImageLabels([
+            labelling_tool.PolygonLabel(regions=[region]),
+            PaddedPolygonLabel(regions=[region]),
+            labelling_tool.PointLabel(np.array([10.0, 20.0])),
+            LargePointLabel(np.array([10.0, 20.0])),
+        ])
+        boxes = labels.bounding_boxes()
+        self.assertTrue(np.allclose(boxes, [[1.0, 2.0, 5.0, 7.0], [0.0, 1.0, 6.0, 8.0],
+                                            [10.0, 20.0, 10.0, 20.0], [5.0, 15.0, 15.0, 25.0]]))
+
+    def test_polygon_vertex_buffer(self):
+        rng = np.random.default_rng(12345)
+        labels = self._make_random_labels(rng, 100, 256)
+        empty = labelling_tool.PolygonLabel(regions=[])
+        labels.labels = labels.labels + [empty]
+        polys = [lab for lab in labels.flatten() if isinstance(lab, labelling_tool.PolygonLabel)]
+        regions = [[region.copy() for region in lab.regions] for lab in polys]
+        json_regions = [labelling_tool.PolygonLabel.regions_to_json(lab.regions) for lab in polys]
+
+        buf = labels.polygon_vertex_buffer(dtype=np.float64)
+        self.assertEqual(len(buf), len(polys))
+        self.assertEqual(buf.n_regions, sum(len(r) for r in regions))
+        self.assertEqual(buf.n_vertices, sum(len(reg) for r in regions for reg in r))
+        self.assertTrue(all(a is b for a, b in zip(buf.labels, polys)))
+        for i, lab_regions in enumerate(regions):
+            buf_regions = buf.label_regions(i)
+            self.assertEqual(len(buf_regions), len(lab_regions))
+            for a, b in zip(buf_regions, lab_regions):
+                self.assertTrue((a == b).all())
+            self.assertEqual(buf.regions_to_json(i), json_regions[i])
+        self.assertEqual(buf.region_label_indices().tolist(),
+                         [i for i, r in enumerate(regions) for _ in r])
+        self.assertTrue(np.allclose(buf.bounding_boxes()[:-1],
+                                    labelling_tool.ImageLabels(polys[:-1]).bounding_boxes()))
+        self.assertTrue(np.isnan(buf.bounding_boxes()[-1]).all())
+
+        moved = buf.transformed(lambda v: v + np.array([5.0, -3.0]))
+        self.assertIsNone(moved.labels)
+        self.assertTrue((moved.region(4) == buf.region(4) + np.array([5.0, -3.0])).all())
+
+        # Attach the labels to a float32 buffer; their regions become views into it
+        buf32 = labels.polygon_vertex_buffer(attach=True)
+        self.assertEqual(buf32.vertices.dtype, np.float32)
+        for i, lab in enumerate(polys):
+            for a, b in zip(lab.regions, regions[i]):
+                self.assertTrue(np.shares_memory(a, buf32.vertices))
+                self.assertEqual(a.dtype, np.float32)
+                self.assertTrue(np.allclose(a, b, atol=1.0e-4))
+            if len(lab.regions) > 0:
+                self.assertTrue(np.allclose(lab.bounding_box()[0], buf32.bounding_boxes()[i, :2]))
+
+        # Attaching to a float64 buffer leaves the vertices unchanged
+        for lab, lab_regions in zip(polys, regions):
+            lab.regions = lab_regions
+        buf64 = labels.polygon_vertex_buffer(dtype=np.float64, attach=True)
+        for i, lab in enumerate(polys):
+            for a in lab.regions:
+                self.assertTrue(np.shares_memory(a, buf64.vertices))
+            self.assertEqual(labelling_tool.PolygonLabel.regions_to_json(lab.regions), json_regions[i])
+
+    def test_warp_batch(self):
+        from skimage.transform import AffineTransform
+        rng = np.random.default_rng(12345)
+        labels = self._make_random_labels(rng, 100, 256)
+        labels = labelling_tool.ImageLabels.from_json(labels.to_json())
+        comp = labelling_tool.CompositeLabel(components=labels.labels[:2], classification='cls_c',
+                                             object_id='comp')
+        labels.labels = labels.labels + [comp, labelling_tool.PolygonLabel(regions=[], object_id='empty')]
+        xf = AffineTransform(scale=(1.2, 0.8), rotation=0.3, shear=0.1, translation=(5.0, -7.0))
+        n_calls = []
+
+        def xform_fn(points):
+            n_calls.append(len(points))
+            return xf(points)
+
+        per_label = labels.warp(xform_fn, batch=False)
+        n_calls.clear()
+        batched = labels.warp(xform_fn)
+        self.assertEqual(len(n_calls), 1)
+
+        self.assertEqual(len(per_label), len(batched))
+        for a, b in zip(per_label.flatten(), batched.flatten()):
+            self.assertEqual(type(a), type(b))
+            self.assertEqual(a.object_id, b.object_id)
+            self.assertEqual(a.classification, b.classification)
+            a_lower, a_upper = a.bounding_box()
+            b_lower, b_upper = b.bounding_box()
+            if a_lower is None:
+                self.assertIsNone(b_lower)
+            else:
+                self.assertTrue(np.allclose(a_lower, b_lower))
+                self.assertTrue(np.allclose(a_upper, b_upper))
+        warped_comp = batched.labels[-2]
+        self.assertIs(warped_comp.components[0], batched.labels[0])
+        self.assertIs(batched[warped_comp.object_id], warped_comp)
+
+    def test_warp_custom_label_type(self):
+        # A label type that only implements `_warp`, as label types written before batch warping do
+        class MarkerLabel (labelling_tool.AbstractLabel):
+            __json_type_name__ = 'test_marker'
+
+            def __init__(self, position_xy, object_id=None, classification=None):
+                super(MarkerLabel, self).__init__(object_id, classification)
+                self.position_xy = np.array(position_xy, dtype=float)
+
+            def _compute_bounding_box(self):
+                return self.position_xy.copy(), self.position_xy.copy()
+
+            def _warp(self, xform_fn, object_table):
+                return MarkerLabel(xform_fn(self.position_xy[None, :])[0], self.object_id, self.classification)
+
+        box = labelling_tool.BoxLabel(centre_xy=np.array([15.0, 25.0]), size_xy=np.array([8.0, 12.0]))
+        labels = labelling_tool.ImageLabels([MarkerLabel([3.0, 4.0], classification='a'), box])
+        for batch in [False, True]:
+            warped = labels.warp(lambda p_xy: p_xy + 7.0, batch=batch)
+            self.assertIsInstance(warped.labels[0], MarkerLabel)
+            self.assertTrue(np.allclose(warped.labels[0].position_xy, [10.0, 11.0]))
+            self.assertEqual(warped.labels[0].classification, 'a')
+            self.assertIs(warped[warped.labels[0].object_id], warped.labels[0])
+            self.assertTrue(np.allclose(warped.labels[1].centre_xy, [22.0, 32.0]))
+
+    def test_from_label_image(self):
+        label_image = np.zeros((32, 40), dtype=np.int32)
+        label_image[2:8, 3:12] = 1
+        label_image[10:20, 20:25] = 3
+        label_image[22:30, 30:38] = 3
+        label_image[0:4, 36:40] = -2
+        labels, indices = labelling_tool.ImageLabels.from_label_image(
+            label_image, label_classes={1: 'a', 3: 'b'}, sources='auto', return_label_indices=True)
+        self.assertEqual(indices, [1, 3])
+        self.assertEqual([lab.classification for lab in labels], ['a', 'b'])
+        self.assertEqual([lab.source for lab in labels], ['auto', 'auto'])
+        self.assertEqual(len(labels[0].regions), 1)
+        self.assertEqual(len(labels[1].regions), 2)
+        self.assertTrue(np.allclose(labels[0].bounding_box()[0], [2.5, 1.5]))
+        self.assertTrue(np.allclose(labels[0].bounding_box()[1], [11.5, 7.5]))
+        self.assertTrue(np.allclose(labels[1].bounding_box()[0], [19.5, 9.5]))
+        self.assertTrue(np.allclose(labels[1].bounding_box()[1], [37.5, 29.5]))
+
+        self.assertEqual(len(labelling_tool.ImageLabels.from_label_image(np.zeros((8, 8), dtype=np.int32))), 0)
+
+    @skipIf(labelling_tool.cv2 is None, 'OpenCV not available')
+    def test_from_mask_images_cv(self):
+        from . import mask_rle
+        masks = np.zeros((4, 30, 45), dtype=bool)
+        masks[0, 2:6, 3:8] = True
+        masks[0, 20:28, 30:44] = True
+        masks[1, 10:25, 5:20] = True
+        masks[3, 0:30, 40:45] = True
+        labels, indices = labelling_tool.ImageLabels.from_mask_images_cv(
+            masks, label_classes=['a', 'b', 'c', 'd'], return_mask_indices=True)
+        # Sorted in order of decreasing area; the mask indices follow the labels
+        self.assertEqual(indices, [1, 3, 0])
+        self.assertEqual([lab.classification for lab in labels], ['b', 'd', 'a'])
+        self.assertEqual(len(labels[2].regions), 2)
+        # The larger region comes first
+        self.assertTrue(labels[2].regions[0][:, 0].min() >= 30)
+
+        unsorted, unsorted_indices = labelling_tool.ImageLabels.from_mask_images_cv(
+            masks, sort_decreasing_area=False, return_mask_indices=True)
+        self.assertEqual(unsorted_indices, [0, 1, 3])
+
+        compact_forms = [
+            dict(masks=list(masks), n_threads=2),
+            dict(masks=(m for m in masks), n_threads=None),
+            dict(masks=[np.packbits(m, axis=1) for m in masks], packed_mask_width=45),
+            dict(masks=[mask_rle.encode(m) for m in masks], n_threads=2),
+        ]
+        for kwargs in compact_forms:
+            other = labelling_tool.ImageLabels.from_mask_images_cv(label_classes=['a', 'b', 'c', 'd'], **kwargs)
+            self.assertEqual(len(other), len(labels))
+            for a, b in zip(labels, other):
+                self.assertEqual(a.classification, b.classification)
+                self.assertEqual(len(a.regions), len(b.regions))
+                for ra, rb in zip(a.regions, b.regions):
+                    self.assertTrue((ra == rb).all())
+
+        contours = [np.array([[0, 0], [4, 0], [4, 3]]), np.zeros((0, 2)), np.array([[0, 0], [2, 0], [2, 2], [0, 2]])]
+        self.assertEqual(labelling_tool.ImageLabels._contour_areas(contours).tolist(), [6.0, 0.0, 4.0])
+
+    def test_simplify_polygons(self):
+        yx = np.mgrid[:120, :160]
+        label_image = np.zeros((120, 160), dtype=np.int32)
+        label_image[((yx[0] - 50.0) ** 2 + (yx[1] - 50.0) ** 2) < 40.0 ** 2] = 1
+        label_image[((yx[0] - 70.0) ** 2 + (yx[1] - 120.0) ** 2) < 30.0 ** 2] = 2
+
+        labels = labelling_tool.ImageLabels.from_label_image(label_image)
+        simp_labels = labelling_tool.ImageLabels.from_label_image(label_image, simplify_tolerance=1.0)
+        self.assertEqual(len(simp_labels), 2)
+        for lab, simp in zip(labels, simp_labels):
+            self.assertLess(simp.n_vertices, lab.n_vertices // 2)
+        if labelling_tool.cv2 is not None:
+            masks = [label_image == 1, label_image == 2]
+            cv_labels = labelling_tool.ImageLabels.from_mask_images_cv(masks)
+            simp_cv_labels = labelling_tool.ImageLabels.from_mask_images_cv(masks, simplify_tolerance=1.0)
+            self.assertEqual(len(simp_cv_labels), 2)
+            for lab, simp in zip(cv_labels, simp_cv_labels):
+                self.assertLess(simp.n_vertices, lab.n_vertices)
+
+        # Simplify in place, including polygons within groups
+        group = labelling_tool.GroupLabel([labels[1]])
+        image_labels = labelling_tool.ImageLabels([labels[0], group])
+        n_before = labels[0].n_vertices + labels[1].n_vertices
+        n_before_out, n_after, ious = image_labels.simplify_polygons(1.0, compute_iou=True)
+        self.assertEqual(n_before_out, n_before)
+        self.assertEqual(n_after, simp_labels[0].n_vertices + simp_labels[1].n_vertices)
+        self.assertEqual(labels[1].n_vertices, simp_labels[1].n_vertices)
+        self.assertEqual(len(ious), 2)
+        self.assertGreater(min(ious), 0.98)
+        self.assertEqual(image_labels.simplify_polygons(1.0)[2], [])
+
+    def test_render_label_instances_rle(self):
+        rng = np.random.default_rng(12345)
+        labels = self._make_random_labels(rng, 40, 64)
+        classes = ['cls_0', 'cls_1']
+        dense, dense_cls, dense_ids = labels.render_label_instances(
+            classes, (64, 64), multichannel_mask=True, return_object_ids=True)
+        for compress in [False, True]:
+            masks, cls, ids = labels.render_label_instances_rle(
+                classes, (64, 64), return_object_ids=True, compress=compress)
+            self.assertEqual(len(masks), dense.shape[2])
+            self.assertTrue((masks.to_dense() == dense).all())
+            self.assertTrue((masks[3] == dense[:, :, 3]).all())
+            self.assertEqual(cls.tolist(), dense_cls.tolist())
+            self.assertEqual(ids, dense_ids)
+
+    def test_render_label_instances_clip_to_bounding_box(self):
+        rng = np.random.default_rng(23456)
+        labels = self._make_random_labels(rng, 50, 64)
+        for multichannel_mask in [False, True]:
+            clipped, clipped_cls = labels.render_label_instances(
+                None, (48, 64), multichannel_mask=multichannel_mask, clip_to_bounding_box=True)
+            full, full_cls = labels.render_label_instances(
+                None, (48, 64), multichannel_mask=multichannel_mask, clip_to_bounding_box=False)
+            self.assertEqual(clipped.shape, full.shape)
+            self.assertTrue((clipped == full).all())
+            self.assertTrue((clipped_cls == full_cls).all())
+
+
+class LazyImageLabelsTestCase(TestCase):
+    @staticmethod
+    def _make_labels_json():
+        a = labelling_tool.BoxLabel(centre_xy=np.array([15.0, 25.0]), size_xy=np.array([8.0, 12.0]),
+                                    object_id='a', classification='cls_a')
+        inner_rect = np.array([[20.0, 20.0], [30.0, 20.0], [30.0, 30.0], [20.0, 30.0]])
+        b = labelling_tool.PolygonLabel(regions=[inner_rect], object_id='b', classification='cls_b')
+        ab = labelling_tool.GroupLabel(component_labels=[a, b], object_id='ab', classification='cls_c')
+        c = labelling_tool.PolygonLabel(regions=[inner_rect + 10.0], object_id='c', classification='cls_a')
+        d = labelling_tool.PointLabel(np.array([5.0, 6.0]), object_id='d', classification='cls_b')
+        cd = labelling_tool.CompositeLabel(components=[c, d], object_id='cd', classification='cls_c')
+        return labelling_tool.ImageLabels([ab, c, d, cd]).to_json()
+
+    def test_lazy_access(self):
+        labels_js = self._make_labels_json()
+        labels = labelling_tool.LazyImageLabels(labels_js)
+        self.assertEqual(len(labels), 4)
+        self.assertEqual(labels.label_class_histogram(), {'cls_a': 1, 'cls_b': 1, 'cls_c': 2})
+        self.assertEqual(labels._label_objs, [None, None, None, None])
+
+        # Only the labels that are accessed are converted
+        self.assertEqual(labels[1].object_id, 'c')
+        self.assertEqual(labels[-3].object_id, 'c')
+        self.assertIs(labels[1], labels[-3])
+        self.assertEqual([lab is not None for lab in labels._label_objs], [False, True, False, False])
+        with self.assertRaises(IndexError):
+            _ = labels[4]
+
+        # Label objects are used in preference to JSON once converted
+        labels[1].classification = 'cls_b'
+        self.assertEqual(labels.label_class_histogram(), {'cls_b': 2, 'cls_c': 2})
+        labels[1].classification = 'cls_a'
+
+        # Looking up a component of a group by object ID converts the group
+        self.assertEqual(labels['b'].classification, 'cls_b')
+        self.assertEqual(labels['ab'].component_labels[1], labels['b'])
+        self.assertFalse(labels.is_materialised)
+
+        # Flattening by class only converts labels that contain the requested classes
+        labels = labelling_tool.LazyImageLabels(labels_js)
+        self.assertEqual([lab.object_id for lab in labels.flatten_by_class({'cls_b'})], ['b', 'd'])
+        self.assertEqual([lab is not None for lab in labels._label_objs], [True, False, True, False])
+
+        # Converting a composite label converts its components first
+        labels = labelling_tool.LazyImageLabels(labels_js)
+        cd = labels[3]
+        self.assertEqual(cd.components, [labels['c'], labels['d']])
+
+        # Iterating, flattening and accessing `labels` give the same results as `ImageLabels`
+        eager = labelling_tool.ImageLabels.from_json(labels_js)
+        self.assertEqual([lab.object_id for lab in labels], [lab.object_id for lab in eager])
+        self.assertEqual([lab.object_id for lab in labels.flatten()], [lab.object_id for lab in eager.flatten()])
+        self.assertEqual(labels.flatten_by_class({'cls_a', 'cls_c'}), [labels['a'], labels['ab'], labels['c'],
+                                                                        labels['cd']])
+        self.assertEqual(len(labels.labels), 4)
+        self.assertTrue(labels.is_materialised)
+        self.assertEqual(labels.to_json(), eager.to_json())
+        self.assertEqual(len(labels), 4)
+        self.assertEqual(labels.label_class_histogram(), eager.label_class_histogram())
+
+    def test_compact(self):
+        labels_js = self._make_labels_json()
+        compact = labelling_tool.ImageLabels.from_json(labels_js).to_compact_json(vertex_dtype='float64')
+        labels = labelling_tool.LazyImageLabels.from_json({'labels': compact})
+        self.assertEqual(len(labels), 4)
+        self.assertEqual(labels.label_class_histogram(), {'cls_a': 1, 'cls_b': 1, 'cls_c': 2})
+        self.assertIs(labels.to_compact_json(vertex_dtype='float64'), compact)
+        self.assertEqual(labels.to_json(), labels_js)
+
+        # The vertices of each polygon are taken from the right place in the vertex block
+        self.assertEqual(labels[1].regions[0].tolist(), [[30.0, 30.0], [40.0, 30.0], [40.0, 40.0], [30.0, 40.0]])
+        self.assertEqual(labels['b'].regions[0].tolist(), [[20.0, 20.0], [30.0, 20.0], [30.0, 30.0], [20.0, 30.0]])
+        self.assertEqual(labels.to_json(), labels_js)
+
+    def test_object_ids(self):
+        # Labels without object IDs or with old style integer IDs are given IDs that do not clash
+        labels_js = [
+            labelling_tool.PointLabel(np.array([1.0, 2.0]), classification='cls_a').to_json(),
+            labelling_tool.PointLabel(np.array([3.0, 4.0]), object_id=1, classification='cls_a').to_json(),
+        ]
+        labels = labelling_tool.LazyImageLabels(labels_js, id_prefix='abc')
+        self.assertEqual(labels[0].object_id, 'abc__2')
+        self.assertEqual(labels[1].object_id, 'abc__1')
+        self.assertIs(labels['abc__1'], labels[1])
+
+    def test_wrapped_image_labels(self):
+        labels_js = self._make_labels_json()
+        wrapped = labelling_tool.WrappedImageLabels(labels_json=labels_js)
+        self.assertIsInstance(wrapped.labels, labelling_tool.LazyImageLabels)
+        self.assertEqual(len(wrapped.labels), 4)
+        self.assertEqual(wrapped.labels_json, labels_js)
+        self.assertEqual(wrapped.to_json(compact=True)['labels'],
+                         labelling_tool.ImageLabels.from_json(labels_js).to_compact_json())
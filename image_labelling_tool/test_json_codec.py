@@ -0,0 +1,64 @@
+import importlib.util
+import json
+import sys
+import numpy as np
+from unittest import TestCase, skipIf
+from . import json_codec, labelling_tool
+
+
+def _stdlib_codec():
+    # Import a copy of `json_codec` that behaves as if orjson were not installed
+    orjson = sys.modules.get('orjson')
+    sys.modules['orjson'] = None
+    try:
+        spec = importlib.util.find_spec(json_codec.__name__)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        if orjson is None:
+            del sys.modules['orjson']
+        else:
+            sys.modules['orjson'] = orjson
+    return module
+
+
+class JSONCodecTestCase(TestCase):
+    def _check_codec(self, codec):
+        labels = labelling_tool.ImageLabels([
+            labelling_tool.PolygonLabel([np.array([[1.5, 2.0], [5.0, 2.0], [5.0, 7.25]])],
+                                        object_id='a', classification='cls_a'),
+            labelling_tool.PointLabel(np.array([3.0, 4.0]), object_id='b', classification='cls_b'),
+        ])
+        data = {'image_id': 'img', 'labels': labels.to_json(), 'timeElapsed': 1.5}
+        text = codec.dumps(data)
+        self.assertIsInstance(text, str)
+        self.assertEqual(json.loads(text), data)
+        self.assertEqual(codec.loads(text), data)
+        self.assertEqual(codec.loads(codec.dumps_bytes(data)), data)
+
+        # NumPy arrays and scalars, and objects with a `to_json` method are serialised directly
+        self.assertEqual(codec.loads(codec.dumps({'labels': labels})), {'labels': labels.to_json()})
+        self.assertEqual(codec.loads(codec.dumps([np.arange(3), np.float32(0.5), np.int64(7)])),
+                         [[0, 1, 2], 0.5, 7])
+        self.assertEqual(codec.loads(codec.dumps(np.arange(6.0).reshape((3, 2))[:, ::-1])),
+                         [[1.0, 0.0], [3.0, 2.0], [5.0, 4.0]])
+        with self.assertRaises(TypeError):
+            codec.dumps(object())
+
+    def test_codec(self):
+        self._check_codec(json_codec)
+
+    @skipIf(json_codec.orjson is None, 'orjson not installed; already tested the standard library fallback')
+    def test_stdlib_fallback(self):
+        codec = _stdlib_codec()
+        self.assertIsNone(codec.orjson)
+        self._check_codec(codec)
+
+    def test_regions_round_trip(self):
+        regions = [np.array([[1.5, 2.0], [5.0, 2.0], [5.0, 7.25]]), np.zeros((0, 2))]
+        regions_js = labelling_tool.PolygonLabel.regions_to_json(regions)
+        parsed = labelling_tool.PolygonLabel.regions_from_json(json_codec.loads(json_codec.dumps(regions_js)))
+        self.assertEqual(len(parsed), 2)
+        self.assertEqual(parsed[0].tolist(), regions[0].tolist())
+        self.assertTrue(parsed[0].flags.c_contiguous)
+        self.assertEqual(parsed[1].shape, (0, 2))
@@ -0,0 +1,35 @@
+import numpy as np
+from unittest import TestCase
+from . import labels_compression, labelling_tool, json_codec
+
+
+class LabelsCompressionTestCase(TestCase):
+    def test_compress_decompress(self):
+        rng = np.random.default_rng(12345)
+        labels = labelling_tool.ImageLabels([
+            labelling_tool.PolygonLabel([np.round(rng.uniform(0.0, 1000.0, size=(200, 2)), 1)], classification='a')
+            for _ in range(20)])
+        labels_text = json_codec.dumps(labels.to_json())
+
+        compressions = [labels_compression.COMPRESSION_ZLIB]
+        if labels_compression.zstandard is not None:
+            compressions.append(labels_compression.COMPRESSION_ZSTD)
+        for compression in compressions:
+            for data in [labels_text, labels_text.encode('utf-8')]:
+                compressed = labels_compression.compress(data, compression)
+                self.assertTrue(compressed.startswith(compression.encode('ascii') + b':'))
+                self.assertEqual(labels_compression.compression_of(compressed), compression)
+                self.assertLess(len(compressed) * 2, len(labels_text))
+                self.assertEqual(labels_compression.decompress(compressed), labels_text.encode('utf-8'))
+                # Database drivers may return binary fields as a memoryview
+                self.assertEqual(labels_compression.decompress(memoryview(compressed)), labels_text.encode('utf-8'))
+
+        with self.assertRaises(ValueError):
+            labels_compression.compress(labels_text, 'lzma')
+        with self.assertRaises(ValueError):
+            labels_compression.decompress(b'lzma:' + b'\x00' * 16)
+        with self.assertRaises(ValueError):
+            labels_compression.decompress(labels_text.encode('utf-8'))
+        if labels_compression.zstandard is None:
+            with self.assertRaises(ValueError):
+                labels_compression.compress(labels_text, labels_compression.COMPRESSION_ZSTD)
@@ -0,0 +1,66 @@
+import numpy as np
+from unittest import TestCase
+from . import labels_patch, labelling_tool, compact_labels
+
+
+def _make_labels_js():
+    return labelling_tool.ImageLabels([
+        labelling_tool.PointLabel(np.array([float(i), 2.0 * i]), object_id='lbl__{}'.format(i), classification='a')
+        for i in range(5)]).to_json()
+
+
+class LabelsPatchTestCase(TestCase):
+    def test_make_and_apply_patch(self):
+        old_js = _make_labels_js()
+        new_js = [dict(lab) for lab in old_js]
+        # Modify, delete and add labels
+        new_js[1]['label_class'] = 'b'
+        del new_js[3]
+        new_js.append(labelling_tool.PointLabel(np.array([9.0, 9.0]), object_id='lbl__9').to_json())
+
+        patch = labels_patch.make_patch(old_js, new_js, base_version='1:7')
+        self.assertTrue(labels_patch.is_patch(patch))
+        self.assertEqual(patch['base_version'], '1:7')
+        self.assertEqual([lab['object_id'] for lab in patch['set']], ['lbl__1', 'lbl__9'])
+        self.assertEqual(patch['delete'], ['lbl__3'])
+        self.assertEqual(labels_patch.apply_patch(old_js, patch, version='1:7'), new_js)
+        self.assertEqual(labels_patch.apply_patch(old_js, patch), new_js)
+        # The labels that the patch is applied to are not modified
+        self.assertEqual(old_js, _make_labels_js())
+
+        # No changes
+        self.assertEqual(labels_patch.make_patch(old_js, old_js, 0), {'base_version': 0, 'set': [], 'delete': []})
+        # Re-ordered labels and missing object IDs cannot be expressed as a patch
+        self.assertIsNone(labels_patch.make_patch(old_js, old_js[::-1], 0))
+        self.assertIsNone(labels_patch.make_patch(old_js, [{'label_type': 'point'}], 0))
+
+    def test_conflicts(self):
+        old_js = _make_labels_js()
+        patch = {'base_version': '1:7', 'set': [], 'delete': ['lbl__0']}
+        with self.assertRaises(labels_patch.LabelsPatchConflictError):
+            labels_patch.apply_patch(old_js, patch, version='1:8')
+        with self.assertRaises(labels_patch.LabelsPatchConflictError):
+            labels_patch.apply_patch(old_js, {'base_version': '1:7', 'delete': ['missing']})
+        with self.assertRaises(labels_patch.LabelsPatchConflictError):
+            labels_patch.apply_patch(old_js, {'base_version': '1:7', 'set': [{'label_type': 'point'}]})
+        with self.assertRaises(labels_patch.LabelsPatchConflictError):
+            labels_patch.apply_patch(old_js + old_js[:1], patch)
+        new_label = labelling_tool.PointLabel(np.array([9.0, 9.0]), object_id='lbl__9').to_json()
+        with self.assertRaises(labels_patch.LabelsPatchConflictError):
+            labels_patch.apply_patch(old_js, {'base_version': '1:7', 'set': [new_label, new_label]})
+        with self.assertRaises(TypeError):
+            labels_patch.apply_patch(old_js, old_js)
+
+    def test_replacement(self):
+        old_js = _make_labels_js()
+        new_js = old_js[::-1]
+        replacement = {'base_version': '1:7', 'labels': new_js}
+        self.assertTrue(labels_patch.is_patch(replacement))
+        self.assertTrue(labels_patch.is_replacement(replacement))
+        self.assertFalse(labels_patch.is_replacement({'base_version': '1:7', 'set': [], 'delete': []}))
+        self.assertEqual(labels_patch.apply_patch(old_js, replacement, version='1:7'), new_js)
+        with self.assertRaises(labels_patch.LabelsPatchConflictError):
+            labels_patch.apply_patch(old_js, replacement, version='1:8')
+        # Compact encoded labels are decoded
+        compact = {'base_version': '1:7', 'labels': compact_labels.encode(new_js, vertex_dtype='float64')}
+        self.assertEqual(labels_patch.apply_patch(old_js, compact), compact_labels.decode(compact['labels']))
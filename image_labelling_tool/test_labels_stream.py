@@ -0,0 +1,103 @@
+import io
+import json
+import pathlib
+import tempfile
+import numpy as np
+from unittest import TestCase
+from . import labels_stream, labelling_tool
+
+
+def _make_labels():
+    rng = np.random.default_rng(12345)
+    labels = [labelling_tool.PolygonLabel([rng.uniform(0.0, 100.0, size=(20, 2))], classification='cls_a',
+                                          anno_data={'score': 0.5, 'note': 'café ☃'})
+              for _ in range(10)]
+    labels.append(labelling_tool.GroupLabel([
+        labelling_tool.PointLabel(np.array([3.0, 4.0]), classification='cls_b'),
+        labelling_tool.BoxLabel(np.array([10.0, 20.0]), np.array([5.0, 6.0]), classification='cls_b'),
+    ], classification='cls_c'))
+    return labelling_tool.ImageLabels(labels)
+
+
+class LabelsStreamTestCase(TestCase):
+    def test_iter_labels_json(self):
+        labels = _make_labels()
+        labels_js = labels.to_json()
+        documents = [
+            labels_js,
+            {'image_filename': 'img.png', 'completed_tasks': ['finished'], 'labels': labels_js},
+            # Metadata following the labels, and awkward whitespace
+            {'labels': labels_js, 'timeElapsed': 12345.75, 'complete': True},
+        ]
+        for doc in documents:
+            for indent in [None, 3]:
+                text = json.dumps(doc, indent=indent)
+                # Small chunk sizes ensure that values are split between chunks
+                for chunk_size in [1, 7, 64, labels_stream.DEFAULT_CHUNK_SIZE]:
+                    metadata = {}
+                    streamed = list(labels_stream.iter_labels_json(io.StringIO(text), metadata=metadata,
+                                                                   chunk_size=chunk_size))
+                    self.assertEqual(streamed, labels_js)
+                    if isinstance(doc, dict):
+                        self.assertEqual(metadata, {k: v for k, v in doc.items() if k != 'labels'})
+
+                # Files opened in binary mode; the non-ASCII characters are split between chunks
+                streamed = list(labels_stream.iter_labels_json(io.BytesIO(text.encode('utf-8')), chunk_size=5))
+                self.assertEqual(streamed, labels_js)
+
+        # Compact encoded labels
+        compact = labels.to_compact_json(vertex_dtype='float64')
+        text = json.dumps({'image_filename': 'img.png', 'labels': compact})
+        self.assertEqual(list(labels_stream.iter_labels_json(io.StringIO(text), chunk_size=16)), labels_js)
+
+        self.assertEqual(list(labels_stream.iter_labels_json(io.StringIO(' [ ] '))), [])
+        self.assertEqual(list(labels_stream.iter_labels_json(io.StringIO('{"labels": []}'))), [])
+        with self.assertRaises(ValueError):
+            list(labels_stream.iter_labels_json(io.StringIO('{"image_filename": "img.png"}')))
+        with self.assertRaises(ValueError):
+            list(labels_stream.iter_labels_json(io.StringIO('[{"label_type": "point"}')))
+        with self.assertRaises(ValueError):
+            list(labels_stream.iter_labels_json(io.StringIO('[{"label_type": "point"} {}]')))
+        with self.assertRaises(TypeError):
+            list(labels_stream.iter_labels_json(io.StringIO('"labels"')))
+
+    def test_writer(self):
+        labels = _make_labels()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = pathlib.Path(tmp_dir) / 'labels.json'
+            with labels_stream.LabelsFileWriter(path, image_filename='img.png', completed_tasks=['finished'],
+                                                metadata={'timeElapsed': 5.0}) as writer:
+                # Label objects and labels in JSON form
+                writer.write_all(labels.labels[:5])
+                writer.write_all(labels.to_json()[5:])
+                self.assertEqual(writer.n_labels, len(labels))
+            with path.open('r') as f:
+                js = json.load(f)
+            self.assertEqual(js, {'timeElapsed': 5.0, 'image_filename': 'img.png', 'completed_tasks': ['finished'],
+                                  'labels': labels.to_json()})
+            metadata = {}
+            self.assertEqual(list(labels_stream.iter_labels_json(path, metadata=metadata)), labels.to_json())
+            self.assertEqual(metadata, {'timeElapsed': 5.0, 'image_filename': 'img.png',
+                                        'completed_tasks': ['finished']})
+
+        f = io.StringIO()
+        with labels_stream.LabelsFileWriter(f):
+            pass
+        self.assertEqual(json.loads(f.getvalue()), {'completed_tasks': [], 'labels': []})
+
+    def test_wrapped_image_labels_files(self):
+        labels = _make_labels()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = pathlib.Path(tmp_dir) / 'labels.json'
+            for wrapped in [labelling_tool.WrappedImageLabels(image_filename='img.png', completed_tasks=['finished'],
+                                                              metadata={'timeElapsed': 5.0}, labels=labels),
+                            labelling_tool.WrappedImageLabels(image_filename='img.png', completed_tasks=['finished'],
+                                                              metadata={'timeElapsed': 5.0},
+                                                              labels_json=labels.to_compact_json('float64'))]:
+                wrapped.write_to_file(path)
+                loaded = labelling_tool.WrappedImageLabels.from_file(path)
+                self.assertEqual(loaded.to_json(), wrapped.to_json())
+                self.assertEqual(labelling_tool.ImageLabels.from_file(str(path)).to_json(), labels.to_json())
+
+                with path.open('r') as f:
+                    self.assertEqual(labelling_tool.WrappedImageLabels.from_file(f).labels_json, labels.to_json())
@@ -0,0 +1,81 @@
+import numpy as np
+from unittest import TestCase
+from . import mask_rle
+
+
+class MaskRLETestCase(TestCase):
+    def test_encode_decode(self):
+        mask = np.array([[0, 1, 1],
+                         [0, 1, 0],
+                         [1, 1, 0],
+                         [0, 0, 0]], dtype=bool)
+        rle = mask_rle.encode(mask)
+        self.assertEqual(rle['size'], [4, 3])
+        # Column major order: 0010 1110 1000
+        self.assertEqual(rle['counts'], [2, 1, 1, 3, 1, 1, 3])
+        self.assertTrue((mask_rle.decode(rle) == mask).all())
+        self.assertEqual(mask_rle.area(rle), 5)
+
+        self.assertEqual(mask_rle.encode(np.zeros((3, 2), dtype=bool))['counts'], [6])
+        self.assertEqual(mask_rle.encode(np.ones((3, 2), dtype=bool))['counts'], [0, 6])
+
+    def test_compressed_counts(self):
+        rng = np.random.default_rng(12345)
+        for i in range(100):
+            counts = rng.integers(0, 100000, size=(rng.integers(1, 20),)).tolist()
+            self.assertEqual(mask_rle.string_to_counts(mask_rle.counts_to_string(counts)), counts)
+        # Value from COCO API
+        self.assertEqual(mask_rle.counts_to_string([2, 1, 1, 3, 1, 1, 3]), '21120N2')
+        mask = rng.uniform(size=(20, 15)) > 0.5
+        rle = mask_rle.encode(mask, compress=True)
+        self.assertIsInstance(rle['counts'], str)
+        self.assertTrue((mask_rle.decode(rle) == mask).all())
+
+    def test_windows(self):
+        rng = np.random.default_rng(12345)
+        for i in range(100):
+            height, width = rng.integers(1, 30, size=(2,))
+            mask = rng.uniform(size=(height, width)) > rng.uniform()
+            y0, y1 = sorted(rng.integers(0, height + 1, size=(2,)))
+            x0, x1 = sorted(rng.integers(0, width + 1, size=(2,)))
+            window = (y0, x0, y1, x1)
+            masked = np.zeros_like(mask)
+            masked[y0:y1, x0:x1] = mask[y0:y1, x0:x1]
+            self.assertEqual(mask_rle.encode_window(mask[y0:y1, x0:x1], window, (height, width)),
+                             mask_rle.encode(masked))
+            self.assertTrue((mask_rle.decode_window(mask_rle.encode(mask), window) == mask[y0:y1, x0:x1]).all())
+        self.assertRaises(ValueError, lambda: mask_rle.encode_window(np.zeros((2, 2)), (0, 0, 3, 3), (5, 5)))
+
+    def test_bounding_window(self):
+        rng = np.random.default_rng(12345)
+        for i in range(100):
+            height, width = rng.integers(1, 30, size=(2,))
+            mask = np.zeros((height, width), dtype=bool)
+            y0, y1 = sorted(rng.integers(0, height + 1, size=(2,)))
+            x0, x1 = sorted(rng.integers(0, width + 1, size=(2,)))
+            mask[y0:y1, x0:x1] = rng.uniform(size=(y1 - y0, x1 - x0)) > 0.3
+            rows = np.flatnonzero(mask.any(axis=1))
+            cols = np.flatnonzero(mask.any(axis=0))
+            if len(rows) > 0:
+                expected = (rows[0], cols[0], rows[-1] + 1, cols[-1] + 1)
+            else:
+                expected = (0, 0, 0, 0)
+            self.assertEqual(mask_rle.bounding_window(mask_rle.encode(mask)), expected)
+
+    def test_instance_masks(self):
+        masks = [np.zeros((10, 12), dtype=bool) for _ in range(3)]
+        masks[0][2:5, 3:9] = True
+        masks[1][7:10, 0:2] = True
+        windows = [(2, 3, 5, 9), (7, 0, 10, 2), (0, 0, 0, 0)]
+        rles = [mask_rle.encode_window(m[y0:y1, x0:x1], (y0, x0, y1, x1), (10, 12))
+                for m, (y0, x0, y1, x1) in zip(masks, windows)]
+        inst = mask_rle.RLEInstanceMasks(rles, windows, (10, 12))
+        self.assertEqual(len(inst), 3)
+        for i in range(3):
+            self.assertTrue((inst[i] == masks[i]).all())
+        crop, window = inst.crop(0)
+        self.assertEqual(window, (2, 3, 5, 9))
+        self.assertTrue(crop.all())
+        self.assertEqual(inst.areas().tolist(), [18, 6, 0])
+        self.assertTrue((inst.to_dense() == np.stack(masks, axis=2)).all())
+        self.assertEqual(len(inst[1:]), 2)
@@ -1,3 +1,4 @@
+import numpy as np
 from typing import Union
 from unittest import TestCase
 from . import labelling_tool
@@ -79,3 +80,45 @@ class ObjectTableTestCase(TestCase):
         self.assertEqual(tbl._new_style_id(123), 'pqr__123')
 
 
+
+    def test_split_object_ids(self):
+        # New style IDs are stored as an interned prefix and an integer index
+        for obj_id, expected in [('abc__12', ('abc', 12)), ('a__b__3', ('a__b', 3)), ('abc__0', ('abc', 0)),
+                                 ('abc__012', (None, 'abc__012')), ('abc__1x', (None, 'abc__1x')),
+                                 ('__12', (None, '__12')), ('abc_12', (None, 'abc_12')), (12, (None, 12)),
+                                 (None, (None, None))]:
+            self.assertEqual(labelling_tool._split_object_id(obj_id), expected)
+            self.assertEqual(labelling_tool._join_object_id(*expected), obj_id)
+
+        a = labelling_tool.PointLabel(np.array([1.0, 2.0]), object_id=''.join(['abc', '__12']))
+        b = labelling_tool.PointLabel(np.array([1.0, 2.0]), object_id=''.join(['abc', '__13']))
+        self.assertEqual(a.object_id, 'abc__12')
+        self.assertIs(a._id_prefix, b._id_prefix)
+
+        # Labels and other objects with new style IDs, old style IDs and other IDs can be registered and looked up
+        tbl = labelling_tool.ObjectTable('xyz')
+        c = labelling_tool.PointLabel(np.array([1.0, 2.0]), object_id='abc_123')
+        d = labelling_tool.PointLabel(np.array([1.0, 2.0]), object_id=5)
+        e = labelling_tool.PointLabel(np.array([1.0, 2.0]))
+        f = self.MyObject('abc__14')
+        for obj in [a, b, c, d, e, f]:
+            tbl.register(obj)
+        self.assertEqual(d.object_id, 'xyz__5')
+        self.assertEqual(e.object_id, 'xyz__6')
+        for obj in [a, b, c, d, e, f]:
+            self.assertIs(tbl[obj.object_id], obj)
+        self.assertNotIn('abc__15', tbl)
+        self.assertNotIn('abc__012', tbl)
+        self.assertRaises(ValueError, lambda: tbl.register(
+            labelling_tool.PointLabel(np.array([1.0, 2.0]), object_id='abc__12')))
+
+        # Repeated look ups and object ID accesses use cached strings, that are discarded when the ID changes
+        self.assertIs(tbl['abc__12'], a)
+        self.assertIs(tbl['abc__12'], a)
+        self.assertIs(a.object_id, a.object_id)
+        a.object_id = 'abc__16'
+        self.assertEqual(a.object_id, 'abc__16')
+        g = labelling_tool.PointLabel(np.array([1.0, 2.0]))
+        self.assertIsNone(g.object_id)
+        tbl.register(g)
+        self.assertEqual(g.object_id, 'xyz__7')
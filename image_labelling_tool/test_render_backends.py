@@ -0,0 +1,145 @@
+import math
+import unittest
+import numpy as np
+from unittest import TestCase
+from . import labelling_tool
+
+
+def _dilate(mask):
+    padded = np.pad(mask, [(1, 1), (1, 1)], mode='constant')
+    h, w = mask.shape
+    out = np.zeros_like(mask)
+    for i in range(3):
+        for j in range(3):
+            out |= padded[i:i + h, j:j + w]
+    return out
+
+
+@unittest.skipIf(labelling_tool.cv2 is None, 'OpenCV not available')
+class RenderBackendParityTestCase(TestCase):
+    """Check that the OpenCV rasteriser agrees with the PIL rasteriser. The two rasterisers round
+    edges differently, so they are allowed to disagree on pixels within 1 pixel of the PIL outline.
+    Each shape must either have an IoU of at least 0.95 or differ by at most a 1 pixel shift of its boundary:
+    no more pixels than there are in the PIL outline for filled shapes, or twice that for outlines.
+    """
+    IMAGE_SIZE = 64
+
+    def assert_parity(self, label, ctx=None):
+        for dx, dy in [(0.0, 0.0), (-3.0, 5.0)]:
+            pil_outline = label.render_mask(self.IMAGE_SIZE, self.IMAGE_SIZE, False, dx=dx, dy=dy, ctx=ctx,
+                                            backend=labelling_tool.RENDER_BACKEND_PIL) != 0
+            for fill in [True, False]:
+                msg = '{} fill={} dx={} dy={}'.format(label, fill, dx, dy)
+                pil_mask = label.render_mask(self.IMAGE_SIZE, self.IMAGE_SIZE, fill, dx=dx, dy=dy, ctx=ctx,
+                                             backend=labelling_tool.RENDER_BACKEND_PIL) != 0
+                cv_mask = label.render_mask(self.IMAGE_SIZE, self.IMAGE_SIZE, fill, dx=dx, dy=dy, ctx=ctx,
+                                            backend=labelling_tool.RENDER_BACKEND_OPENCV) != 0
+                disagree = pil_mask != cv_mask
+                self.assertFalse((disagree & ~_dilate(pil_outline)).any(), msg=msg)
+                union = (pil_mask | cv_mask).sum()
+                iou = (pil_mask & cv_mask).sum() / union if union > 0 else 1.0
+                if iou < 0.95:
+                    max_disagree = pil_outline.sum() if fill else 2 * pil_outline.sum()
+                    self.assertLessEqual(disagree.sum(), max_disagree, msg=msg)
+
+    def test_point(self):
+        rng = np.random.default_rng(1)
+        for i in range(50):
+            a = labelling_tool.PointLabel(position_xy=rng.uniform(0.0, 64.0, size=(2,)))
+            self.assert_parity(a, labelling_tool.LabelContext(point_radius=rng.uniform(2.0, 10.0)))
+
+    def test_point_radius_0(self):
+        # Points with a radius of 0 cover a single pixel, that must be the same for both rasterisers,
+        # including for points either side of the image edges and with whole and fractional offsets
+        rng = np.random.default_rng(6)
+        ctx = labelling_tool.LabelContext(point_radius=0.0)
+        for i in range(200):
+            a = labelling_tool.PointLabel(position_xy=rng.uniform(-4.0, 68.0, size=(2,)))
+            for dx, dy in [(0.0, 0.0), (-3.0, 5.0), (2.0, -1.0), (0.5, -0.25)]:
+                for c in [None, ctx]:
+                    pil_mask = a.render_mask(64, 64, True, dx=dx, dy=dy, ctx=c,
+                                             backend=labelling_tool.RENDER_BACKEND_PIL)
+                    cv_mask = a.render_mask(64, 64, True, dx=dx, dy=dy, ctx=c,
+                                            backend=labelling_tool.RENDER_BACKEND_OPENCV)
+                    self.assertTrue((pil_mask == cv_mask).all(), msg='{} dx={} dy={}'.format(a, dx, dy))
+                    self.assertLessEqual(pil_mask.sum(), 1)
+
+    def test_box(self):
+        rng = np.random.default_rng(2)
+        for i in range(50):
+            a = labelling_tool.BoxLabel(centre_xy=rng.uniform(10.0, 54.0, size=(2,)),
+                                        size_xy=rng.uniform(2.0, 40.0, size=(2,)))
+            self.assert_parity(a)
+
+    def test_polygon(self):
+        rng = np.random.default_rng(3)
+        for i in range(100):
+            a = labelling_tool.PolygonLabel(regions=[rng.uniform(0.0, 64.0, size=(rng.integers(3, 10), 2))])
+            self.assert_parity(a)
+        # Integer vertices
+        for i in range(50):
+            a = labelling_tool.PolygonLabel(
+                regions=[np.round(rng.uniform(0.0, 64.0, size=(rng.integers(3, 10), 2)))])
+            self.assert_parity(a)
+
+    def test_polygon_with_hole(self):
+        outer_rect = np.array([[10.0, 10.0], [40.0, 10.0], [40.0, 40.0], [10.0, 40.0]])
+        inner_rect = np.array([[20.0, 20.0], [30.0, 20.0], [30.0, 30.0], [20.0, 30.0]])
+        a = labelling_tool.PolygonLabel(regions=[outer_rect, inner_rect])
+        cv_mask = a.render_mask(50, 50, True, backend=labelling_tool.RENDER_BACKEND_OPENCV)
+        # Hole interior must be empty, region between outer and inner filled
+        self.assertFalse(cv_mask[22:29, 22:29].any())
+        self.assertTrue(cv_mask[12:19, 12:39].all())
+        self.assert_parity(a)
+
+    def test_oriented_ellipse(self):
+        rng = np.random.default_rng(4)
+        for i in range(50):
+            a = labelling_tool.OrientedEllipseLabel(centre_xy=rng.uniform(20.0, 44.0, size=(2,)),
+                                                    radius1=rng.uniform(3.0, 15.0), radius2=rng.uniform(3.0, 15.0),
+                                                    orientation_rad=rng.uniform(0.0, math.pi))
+            self.assert_parity(a)
+
+    def test_group(self):
+        a = labelling_tool.BoxLabel(centre_xy=np.array([15.0, 25.0]), size_xy=np.array([8.0, 12.0]))
+        b = labelling_tool.PolygonLabel(regions=[np.array([[20.0, 20.0], [30.0, 20.0], [30.0, 30.0]])])
+        ab = labelling_tool.GroupLabel(component_labels=[a, b])
+        self.assert_parity(ab)
+
+    def test_render_label_classes(self):
+        rng = np.random.default_rng(5)
+        labels = []
+        for i in range(30):
+            labels.append(labelling_tool.PolygonLabel(
+                regions=[rng.uniform(0.0, 64.0, size=(rng.integers(3, 10), 2))],
+                classification='cls_{}'.format(i % 3)))
+        image_labels = labelling_tool.ImageLabels(labels)
+        pil_img = image_labels.render_label_classes(['cls_0', 'cls_1', 'cls_2'], (64, 64),
+                                                    backend=labelling_tool.RENDER_BACKEND_PIL)
+        cv_img = image_labels.render_label_classes(['cls_0', 'cls_1', 'cls_2'], (64, 64),
+                                                   backend=labelling_tool.RENDER_BACKEND_OPENCV)
+        self.assertEqual(cv_img.shape, pil_img.shape)
+        self.assertGreater((cv_img == pil_img).mean(), 0.9)
+
+
+class RenderBackendSelectionTestCase(TestCase):
+    def test_set_render_backend(self):
+        self.assertEqual(labelling_tool.get_render_backend(), labelling_tool.RENDER_BACKEND_PIL)
+        try:
+            labelling_tool.set_render_backend(labelling_tool.RENDER_BACKEND_OPENCV)
+            self.assertEqual(labelling_tool.get_render_backend(), labelling_tool.RENDER_BACKEND_OPENCV)
+        finally:
+            labelling_tool.set_render_backend(labelling_tool.RENDER_BACKEND_PIL)
+        self.assertRaises(ValueError, lambda: labelling_tool.set_render_backend('cairo'))
+
+    def test_fallback_to_pil(self):
+        a = labelling_tool.BoxLabel(centre_xy=np.array([15.0, 25.0]), size_xy=np.array([8.0, 12.0]))
+        pil_mask = a.render_mask(50, 50, True, backend=labelling_tool.RENDER_BACKEND_PIL)
+        cv2 = labelling_tool.cv2
+        labelling_tool.cv2 = None
+        try:
+            fallback_mask = a.render_mask(50, 50, True, backend=labelling_tool.RENDER_BACKEND_OPENCV)
+        finally:
+            labelling_tool.cv2 = cv2
+        self.assertTrue((fallback_mask == pil_mask).all())
+        self.assertRaises(ValueError, lambda: a.render_mask(50, 50, True, backend='cairo'))
@@ -1,8 +1,27 @@
+import contextlib
 import datetime
-from django.test import TestCase
+import io
+import numpy as np
+from django.test import TestCase, override_settings, skipUnlessDBFeature
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from . import models
+from django.core.management import call_command
+from django.utils import timezone
+from . import models, labelling_tool, compact_labels, json_codec
+
+
+def _make_labels_json(label_classes):
+    return labelling_tool.ImageLabels([
+        labelling_tool.PointLabel(np.array([float(i), 2.0 * i]), object_id='lbl__{}'.format(i), classification=cls)
+        for i, cls in enumerate(label_classes)]).to_json()
+
+
+def _make_labels(label_classes):
+    labels = models.Labels(creation_date=datetime.date.today())
+    labels.labels_json = _make_labels_json(label_classes)
+    labels.save()
+    return labels
+
 
 # Create your tests here.
 class LabelsMetadataTestCase(TestCase):
@@ -63,3 +82,259 @@ class LabelsMetadataTestCase(TestCase):
         metadata = models.Labels.metadata_json_to_dict(dict(completed_tasks=['test_task1', 'test_task2']))
         self.assertEqual(metadata['completed_tasks'], [test_task1, test_task2])
 
+
+class LabelsConcurrencyTestCase(TestCase):
+    def setUp(self):
+        self.user1 = get_user_model().objects.create(username='test_user1')
+        self.user2 = get_user_model().objects.create(username='test_user2')
+        self.task = models.LabellingTask.objects.create(name='test_task1', human_name='Test task 1')
+        self.labels = _make_labels(['a', 'b'])
+
+    def test_save_if_unchanged(self):
+        a = models.Labels.objects.get(id=self.labels.id)
+        b = models.Labels.objects.get(id=self.labels.id)
+        a.labels_json = _make_labels_json(['a'])
+        a.save_if_unchanged()
+        # `b` was loaded before `a` was saved
+        b.labels_json = _make_labels_json(['c'])
+        with self.assertRaises(models.LabelsVersionConflictError):
+            b.save_if_unchanged()
+        stored = models.Labels.objects.get(id=self.labels.id)
+        self.assertEqual(stored.version, a.version)
+        self.assertEqual(stored.label_class_histogram, {'a': 1})
+        # `a` can be saved again, as it knows the version that it saved
+        a.labels_json = _make_labels_json(['a', 'a'])
+        a.save_if_unchanged()
+        self.assertEqual(models.Labels.objects.get(id=self.labels.id).label_class_histogram, {'a': 2})
+
+    def test_update_labels_conflict(self):
+        a = models.Labels.objects.get(id=self.labels.id)
+        b = models.Labels.objects.get(id=self.labels.id)
+        a.update_labels(_make_labels_json(['a']), [], 0.0, self.user1, save=True)
+        with self.assertRaises(models.LabelsVersionConflictError):
+            b.update_labels(_make_labels_json(['b']), [self.task], 0.0, self.user2, save=True)
+        stored = models.Labels.objects.get(id=self.labels.id)
+        self.assertEqual(stored.last_modified_by, self.user1)
+        # The completed tasks are rolled back along with the labels
+        self.assertEqual(list(stored.completed_tasks.all()), [])
+
+    def test_update_labels_with_patch(self):
+        stale_version = self.labels.version_tag
+        a = models.Labels.objects.get(id=self.labels.id)
+        patch = {'base_version': stale_version, 'set': [], 'delete': ['lbl__0']}
+        a.update_labels(None, [], 0.0, self.user1, save=True, patch_json=patch)
+        self.assertEqual(models.Labels.objects.get(id=self.labels.id).label_class_histogram, {'b': 1})
+
+        # Patches and replacements based on the earlier version are rejected
+        b = models.Labels.objects.get(id=self.labels.id)
+        for patch in [{'base_version': stale_version, 'set': [], 'delete': ['lbl__1']},
+                      {'base_version': stale_version, 'labels': []}]:
+            with self.assertRaises(models.LabelsVersionConflictError):
+                b.update_labels(None, [], 0.0, self.user2, save=True, patch_json=patch)
+        # A replacement based on the current version is applied
+        b.update_labels(None, [], 0.0, self.user2, save=True,
+                        patch_json={'base_version': b.version_tag, 'labels': []})
+        self.assertTrue(models.Labels.objects.get(id=self.labels.id).is_empty)
+
+    def test_unlocked(self):
+        other = _make_labels(['a'])
+        expired = _make_labels(['a'])
+        models.Labels.objects.filter(id=other.id).lock(self.user1, datetime.timedelta(minutes=10))
+        expired.locked_by = self.user1
+        expired.lock_expiry_datetime = timezone.now() - datetime.timedelta(seconds=1)
+        expired.save()
+        self.assertEqual(set(models.Labels.objects.unlocked().values_list('id', flat=True)),
+                         {self.labels.id, expired.id})
+
+    def test_lock_and_unlock(self):
+        expire_after = datetime.timedelta(minutes=10)
+        queryset = models.Labels.objects.filter(id=self.labels.id)
+        version = self.labels.version
+        self.assertEqual(queryset.lock(self.user1, expire_after), 1)
+        # The lock cannot be taken by another user, but can be refreshed by its owner
+        self.assertEqual(queryset.lock(self.user2, expire_after), 0)
+        self.assertEqual(models.Labels.objects.get(id=self.labels.id).locked_by, self.user1)
+        self.assertEqual(queryset.lock(self.user1, expire_after), 1)
+        # Locking does not change the labels version
+        self.assertEqual(models.Labels.objects.get(id=self.labels.id).version, version)
+
+        self.assertEqual(queryset.unlock(), 1)
+        self.assertFalse(models.Labels.objects.get(id=self.labels.id).is_locked_to(self.user2))
+        self.assertEqual(queryset.lock(self.user2, expire_after), 1)
+        self.assertEqual(models.Labels.objects.get(id=self.labels.id).locked_by, self.user2)
+
+    def test_lock_instance_preserves_labels(self):
+        # An instance loaded before the labels were saved by another request does not overwrite them when locked
+        a = models.Labels.objects.get(id=self.labels.id)
+        b = models.Labels.objects.get(id=self.labels.id)
+        b.labels_json = _make_labels_json(['c'])
+        b.save_if_unchanged()
+        a.lock(self.user1, datetime.timedelta(minutes=10), save=True)
+        stored = models.Labels.objects.get(id=self.labels.id)
+        self.assertEqual(stored.label_class_histogram, {'c': 1})
+        self.assertEqual(stored.locked_by, self.user1)
+
+
+class LabelStatsTestCase(TestCase):
+    def test_labels_json_updates_stats(self):
+        labels = _make_labels(['a', 'b', 'a', None])
+        self.assertEqual(labels.label_count, 4)
+        self.assertEqual(labels.label_class_counts, {'a': 2, 'b': 1, '': 1})
+        self.assertEqual(labels.label_class_histogram, {'a': 2, 'b': 1, None: 1})
+        self.assertEqual(labels.vertex_count, 0)
+        self.assertEqual((labels.extent_x_min, labels.extent_y_min, labels.extent_x_max, labels.extent_y_max),
+                         (0.0, 0.0, 3.0, 6.0))
+
+        # Assigning new labels updates the statistics
+        labels.labels_json = labelling_tool.ImageLabels([
+            labelling_tool.PolygonLabel([np.array([[10.0, 20.0], [30.0, 20.0], [30.0, 25.0]])], classification='c'),
+        ]).to_json()
+        labels.save()
+        stored = models.Labels.objects.get(id=labels.id)
+        self.assertEqual(stored.label_count, 1)
+        self.assertEqual(stored.label_class_counts, {'c': 1})
+        self.assertEqual(stored.vertex_count, 3)
+        self.assertEqual((stored.extent_x_min, stored.extent_y_min, stored.extent_x_max, stored.extent_y_max),
+                         (10.0, 20.0, 30.0, 25.0))
+
+        labels.labels_json = []
+        labels.save()
+        stored = models.Labels.objects.get(id=labels.id)
+        self.assertEqual(stored.label_count, 0)
+        self.assertEqual(stored.label_class_counts, {})
+        self.assertIsNone(stored.extent_x_min)
+        self.assertTrue(stored.is_empty)
+
+    def test_empty_and_totals(self):
+        a = _make_labels(['a', 'b'])
+        b = _make_labels([])
+        c = _make_labels(['a'])
+        # Labels whose statistics have not been computed are identified by their JSON
+        models.Labels.objects.filter(id=c.id).update(label_count=None, label_class_counts=None)
+        self.assertEqual(set(models.Labels.objects.empty().values_list('id', flat=True)), {b.id})
+        self.assertEqual(set(models.Labels.objects.not_empty().values_list('id', flat=True)), {a.id, c.id})
+        self.assertEqual(list(models.Labels.objects.without_label_stats().values_list('id', flat=True)), [c.id])
+        self.assertEqual(models.Labels.objects.total_label_count(), 2)
+        self.assertEqual(models.Labels.objects.extent(), (0.0, 0.0, 1.0, 2.0))
+
+    def test_backfill_label_stats(self):
+        a = _make_labels(['a', 'b'])
+        models.Labels.objects.filter(id=a.id).update(label_count=None, label_class_counts=None,
+                                                     vertex_count=None)
+        with contextlib.redirect_stdout(io.StringIO()):
+            call_command('backfill_label_stats', batch_size=1)
+        stored = models.Labels.objects.get(id=a.id)
+        self.assertEqual(stored.label_count, 2)
+        self.assertEqual(stored.label_class_counts, {'a': 1, 'b': 1})
+        self.assertEqual(stored.vertex_count, 0)
+
+
+class LabelClassQueriesTestCase(TestCase):
+    def setUp(self):
+        self.a = _make_labels(['a', 'b', 'a'])
+        self.b = _make_labels(['b', None])
+        self.c = _make_labels([])
+
+    def test_with_label_class(self):
+        self.assertEqual(list(models.Labels.objects.with_label_class('a').values_list('id', flat=True)),
+                         [self.a.id])
+        self.assertEqual(set(models.Labels.objects.with_label_class('b').values_list('id', flat=True)),
+                         {self.a.id, self.b.id})
+        self.assertEqual(list(models.Labels.objects.with_label_class(None).values_list('id', flat=True)),
+                         [self.b.id])
+        self.assertFalse(models.Labels.objects.with_label_class('c').exists())
+
+    def test_count_by_class(self):
+        self.assertEqual(models.Labels.objects.count_by_class(['a', 'b', 'c', None]),
+                         {'a': 1, 'b': 2, 'c': 0, None: 1})
+        self.assertEqual(models.Labels.objects.count_by_class([]), {})
+        # Defaults to the classes defined by the `LabelClass` model
+        schema = models.LabellingSchema.objects.create(name='test_schema')
+        group = models.LabelClassGroup.objects.create(schema=schema, group_name='Group')
+        models.LabelClass.objects.create(group=group, name='a', human_name='A')
+        self.assertEqual(models.Labels.objects.count_by_class(), {'a': 1, None: 1})
+
+    def test_label_class_histogram(self):
+        self.assertEqual(models.Labels.objects.label_class_histogram(['a', 'b', 'c', None]),
+                         {'a': 2, 'b': 2, 'c': 0, None: 1})
+        self.assertEqual(models.Labels.objects.filter(id=self.b.id).label_class_histogram(['a', 'b']),
+                         {'a': 0, 'b': 1})
+
+    @override_settings(LABELLING_TOOL_LABELS_JSON_FIELD=True)
+    def test_json_field_storage(self):
+        labels_js = _make_labels_json(['a', None])
+        labels = models.Labels(creation_date=datetime.date.today())
+        labels.labels_json = labels_js
+        labels.save()
+        self.assertEqual(labels.labels_json_str, '')
+        self.assertIsNone(labels.labels_json_compressed)
+        stored = models.Labels.objects.get(id=labels.id)
+        self.assertEqual(stored.labels_json_data, labels_js)
+        self.assertEqual(stored.labels_json, labels_js)
+        self.assertIsNone(stored.stored_labels_json_text())
+        self.assertEqual(stored.label_class_histogram, {'a': 1, None: 1})
+
+        # Compact encoded labels are stored decoded
+        stored.labels_json = compact_labels.encode(_make_labels_json(['b']), vertex_dtype='float64')
+        stored.save()
+        self.assertEqual(models.Labels.objects.get(id=labels.id).labels_json_data, _make_labels_json(['b']))
+
+    @skipUnlessDBFeature('supports_json_field_contains')
+    @override_settings(LABELLING_TOOL_LABELS_JSON_FIELD=True)
+    def test_json_field_queries_without_stats(self):
+        labels = models.Labels(creation_date=datetime.date.today())
+        labels.labels_json = _make_labels_json(['d', None])
+        labels.save()
+        models.Labels.objects.filter(id=labels.id).update(label_count=None, label_class_counts=None)
+        self.assertEqual(list(models.Labels.objects.with_label_class('d').values_list('id', flat=True)),
+                         [labels.id])
+        self.assertEqual(set(models.Labels.objects.with_label_class(None).values_list('id', flat=True)),
+                         {self.b.id, labels.id})
+        self.assertEqual(models.Labels.objects.count_by_class(['d', None]), {'d': 1, None: 2})
+
+
+class LabelsCompressionTestCase(TestCase):
+    @override_settings(LABELLING_TOOL_LABELS_COMPRESSION='zlib')
+    def test_compressed_storage(self):
+        labels_js = _make_labels_json(['a', 'b'])
+        labels = _make_labels(['a', 'b'])
+        self.assertEqual(labels.labels_json_str, '')
+        self.assertIsNotNone(labels.labels_json_compressed)
+        stored = models.Labels.objects.get(id=labels.id)
+        self.assertEqual(stored.labels_json, labels_js)
+        self.assertEqual(json_codec.loads(stored.stored_labels_json_text()), labels_js)
+        self.assertFalse(stored.is_empty)
+
+        # Empty labels are not compressed, so that they can be identified in the database
+        stored.labels_json = []
+        stored.save()
+        stored = models.Labels.objects.get(id=labels.id)
+        self.assertEqual(stored.labels_json_str, '[]')
+        self.assertIsNone(stored.labels_json_compressed)
+        self.assertTrue(stored.is_empty)
+
+    @override_settings(LABELLING_TOOL_COMPACT_LABELS=True, LABELLING_TOOL_LABELS_COMPRESSION='zlib')
+    def test_compressed_compact_storage(self):
+        labels = _make_labels(['a', 'b'])
+        stored = models.Labels.objects.get(id=labels.id)
+        self.assertTrue(compact_labels.is_compact(json_codec.loads(stored.stored_labels_json_text())))
+        labels_js = compact_labels.decode(compact_labels.encode(_make_labels_json(['a', 'b'])))
+        self.assertEqual(stored.labels_json, labels_js)
+
+    def test_recompress_labels(self):
+        labels_js = _make_labels_json(['a', 'b'])
+        labels = _make_labels(['a', 'b'])
+        version = labels.version
+        with contextlib.redirect_stdout(io.StringIO()):
+            call_command('recompress_labels', compression='zlib', batch_size=1)
+        stored = models.Labels.objects.get(id=labels.id)
+        self.assertIsNotNone(stored.labels_json_compressed)
+        self.assertEqual(stored.labels_json, labels_js)
+        # Clients holding the previous version must not patch the recompressed labels
+        self.assertEqual(stored.version, version + 1)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            call_command('recompress_labels', compression='none')
+        stored = models.Labels.objects.get(id=labels.id)
+        self.assertIsNone(stored.labels_json_compressed)
+        self.assertEqual(json_codec.loads(stored.labels_json_str), labels_js)
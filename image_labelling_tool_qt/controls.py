@@ -188,6 +188,7 @@ class QAbstractLabeller (QAbstractDLTool):
         super(QAbstractLabeller, self).__init__(server)
 
         self._dextr_fn = None
+        self._dextr_simplify_tolerance = 0.0
 
         if tasks is None:
             tasks = []
@@ -334,7 +335,8 @@ class QAbstractLabeller (QAbstractDLTool):
                 # Predict mask
                 mask = self.dextr_predict_mask(image_id, dextr_points_np)
                 # Convert to vector label
-                regions = labelling_tool.PolygonLabel.mask_image_to_regions_cv(mask, sort_decreasing_area=True)
+                regions = labelling_tool.PolygonLabel.mask_image_to_regions_cv(
+                    mask, sort_decreasing_area=True, simplify_tolerance=self._dextr_simplify_tolerance)
                 # To JSON
                 regions_js = labelling_tool.PolygonLabel.regions_to_json(regions)
             else:
@@ -396,7 +398,8 @@ class QLabellerForLabelledImages (QAbstractLabeller):
     please keep a reference to it.
     """
     def __init__(self, server, labelled_images, schema, tasks=None, colour_schemes=None,
-                 anno_controls=None, config=None, dextr_fn=None, enable_firebug=False):
+                 anno_controls=None, config=None, dextr_fn=None, dextr_simplify_tolerance=0.0,
+                 enable_firebug=False):
         """
         :param server: the `web_server.LabellerServer` instance that manages the Flask server.
         :param label_classes: grouped label classes that will be passed to the tool
@@ -406,6 +409,8 @@ class QLabellerForLabelledImages (QAbstractLabeller):
         :param anno_controls: [optional] additional annotation controls for metadata
         :param config: [optional] labelling tool configuration
         :param dextr_fn: [optional] DEXTR prediction function
+        :param dextr_simplify_tolerance: [default=0.0] tolerance in pixels used to simplify the polygons
+            generated by DEXTR; 0 to disable
         :param enable_firebug: [default=False] if True, load Firebug-lite development tools
         """
         super(QLabellerForLabelledImages, self).__init__(
@@ -413,6 +418,7 @@ class QLabellerForLabelledImages (QAbstractLabeller):
             config=config, enable_firebug=enable_firebug)
 
         self._dextr_fn = dextr_fn
+        self._dextr_simplify_tolerance = dextr_simplify_tolerance
 
         # Generate image IDs list
         image_ids = ['{}__{}'.format(self._tool_id, i) for i in range(len(labelled_images))]
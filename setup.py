@@ -43,6 +43,14 @@ qt_require = [
     'PyQt5',
 ]
 
+fast_json_require = [
+    'orjson',
+]
+
+zstd_require = [
+    'zstandard',
+]
+
 include_package_data = True
 data_files = [
     ('image_labelling_tool/templates', [
@@ -88,7 +96,7 @@ setup(
     # author_email="brittix1023 at gmail dot com",
     url="https://github.com/Britefury/django-labeller",
     license="MIT",
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks']),
     include_package_data=include_package_data,
     data_files=data_files,
     zip_safe=False,
@@ -98,5 +106,7 @@ setup(
         'django': django_require,
         'dextr': dextr_require,
         'qt5': qt_require,
+        'fast_json': fast_json_require,
+        'zstd': zstd_require,
     },
 )
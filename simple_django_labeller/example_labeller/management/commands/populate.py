@@ -41,7 +41,7 @@ class Command(BaseCommand):
                     tasks = list(lt_models.LabellingTask.objects.filter(name__in=completed_tasks).distinct())
 
                     labels_model = lt_models.Labels(
-                        labels_json_str=json.dumps(wrapped_labels.labels_json),
+                        labels_json=wrapped_labels.labels_json,
                         creation_date=datetime.date.today())
                     labels_model.save()
                     if len(tasks) > 0:
@@ -35,7 +35,9 @@ def _apply_dextr(image_path, dextr_points_np):
         im = Image.open(image_path)
 
         mask = _dextr_model.predict([im], dextr_points_np[None, :, :])[0] >= 0.5
-        regions = labelling_tool.PolygonLabel.mask_image_to_regions_cv(mask, sort_decreasing_area=True)
+        regions = labelling_tool.PolygonLabel.mask_image_to_regions_cv(
+            mask, sort_decreasing_area=True,
+            simplify_tolerance=getattr(settings, 'LABELLING_TOOL_DEXTR_SIMPLIFY_TOLERANCE', 0.0))
         regions_js = labelling_tool.PolygonLabel.regions_to_json(regions)
         return regions_js
     else:
@@ -275,9 +275,9 @@ def get_api_labels(request, image_id):
 
     response = requests.post(settings.LABELLING_TOOL_EXTERNAL_LABEL_API_URL, files=files)
     if response.ok:
-        labels = json.loads(image.labels.labels_json_str)
+        labels = image.labels.labels_json
         labels += json.loads(response.text)
-        image.labels.labels_json_str = json.dumps(labels)
+        image.labels.labels_json = labels
         image.labels.save()
 
     return HttpResponse('success', status=200)
@@ -213,9 +213,21 @@ LABELLING_TOOL_CONFIG = {
 }
 
 LABELLING_TOOL_ENABLE_LOCKING = False
+# Store labels and send them to the client using the compact encoding (see `image_labelling_tool.compact_labels`)
+LABELLING_TOOL_COMPACT_LABELS = False
+# Compression used for labels stored in compact form; None or 'zlib'
+LABELLING_TOOL_COMPACT_LABELS_COMPRESSION = None
+# Compress label JSON stored in the database; None, 'zlib' or 'zstd' (requires the zstandard package).
+# Use the `recompress_labels` management command to convert existing labels.
+LABELLING_TOOL_LABELS_COMPRESSION = None
+# Store labels in a JSON field, so that databases that support JSON queries (e.g. PostgreSQL) can search them;
+# takes precedence over the two compression settings above
+LABELLING_TOOL_LABELS_JSON_FIELD = False
 LABELLING_TOOL_DEXTR_AVAILABLE = False
 LABELLING_TOOL_DEXTR_POLLING_INTERVAL = 1000
 LABELLING_TOOL_DEXTR_WEIGHTS_PATH = None
+# Tolerance in pixels used to simplify the polygons generated by DEXTR; 0 to disable
+LABELLING_TOOL_DEXTR_SIMPLIFY_TOLERANCE = 0.0
 
 
 LABELLING_TOOL_EXTERNAL_LABEL_API = False